@@ -14,33 +14,39 @@
 
 """This file defines the core agent logic for the BigQuery agent."""
 
+import asyncio
+import datetime
 import os
+import time
 import sys, re, json
 import logging
-import google.cloud.logging
 
+from collections.abc import Callable
 from typing import Any, Dict, Optional
 from google.adk.apps.app import App
 from google.adk.agents import Agent
 from google.adk.tools.agent_tool import AgentTool
 from google.genai import types
-from dotenv import load_dotenv
-from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
-from google.adk.tools.apihub_tool.clients.secret_client import SecretManagerClient
 from google.adk.tools.base_tool import BaseTool
 
-import google.auth
-import google.auth.transport.requests
-
 from google.adk.tools.tool_context import ToolContext
 from google.adk.agents.callback_context import CallbackContext 
-from google.adk.models import LlmResponse
-
-from .prompts import root_agent_instructions, cloud_bqoauth_agent_instructions
-from .tools import app_int_cloud_bqoauth_connector
-
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models import LlmRequest, LlmResponse
+
+from .prompts import root_agent_instructions, cloud_bqoauth_agent_instructions, direct_agent_instructions
+from .tools import app_int_cloud_bqoauth_connector, is_bq_query_tool, user_scope
+from .utils.connector_results import RESULT_ENCODINGS, encode_result, get_rows, parse_result_encodings
+from .utils.history_compaction import HistoryCompactor, parse_token_budgets
+from .utils.pagination import ResultPager
+from .utils.progress import progress_enabled, publish_progress
+from .utils.query_cache import InMemoryResultBackend, QueryResultCache, redis_backend_from_url
+from .utils.query_guard import QueryCostGuard
+from .utils.rollups import DEFAULT_ROLLUP_MANIFEST_PATH, RollupRouter, load_manifest
+from .utils.schema_snapshot import DEFAULT_SNAPSHOT_PATH, SchemaSnapshotProvider, render_snapshot
+from .utils.semantic_cache import HashingEmbedder, SemanticSqlCache, SqlCall, VertexAiEmbedder
+from .utils.token_cache import CachedToken, TokenCache
 
-load_dotenv()
 
 # This flag checks for the K_SERVICE environment variable, which is set in
 # Google Cloud Run and other serverless environments. It allows the agent to
@@ -53,7 +59,10 @@ IS_RUNNING_IN_GCP = os.getenv("K_SERVICE") is not None
 # that can be easily viewed and filtered in the GCP Log Explorer.
 # Otherwise, it falls back to a basic console logger for local development.
 if IS_RUNNING_IN_GCP:
-    # Set up Google Cloud Logging
+    # Set up Google Cloud Logging. Imported here as it is slow to import and
+    # unused locally.
+    import google.cloud.logging
+
     client = google.cloud.logging.Client()
     client.setup_logging()
     logging.basicConfig(level=logging.INFO)
@@ -75,9 +84,14 @@ dynamic_auth_param_name = "dynamic_auth_config" # Name of the parameter to injec
 dynamic_auth_internal_key = "oauth2_auth_code_flow.access_token" # Internal key for the token
 
 
-LATEST_ACCESS_TOKEN: Optional[str] = None
+# Local development tokens are cached per user so concurrent sessions never
+# share a token, expiring tokens are refreshed in the background, and the tool
+# callback only pays for a dictionary lookup on the hot path.
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "1024"))
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
 
-def get_local_dev_token() -> str:
+def get_local_dev_token() -> CachedToken | None:
     """Handles authentication when running the agent locally.
 
     When an agent is deployed to a managed environment like Gemini Enterprise or
@@ -91,26 +105,41 @@ def get_local_dev_token() -> str:
     seamlessly in both local and deployed settings.
 
     Returns:
-        The access token if running locally, otherwise None.
-    """
-    # If not running in a deployed Cloud Run environment (e.g., running locally)
-    if not IS_RUNNING_IN_GCP:
-        try:
-            credentials, project = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-            request = google.auth.transport.requests.Request()
-            credentials.refresh(request)
-            token_key = credentials.token
-            logger.info("Running locally in ADK, obtained token_key: %s", token_key)
-            
-        except Exception as e:
-            logger.error(f"Could not get access token using google-auth: {e}")
-            # Fallback to trying to find the token in the state, in case it was set by other means
-            pass
-    else:
+        The access token and its expiry if running locally, otherwise None.
+    """
+    # If running in a deployed Cloud Run environment the platform owns OAuth.
+    if IS_RUNNING_IN_GCP:
         logger.info(f"Running on Agent Engine or Gemini Enterprise. OAUTH handled automatically.  Confirmed by finding environment variable K_SERVICE={os.getenv('K_SERVICE')}")
-        token_key = None
-    
-    return token_key
+        return None
+
+    # Imported on first use; `google.auth.transport.requests` pulls in `requests`.
+    import google.auth
+    import google.auth.transport.requests
+
+    try:
+        credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        request = google.auth.transport.requests.Request()
+        credentials.refresh(request)
+    except Exception as e:
+        logger.error(f"Could not get access token using google-auth: {e}")
+        return None
+    if not credentials.token:
+        logger.error("google-auth returned no access token.")
+        return None
+
+    # google-auth reports expiry as a naive UTC datetime.
+    expires_at = None
+    if credentials.expiry is not None:
+        expires_at = credentials.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+    logger.info("Running locally in ADK, obtained a token from google-auth.")
+    return CachedToken(value=credentials.token, expires_at=expires_at)
+
+
+token_cache = TokenCache(
+    fetcher=lambda _key: get_local_dev_token(),
+    max_entries=TOKEN_CACHE_MAX_ENTRIES,
+    refresh_margin_seconds=TOKEN_REFRESH_MARGIN_SECONDS,
+)
 
 
 def dynamic_token_injection(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Dict]:
@@ -119,11 +148,12 @@ def dynamic_token_injection(tool: BaseTool, args: Dict[str, Any], tool_context:
     This function is registered as a `before_tool_callback` on the agent. It
     intercepts any tool call and performs the following steps:
 
-    1.  If running locally, it calls `get_local_dev_token()` to obtain a token
-        and adds it to the session state.
-    2.  It searches the session state for a valid OAuth token. In a deployed
+    1.  It looks up the OAuth token in the session state. In a deployed
         environment, Gemini Enterprise/Agent Engine places this token in the
         state automatically.
+    2.  If running locally, it falls back to the per-user `token_cache`, which
+        obtains tokens via `get_local_dev_token()` and refreshes them in the
+        background before they expire.
     3.  If a token is found, it is packaged into a JSON structure that the
         Application Integration tool expects.
     4.  This JSON structure is then injected into the tool's arguments under
@@ -138,87 +168,615 @@ def dynamic_token_injection(tool: BaseTool, args: Dict[str, Any], tool_context:
     Returns:
         None. The function modifies the `args` dictionary in place.
     """
-    # Call function to get local dev token if agent is running via adk web (locally)
-    # token_key = None
-    # get local token key if running locally
-    
-    # check if the token is already in state
-
-    # Use global scope for the token variable
-    global LATEST_ACCESS_TOKEN
-    
-    token_state_key = auth_id
-    token_key = tool_context.state.get(token_state_key, None)
-
-    logger.info("Beginning of dynamic_token_injection callback.")
-    logger.info("Current token_key value: %s", token_key)
-    logger.info("Current tool_context.state before adding token: %s", tool_context.state.to_dict())
-    
-    logger.info("LATEST_ACCESS_TOKEN before processing: %s", LATEST_ACCESS_TOKEN)
-
-    # If not found in state, check the global variable
-
-    if token_key is None and LATEST_ACCESS_TOKEN is not None:
-        logger.info("Token not in tool_context.state, retrieving from global LATEST_ACCESS_TOKEN.")
-        token_key = LATEST_ACCESS_TOKEN
-        tool_context.state[token_state_key] = token_key
-    
-    if token_key is None and LATEST_ACCESS_TOKEN is None:
-        # calling function to get the token.  If it is local, it gets from google-auth.  
-        # if it is in GCP, it returns None so Gemini Enterprise will handle it automatically.
-        logger.info("Token not found in tool_context.state or global variable. Attempting to retrieve/generate token.")
-        token_key = get_local_dev_token()
-        tool_context.state[token_state_key] = token_key
-    
-    if token_key and LATEST_ACCESS_TOKEN is None:
-        logger.info(f"Token found/retrieved.")
-        # Update the global variable for persistence across turns (local session fix)
-        LATEST_ACCESS_TOKEN = token_key
-        # setting access_token variable for later use
-        logger.info("Current tool_context.state after adding token: %s", tool_context.state.to_dict())
-                
-    # pattern = re.compile(r'^temp:'+auth_id+'.*')
-    # logger.info("Checking for pattern using regex: %s", pattern.pattern)
-
-    state_dict = tool_context.state.to_dict()
-    logger.info("Current tool context state keys: %s", state_dict)
-    # matched_auth = {key: value for key, value in state_dict.items() if pattern.match(key)}
-    # if len(matched_auth) > 0:
-    #     token_key_name = list(matched_auth.keys())[0]
-    #     # setting access_token variable for later use
-    # else:
-    #     logger.warning("No valid tokens found")
-    #     return None
-    
-    access_token = tool_context.state[token_state_key]
-    logger.info("Final access_token value: %s", access_token)
+    if not is_bq_query_tool(tool):
+        return None
+
+    access_token = tool_context.state.get(auth_id, None)
+
+    if access_token is None and not IS_RUNNING_IN_GCP:
+        # Only the first call per user blocks on google-auth; afterwards this
+        # is a cache hit and refreshes happen off the request path.
+        access_token = token_cache.get_or_fetch(user_scope(tool_context))
+
+    if access_token is None:
+        logger.warning("No access token available for tool %s.", tool.name)
+
     dynamic_auth_config = {dynamic_auth_internal_key: access_token}
     args[dynamic_auth_param_name] = json.dumps(dynamic_auth_config)
-    logger.info("Injected dynamic_auth_config into args.")
+    logger.debug("Injected dynamic_auth_config into args.")
+    return None
+
+
+# Repeat questions produce identical SQL, so results from the BigQuery connector
+# are cached per user. Set QUERY_CACHE_REDIS_URL to share the cache between
+# workers; otherwise each worker keeps its own bounded in-memory cache.
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL")
+
+query_cache = QueryResultCache(
+    backend=(
+        redis_backend_from_url(QUERY_CACHE_REDIS_URL)
+        if QUERY_CACHE_REDIS_URL
+        else InMemoryResultBackend(max_entries=QUERY_CACHE_MAX_ENTRIES)
+    ),
+    ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+    ignored_args=(dynamic_auth_param_name,),
+)
+
+
+def _query_cache_key(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> str | None:
+    """Returns the result cache key for a BigQuery tool call, if cacheable."""
+    if not QUERY_CACHE_ENABLED or not is_bq_query_tool(tool):
+        return None
+    sql = args.get("query")
+    if not isinstance(sql, str):
+        return None
+    return query_cache.make_key(sql, user_scope(tool_context), args)
+
+
+def query_cache_lookup(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> dict | None:
+    """Serves a BigQuery tool call from the result cache.
+
+    Registered as a `before_tool_callback`. Returning the cached response skips
+    the connector round trip entirely.
+
+    Args:
+        tool: The tool being called.
+        args: The arguments for the tool.
+        tool_context: The context for the tool call, including session state.
+
+    Returns:
+        The cached tool response on a hit, otherwise None.
+    """
+    key = _query_cache_key(tool, args, tool_context)
+    if key is None:
+        return None
+    cached = query_cache.lookup(key)
+    if cached is not None:
+        logger.info("Query result cache hit (hit rate %.2f).", query_cache.stats.hit_rate)
+    return cached
+
+
+def query_cache_store(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: dict) -> dict | None:
+    """Stores successful BigQuery tool responses in the result cache.
+
+    Runs as the first stage of `process_query_result`.
+
+    Returns:
+        None. The tool response is passed through unchanged.
+    """
+    key = _query_cache_key(tool, args, tool_context)
+    if key is not None and isinstance(tool_response, dict) and "error" not in tool_response:
+        query_cache.store(key, tool_response)
+    return None
+
+
+# The connector round trip is timed on cache misses and its duration written to
+# session state, so it travels with the tool response event and clients such as
+# the load test can separate connector time from model time.
+CONNECTOR_STARTED_KEY = "temp:connector_started_at"
+CONNECTOR_LATENCY_KEY = "connector_latency_ms"
+
+
+def _connector_started_key(tool_context: ToolContext) -> str:
+    """State key of the call's start time; parallel calls each get their own."""
+    return f"{CONNECTOR_STARTED_KEY}:{tool_context.function_call_id}"
+
+
+def mark_connector_start(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> None:
+    """Records when a BigQuery tool call leaves for the connector.
+
+    Registered last in `before_tool_callback`, so it only runs when no earlier
+    callback served the call.
+    """
+    if is_bq_query_tool(tool):
+        tool_context.state[_connector_started_key(tool_context)] = time.monotonic()
+    return None
+
+
+def record_connector_latency(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: dict) -> dict | None:
+    """Writes the connector round trip started by `mark_connector_start` to state.
+
+    Runs as a stage of `process_query_result`.
+
+    Returns:
+        None. The tool response is passed through unchanged.
+    """
+    started_key = _connector_started_key(tool_context)
+    started_at = tool_context.state.get(started_key)
+    if started_at is not None:
+        tool_context.state[CONNECTOR_LATENCY_KEY] = round((time.monotonic() - started_at) * 1000, 1)
+        tool_context.state[started_key] = None
+    return None
+
+
+# Query results handed to the model are bounded in rows and bytes. Larger
+# results are delivered a page at a time through the `fetch_query_page` tool.
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "50"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", "16384"))
+RESULT_PAGE_TTL_SECONDS = float(os.getenv("RESULT_PAGE_TTL_SECONDS", "900"))
+RESULT_PAGE_MAX_RESULTS = int(os.getenv("RESULT_PAGE_MAX_RESULTS", "64"))
+
+result_pager = ResultPager(
+    max_rows=RESULT_MAX_ROWS,
+    max_bytes=RESULT_MAX_BYTES,
+    ttl_seconds=RESULT_PAGE_TTL_SECONDS,
+    max_results=RESULT_PAGE_MAX_RESULTS,
+)
+
+# Pages are then re-encoded to save tokens: `columnar` lists the column names
+# and types once and each row as a list of typed values, `csv` sends the values
+# as CSV text and `json` keeps the connector's row objects. RESULT_ENCODINGS
+# overrides RESULT_ENCODING per agent.
+RESULT_ENCODING = os.getenv("RESULT_ENCODING", "columnar").lower()
+RESULT_ENCODING_BY_AGENT = parse_result_encodings(os.getenv("RESULT_ENCODINGS", ""))
+if RESULT_ENCODING not in RESULT_ENCODINGS:
+    raise ValueError(f"Unknown RESULT_ENCODING {RESULT_ENCODING!r}; expected one of {RESULT_ENCODINGS}")
+
+
+def encode_for_agent(response: dict, agent_name: str) -> dict:
+    """Returns `response` with its rows in the encoding of `agent_name`."""
+    encoding = RESULT_ENCODING_BY_AGENT.get(agent_name, RESULT_ENCODING)
+    return encode_result(response, encoding) or response
+
+
+def fetch_query_page(continuation_token: str, tool_context: ToolContext) -> dict:
+    """Fetches the next page of rows of a previous BigQuery query result.
+
+    Use this only when a query response contains a `pagination` object with a
+    non-null `continuation_token` and the rows already returned are not enough
+    to answer the question.
+
+    Args:
+        continuation_token: The `pagination.continuation_token` value from the
+            previous query response or page.
+
+    Returns:
+        The next page of rows together with updated `pagination` details.
+    """
+    page = result_pager.fetch_page(continuation_token, user_scope(tool_context))
+    return encode_for_agent(page, tool_context.agent_name)
+
+
+# A precomputed snapshot of the table schema and column statistics (written by
+# `make schema-snapshot`) is rendered into the SQL-writing agent's instructions
+# so that the first generated query usually uses the right columns. The file is
+# re-read when it changes, so a refreshed snapshot needs no restart.
+SCHEMA_SNAPSHOT_PATH = os.getenv("SCHEMA_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+SCHEMA_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SCHEMA_SNAPSHOT_MAX_AGE_HOURS", "168"))
+
+schema_snapshots = SchemaSnapshotProvider(
+    SCHEMA_SNAPSHOT_PATH, max_age_seconds=SCHEMA_SNAPSHOT_MAX_AGE_HOURS * 3600
+)
+
+
+def with_schema_snapshot(instructions: str) -> Callable[[ReadonlyContext], str]:
+    """Returns an instruction provider that appends the current schema snapshot."""
+
+    def provider(context: ReadonlyContext) -> str:
+        snapshot = schema_snapshots.get()
+        if snapshot is None:
+            return instructions
+        return f"{instructions}\n{render_snapshot(snapshot)}\n"
+
+    return provider
+
+
+# Aggregate questions are answered from pre-aggregated rollups of the table
+# (built by `make rollups`) when the result is provably the same: the SQL is
+# rewritten to read the smallest rollup that answers it before it runs. The
+# route chosen and the estimated bytes saved are logged and written to state.
+ROLLUP_ROUTING_ENABLED = os.getenv("ROLLUP_ROUTING_ENABLED", "true").lower() == "true"
+ROLLUP_MANIFEST_PATH = os.getenv("ROLLUP_MANIFEST_PATH", DEFAULT_ROLLUP_MANIFEST_PATH)
+QUERY_ROUTE_KEY = "query_route"
+
+rollup_router = RollupRouter(load_manifest(ROLLUP_MANIFEST_PATH), snapshot_provider=schema_snapshots.get)
+
+
+def route_to_rollup(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> dict | None:
+    """Rewrites a BigQuery query to read a rollup where one answers it.
+
+    Registered first in `before_tool_callback`, so the cost guard estimates and
+    the caches key on the SQL that actually runs.
+
+    Returns:
+        None. A rewritten query replaces `args["query"]` in place.
+    """
+    if not ROLLUP_ROUTING_ENABLED or not is_bq_query_tool(tool):
+        return None
+    sql = args.get("query")
+    if not isinstance(sql, str):
+        return None
+    decision = rollup_router.route(sql)
+    tool_context.state[QUERY_ROUTE_KEY] = decision.report()
+    if decision.rollup is None:
+        logger.debug("Query runs on the base table: %s.", decision.reason)
+        return None
+    args["query"] = decision.sql
+    logger.info("Routed a query to rollup %s, saving an estimated %s bytes.", decision.rollup, decision.estimated_bytes_saved)
     return None
 
 
-# This agent is a sub-agent responsible for interacting with the BigQuery
-# Application Integration connector. It uses the `dynamic_token_injection`
-# callback to handle authentication for its tool calls.
-cloud_bqoauth_agent = Agent(
-    model="gemini-2.5-flash",
-    name="cloud_bqoauth_agent",
-    instruction=cloud_bqoauth_agent_instructions,
-    tools=[app_int_cloud_bqoauth_connector],
-    generate_content_config=types.GenerateContentConfig(temperature=0.01),
-    before_tool_callback=dynamic_token_injection,
+# Generated SQL is checked before it runs. The bytes a query would scan are
+# estimated from the schema snapshot; queries over QUERY_MAX_BYTES_SCANNED, or
+# scanning more than QUERY_PARTITION_FILTER_BYTES of a partitioned table without
+# filtering on the partition column, are answered with a hint instead of being
+# run. Queries without a LIMIT get QUERY_DEFAULT_LIMIT, and their results carry a
+# `cost_guard` report so the model knows the rows may be truncated.
+QUERY_GUARD_ENABLED = os.getenv("QUERY_GUARD_ENABLED", "true").lower() == "true"
+QUERY_MAX_BYTES_SCANNED = int(os.getenv("QUERY_MAX_BYTES_SCANNED", str(10 * 1024**3)))
+QUERY_PARTITION_FILTER_BYTES = int(os.getenv("QUERY_PARTITION_FILTER_BYTES", str(4 * 1024**3)))
+QUERY_DEFAULT_LIMIT = int(os.getenv("QUERY_DEFAULT_LIMIT", "1000"))
+QUERY_GUARD_REPORT_KEY = "temp:cost_guard"
+
+query_cost_guard = QueryCostGuard(
+    schema_snapshots.get,
+    max_bytes=QUERY_MAX_BYTES_SCANNED,
+    partition_filter_bytes=QUERY_PARTITION_FILTER_BYTES,
+    default_limit=QUERY_DEFAULT_LIMIT,
 )
 
-# This is the main agent that the user interacts with. It doesn't have any
-# direct tools but instead delegates tasks to its sub-agents. In this case, it
-# delegates BigQuery-related questions to the `cloud_bqoauth_agent`.
-root_agent = Agent(
-    model="gemini-2.5-flash",
-    name="RootAgent",
-    instruction=root_agent_instructions,
-    tools=[AgentTool(agent=cloud_bqoauth_agent)],
-    generate_content_config=types.GenerateContentConfig(temperature=0.01),
+
+def _guard_report_key(tool_context: ToolContext) -> str:
+    """State key of the call's cost guard report; parallel calls each get their own."""
+    return f"{QUERY_GUARD_REPORT_KEY}:{tool_context.function_call_id}"
+
+
+def check_query_cost(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> dict | None:
+    """Rejects expensive queries and adds a LIMIT where there is none.
+
+    Registered in `before_tool_callback` ahead of the caches, so the result
+    cache and the semantic cache see the SQL that actually runs.
+
+    Args:
+        tool: The tool being called.
+        args: The arguments for the tool.
+        tool_context: The context for the tool call, including session state.
+
+    Returns:
+        An error response with a `cost_guard` hint if the query is rejected,
+        otherwise None. A rewritten query replaces `args["query"]` in place and
+        `process_query_result` attaches the rewrites to its response.
+    """
+    if not QUERY_GUARD_ENABLED or not is_bq_query_tool(tool):
+        return None
+    sql = args.get("query")
+    if not isinstance(sql, str):
+        return None
+    decision = query_cost_guard.check(sql)
+    if not decision.allowed:
+        logger.info("Cost guard rejected a query estimated at %s bytes.", decision.estimated_bytes)
+        return decision.rejection
+    if decision.rewrites:
+        args["query"] = decision.sql
+        tool_context.state[_guard_report_key(tool_context)] = decision.report()
+        logger.info("Cost guard rewrote a query: %s.", ", ".join(decision.rewrites))
+    return None
+
+
+# Recurring questions skip SQL generation: before the model writes SQL for a
+# self-contained question, the semantic cache is checked for a previously
+# validated query for a similar question and, on a hit, that tool call is
+# replayed directly. Entries are tied to the schema version, which defaults to
+# the version of the schema snapshot and can be pinned with
+# CITIBIKE_SCHEMA_VERSION.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "vertex").lower()
+CITIBIKE_SCHEMA_VERSION = os.getenv("CITIBIKE_SCHEMA_VERSION", "")
+SQL_GENERATION_STARTED_KEY = "temp:sql_generation_started_at"
+VALIDATED_SQL_CALLS_KEY = "temp:validated_sql_calls"
+
+semantic_sql_cache = SemanticSqlCache(
+    embedder=HashingEmbedder() if SEMANTIC_CACHE_EMBEDDER == "hashing" else VertexAiEmbedder(),
+    threshold=SEMANTIC_CACHE_THRESHOLD,
 )
 
+
+def current_schema_version() -> str:
+    """Returns the schema version that cached SQL is validated against."""
+    if CITIBIKE_SCHEMA_VERSION:
+        return CITIBIKE_SCHEMA_VERSION
+    snapshot = schema_snapshots.get()
+    return snapshot.version if snapshot is not None else ""
+
+
+def _standalone_question(llm_request: LlmRequest) -> str | None:
+    """Returns the question if the request is the first model call for it.
+
+    Only requests without prior conversation qualify, so that follow-ups whose
+    meaning depends on earlier turns are never answered from the cache.
+    """
+    if len(llm_request.contents) != 1 or llm_request.contents[0].role != "user":
+        return None
+    text = "".join(part.text or "" for part in llm_request.contents[0].parts or [])
+    return text.strip() or None
+
+
+async def semantic_sql_lookup(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+    """Replays validated SQL for questions similar to ones answered before.
+
+    Registered as a `before_model_callback` on the agent that writes SQL.
+
+    Returns:
+        A model response making the cached tool calls on a hit, otherwise None.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    question = _standalone_question(llm_request)
+    if question is None:
+        return None
+    callback_context.state[SQL_GENERATION_STARTED_KEY] = time.monotonic()
+    match = await asyncio.to_thread(semantic_sql_cache.lookup, question, current_schema_version())
+    if match is None:
+        return None
+    # The model is skipped, so record_sql_generation_latency never sees this request.
+    callback_context.state[SQL_GENERATION_STARTED_KEY] = None
+    stats = semantic_sql_cache.stats
+    logger.info(
+        "Semantic SQL cache hit (similarity %.3f, hit rate %.2f, %.1fs saved so far).",
+        match.similarity, stats.hit_rate, stats.latency_saved_s,
+    )
+    return LlmResponse(
+        content=types.Content(
+            role="model",
+            parts=[
+                types.Part(function_call=types.FunctionCall(name=call.tool_name, args=call.args))
+                for call in match.calls
+            ],
+        )
+    )
+
+
+def record_sql_generation_latency(callback_context: CallbackContext, llm_response: LlmResponse) -> LlmResponse | None:
+    """Measures how long the model took to produce SQL on a cache miss.
+
+    Registered as an `after_model_callback`; the average is what each semantic
+    cache hit is counted as saving.
+    """
+    started_at = callback_context.state.get(SQL_GENERATION_STARTED_KEY)
+    if started_at is None or llm_response.content is None:
+        return None
+    if any(part.function_call for part in llm_response.content.parts or []):
+        semantic_sql_cache.record_generation_latency(time.monotonic() - started_at)
+        callback_context.state[SQL_GENERATION_STARTED_KEY] = None
+    return None
+
+
+def remember_validated_sql(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: dict) -> None:
+    """Stores the SQL of the turn's successful queries against the question they answered.
+
+    Answers may need several queries, so each successful call is added to the
+    turn's set and the whole set is stored again; the entry left behind holds
+    every query of the turn.
+    """
+    if not SEMANTIC_CACHE_ENABLED or not isinstance(tool_response, dict) or "error" in tool_response:
+        return
+    if sum(1 for event in tool_context.session.events if event.author == "user") != 1:
+        return
+    user_content = tool_context.user_content
+    question = "".join(part.text or "" for part in (user_content.parts or [])).strip() if user_content else ""
+    if not question:
+        return
+    replay_args = {name: value for name, value in args.items() if name != dynamic_auth_param_name}
+    calls = [*(tool_context.state.get(VALIDATED_SQL_CALLS_KEY) or []), {"tool_name": tool.name, "args": replay_args}]
+    tool_context.state[VALIDATED_SQL_CALLS_KEY] = calls
+    semantic_sql_cache.store(question, [SqlCall(**call) for call in calls], current_schema_version())
+
+
+def process_query_result(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: dict) -> dict | None:
+    """Post-processes BigQuery tool responses before they reach the model.
+
+    Registered last in `after_tool_callback`. ADK stops at the first after-tool
+    callback that returns a value, so the result stages are chained here: the
+    connector latency is recorded, the full result is cached, its SQL is remembered for the question it answered,
+    any cost guard rewrite is reported, and the result is then bounded to a single page and encoded for the agent.
+
+    Args:
+        tool: The tool that was called.
+        args: The arguments the tool was called with.
+        tool_context: The context for the tool call, including session state.
+        tool_response: The response returned by the tool.
+
+    Returns:
+        The response to hand to the model, or None to keep it unchanged.
+    """
+    if not is_bq_query_tool(tool):
+        return None
+    record_connector_latency(tool, args, tool_context, tool_response)
+    query_cache_store(tool, args, tool_context, tool_response)
+    remember_validated_sql(tool, args, tool_context, tool_response)
+    response = tool_response
+    report_key = _guard_report_key(tool_context)
+    guard_report = tool_context.state.get(report_key)
+    if guard_report:
+        tool_context.state[report_key] = None
+        if "error" not in tool_response:
+            response = {**tool_response, "cost_guard": guard_report}
+    page = result_pager.paginate(response, user_scope(tool_context))
+    encoded = encode_for_agent(page or response, tool_context.agent_name)
+    return encoded if encoded is not tool_response else None
+
+
+# Every model call resends the whole conversation. Once it exceeds the agent's
+# token budget, the oldest turns are compacted: query results are replaced by
+# their row count, columns and SQL, and rendered tables are cut to a few rows.
+# The most recent turns are always sent verbatim. The tokens saved are logged
+# and written to session state with the model response.
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() == "true"
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_TOKEN_BUDGETS = parse_token_budgets(os.getenv("HISTORY_TOKEN_BUDGETS", ""))
+HISTORY_KEEP_RECENT_TURNS = int(os.getenv("HISTORY_KEEP_RECENT_TURNS", "2"))
+HISTORY_TOKENS_SAVED_KEY = "history_tokens_saved"
+
+history_compactor = HistoryCompactor(keep_recent_turns=HISTORY_KEEP_RECENT_TURNS)
+
+
+def compact_history(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+    """Keeps the conversation sent to the model within the agent's token budget.
+
+    Registered first in the `before_model_callback` of every agent.
+
+    Returns:
+        None. The request contents are replaced in place.
+    """
+    if not HISTORY_COMPACTION_ENABLED:
+        return None
+    agent_name = callback_context.agent_name
+    budget = HISTORY_TOKEN_BUDGETS.get(agent_name, HISTORY_TOKEN_BUDGET)
+    llm_request.contents, report = history_compactor.compact(llm_request.contents, budget)
+    if report.tokens_saved:
+        callback_context.state[HISTORY_TOKENS_SAVED_KEY] = report.tokens_saved
+        logger.info(
+            "Compacted %s history from %d to %d tokens (%d results, %d tables).",
+            agent_name, report.tokens_before, report.tokens_after,
+            report.compacted_results, report.compacted_tables,
+        )
+    return None
+
+
+# The SQL agent runs inside an `AgentTool`, whose events only reach the root
+# agent once it has finished. While a streamed query is in progress, its
+# callbacks publish what it is doing instead: the SQL about to run, how the
+# query went and the text of its answer. `AgentEngineApp.async_stream_query`
+# interleaves these notices with the root agent's events as partial events.
+PROGRESS_STREAMING_ENABLED = os.getenv("PROGRESS_STREAMING_ENABLED", "true").lower() == "true"
+PROGRESS_MAX_ERROR_CHARS = 300
+
+
+def announce_query(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> dict | None:
+    """Publishes the SQL of a BigQuery tool call before it runs.
+
+    Registered in `before_tool_callback` after the rollup router and the cost
+    guard, so the notice shows the SQL that actually runs.
+
+    Returns:
+        None. The tool call is not changed.
+    """
+    if not PROGRESS_STREAMING_ENABLED or not progress_enabled() or not is_bq_query_tool(tool):
+        return None
+    sql = args.get("query")
+    if not isinstance(sql, str):
+        return None
+    route = tool_context.state.get(QUERY_ROUTE_KEY) or {}
+    source = f" (from rollup `{route['rollup']}`)" if route.get("rollup") else ""
+    publish_progress(tool_context.agent_name, f"Running query{source}:\n```sql\n{sql.strip()}\n```\n", "sql", tool_context.invocation_id)
+    return None
+
+
+def report_query_progress(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: dict) -> dict | None:
+    """Publishes how a BigQuery tool call went: rows and time, cache hit or error.
+
+    Registered as an `after_tool_callback` ahead of `process_query_result`, so
+    it also reports calls answered by the cost guard or the result cache.
+
+    Returns:
+        None. The tool response is passed through unchanged.
+    """
+    if not PROGRESS_STREAMING_ENABLED or not progress_enabled() or not is_bq_query_tool(tool):
+        return None
+    if isinstance(tool_response, dict) and "error" in tool_response:
+        error = str(tool_response["error"])[:PROGRESS_MAX_ERROR_CHARS]
+        text = error if error.startswith("Query not run") else f"The query failed: {error}"
+    else:
+        rows = get_rows(tool_response)
+        count = f"{len(rows)} row{'s' if len(rows) != 1 else ''}" if rows is not None else "its result"
+        started_at = tool_context.state.get(_connector_started_key(tool_context))
+        if started_at is None:
+            text = f"Served {count} from the result cache."
+        else:
+            text = f"Query returned {count} in {time.monotonic() - started_at:.1f}s."
+    publish_progress(tool_context.agent_name, text + "\n", "result", tool_context.invocation_id)
+    return None
+
+
+def stream_model_text(callback_context: CallbackContext, llm_response: LlmResponse) -> LlmResponse | None:
+    """Publishes the text of each model response, e.g. the summary of a result.
+
+    Registered as an `after_model_callback` of the SQL agent.
+
+    Returns:
+        None. The model response is passed through unchanged.
+    """
+    if not PROGRESS_STREAMING_ENABLED or not progress_enabled() or llm_response.partial or llm_response.content is None:
+        return None
+    text = "".join(part.text for part in llm_response.content.parts or [] if part.text and not part.thought)
+    publish_progress(callback_context.agent_name, text, "text", callback_context.invocation_id)
+    return None
+
+
+# The agent topology is selected with AGENT_TOPOLOGY:
+#   nested - the root agent delegates to `cloud_bqoauth_agent` through an
+#            `AgentTool`. Every question costs a root generation and a
+#            sub-agent generation before any SQL runs.
+#   direct - a single agent calls the connector itself, removing one
+#            sequential LLM round trip per question.
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.5-flash")
+AGENT_TOPOLOGY = os.getenv("AGENT_TOPOLOGY", "nested").lower()
+AGENT_TOPOLOGIES = ("nested", "direct")
+
+
+def build_cloud_bqoauth_agent(model: Any = AGENT_MODEL) -> Agent:
+    """Builds the agent that runs SQL through the BigQuery connector.
+
+    It uses the `dynamic_token_injection` callback to handle authentication for
+    its tool calls and serves repeated queries from the `query_cache`. As its
+    events never reach the stream directly, it publishes its progress instead.
+    """
+    return Agent(
+        model=model,
+        name="cloud_bqoauth_agent",
+        instruction=with_schema_snapshot(cloud_bqoauth_agent_instructions),
+        tools=[app_int_cloud_bqoauth_connector, fetch_query_page],
+        generate_content_config=types.GenerateContentConfig(temperature=0.01),
+        before_model_callback=[compact_history, semantic_sql_lookup],
+        after_model_callback=[record_sql_generation_latency, stream_model_text],
+        before_tool_callback=[route_to_rollup, check_query_cost, announce_query, query_cache_lookup, dynamic_token_injection, mark_connector_start],
+        after_tool_callback=[report_query_progress, process_query_result],
+    )
+
+
+def build_root_agent(topology: str = AGENT_TOPOLOGY, model: Any = AGENT_MODEL) -> Agent:
+    """Builds the agent that the user interacts with.
+
+    Args:
+        topology: One of `AGENT_TOPOLOGIES`.
+        model: The model name or `BaseLlm` instance used by every agent.
+
+    Returns:
+        The root agent for the requested topology.
+    """
+    if topology == "nested":
+        # The root agent has no direct tools of its own and delegates
+        # BigQuery-related questions to the `cloud_bqoauth_agent`.
+        return Agent(
+            model=model,
+            name="RootAgent",
+            instruction=root_agent_instructions,
+            tools=[AgentTool(agent=build_cloud_bqoauth_agent(model))],
+            generate_content_config=types.GenerateContentConfig(temperature=0.01),
+            before_model_callback=compact_history,
+        )
+    if topology == "direct":
+        # The root agent owns the connector and its callbacks, so the SQL is
+        # generated and presented in the same conversation.
+        return Agent(
+            model=model,
+            name="RootAgent",
+            instruction=with_schema_snapshot(direct_agent_instructions),
+            tools=[app_int_cloud_bqoauth_connector, fetch_query_page],
+            generate_content_config=types.GenerateContentConfig(temperature=0.01),
+            before_model_callback=[compact_history, semantic_sql_lookup],
+            after_model_callback=record_sql_generation_latency,
+            before_tool_callback=[route_to_rollup, check_query_cost, query_cache_lookup, dynamic_token_injection, mark_connector_start],
+            after_tool_callback=process_query_result,
+        )
+    raise ValueError(f"Unknown AGENT_TOPOLOGY {topology!r}; expected one of {AGENT_TOPOLOGIES}")
+
+
+root_agent = build_root_agent()
+logger.info("Using %s agent topology.", AGENT_TOPOLOGY)
+
 app = App(root_agent=root_agent, name="app")
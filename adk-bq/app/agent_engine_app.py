@@ -13,8 +13,10 @@
 # limitations under the License.
 
 # mypy: disable-error-code="attr-defined,arg-type"
+import atexit
 import logging
 import os
+from collections.abc import AsyncIterator
 from typing import Any
 
 import click
@@ -23,17 +25,46 @@ import vertexai
 from google.adk.artifacts import GcsArtifactService
 from google.cloud import logging as google_cloud_logging
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider, export
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider, export
 from vertexai._genai.types import AgentEngine, AgentEngineConfig
 from vertexai.agent_engines.templates.adk import AdkApp
 
-from app.agent import root_agent
+from app.agent import (
+    PROGRESS_STREAMING_ENABLED,
+    SCHEMA_SNAPSHOT_MAX_AGE_HOURS,
+    SCHEMA_SNAPSHOT_PATH,
+    root_agent,
+)
+from app.tools import (
+    CONNECTOR_SPEC_MAX_AGE_HOURS,
+    app_int_cloud_bqoauth_connector,
+    connector_settings,
+)
+from app.utils.connector_spec import (
+    DEFAULT_CONNECTOR_SPEC_PATH,
+    capture_connector_spec,
+    load_connector_spec,
+    save_connector_spec,
+)
 from app.utils.deployment import (
+    deployment_hashes,
     parse_env_vars,
+    plan_deployment,
     print_deployment_success,
+    read_deployment_metadata,
     write_deployment_metadata,
 )
+from app.utils.feedback import CloudLoggingFeedbackSink, FeedbackWriter
 from app.utils.gcs import create_bucket_if_not_exists
+from app.utils.progress import stream_with_progress
+from app.utils.sampling import SamplingPolicy, TailSamplingSpanProcessor
+from app.utils.schema_snapshot import (
+    DEFAULT_TABLE,
+    capture_snapshot,
+    load_snapshot,
+    save_snapshot,
+)
+from app.utils.session_store import session_service_builder
 from app.utils.tracing import CloudTraceLoggingSpanExporter
 from app.utils.typing import Feedback
 
@@ -44,22 +75,74 @@ class AgentEngineApp(AdkApp):
         import logging
 
         super().set_up()
+        # Fetch the connector spec while the server starts rather than on the
+        # first question.
+        app_int_cloud_bqoauth_connector.prefetch()
         logging.basicConfig(level=logging.INFO)
         logging_client = google_cloud_logging.Client()
         self.logger = logging_client.logger(__name__)
-        provider = TracerProvider()
-        processor = export.BatchSpanProcessor(
+        # Feedback is written to Cloud Logging in batches off the request path.
+        self.feedback_writer = FeedbackWriter.from_env(
+            CloudLoggingFeedbackSink(self.logger)
+        )
+        atexit.register(self.feedback_writer.shutdown)
+        sampling_policy = SamplingPolicy.from_env()
+        provider = TracerProvider(sampler=sampling_policy.sampler())
+        processor: SpanProcessor = export.BatchSpanProcessor(
             CloudTraceLoggingSpanExporter(
-                project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
+                project_id=os.environ.get("GOOGLE_CLOUD_PROJECT"),
+                large_attribute_sample_ratio=sampling_policy.large_attribute_ratio,
             )
         )
+        self.tail_sampler: TailSamplingSpanProcessor | None = None
+        if sampling_policy.tail_sampling:
+            self.tail_sampler = TailSamplingSpanProcessor(processor, sampling_policy)
+            processor = self.tail_sampler
         provider.add_span_processor(processor)
         trace.set_tracer_provider(provider)
 
+    async def async_stream_query(
+        self,
+        *,
+        message: str | dict[str, Any],
+        user_id: str,
+        session_id: str | None = None,
+        run_config: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Stream the query's events with the progress of agents run as tools.
+
+        Without this, nothing is streamed while the SQL agent works, as its
+        events only reach the root agent when it has finished. The signature
+        mirrors `AdkApp.async_stream_query`, as Agent Engine derives the
+        method's API schema from it; anything else is passed on in `kwargs`.
+        """
+        events = super().async_stream_query(
+            message=message,
+            user_id=user_id,
+            session_id=session_id,
+            run_config=run_config,
+            **kwargs,
+        )
+        if not PROGRESS_STREAMING_ENABLED:
+            async for event in events:
+                yield event
+            return
+        async for event in stream_with_progress(events):
+            yield event
+
     def register_feedback(self, feedback: dict[str, Any]) -> None:
-        """Collect and log feedback."""
+        """Collect and log feedback.
+
+        The feedback is validated here and queued for a batched write, so the
+        call returns without waiting on Cloud Logging.
+        """
         feedback_obj = Feedback.model_validate(feedback)
-        self.logger.log_struct(feedback_obj.model_dump(), severity="INFO")
+        self.feedback_writer.submit(feedback_obj.model_dump())
+        if self.tail_sampler is not None:
+            self.tail_sampler.record_feedback(
+                feedback_obj.invocation_id, feedback_obj.score
+            )
 
     def register_operations(self) -> dict[str, list[str]]:
         """Registers the operations of the Agent.
@@ -147,6 +230,43 @@ def load_env_from_file(file_path: str) -> dict[str, str]:
     default=None,
     help="GCS bucket name for artifacts (defaults to gs://{project}-agent-engine)",
 )
+@click.option(
+    "--num-workers",
+    default=None,
+    type=int,
+    envvar="NUM_WORKERS",
+    help="Worker processes per container (defaults to one per CPU)",
+)
+@click.option(
+    "--worker-concurrency",
+    default=None,
+    type=int,
+    envvar="WORKER_CONCURRENCY",
+    help="Concurrent requests per worker (defaults to the platform's container concurrency)",
+)
+@click.option("--cpu", default="4", help="CPU limit per container")
+@click.option("--memory", default="4Gi", help="Memory limit per container")
+@click.option(
+    "--min-instances", default=None, type=int, help="Minimum container instances"
+)
+@click.option(
+    "--max-instances", default=None, type=int, help="Maximum container instances"
+)
+@click.option(
+    "--connector-spec/--no-connector-spec",
+    default=True,
+    help="Bundle a fresh snapshot of the connector's OpenAPI spec with the app",
+)
+@click.option(
+    "--schema-snapshot/--no-schema-snapshot",
+    default=True,
+    help="Bundle a fresh schema and statistics snapshot of the Citi Bike table",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Update the agent engine even if nothing changed since the last deploy",
+)
 def deploy_agent_engine_app(
     project: str | None,
     location: str,
@@ -158,6 +278,15 @@ def deploy_agent_engine_app(
     service_account: str | None,
     staging_bucket_uri: str | None,
     artifacts_bucket_name: str | None,
+    num_workers: int | None,
+    worker_concurrency: int | None,
+    cpu: str,
+    memory: str,
+    min_instances: int | None,
+    max_instances: int | None,
+    connector_spec: bool,
+    schema_snapshot: bool,
+    force: bool,
 ) -> AgentEngine:
     """Deploy the agent engine app to Vertex AI."""
 
@@ -202,6 +331,54 @@ def deploy_agent_engine_app(
 
     extra_packages_list = list(extra_packages)
 
+    # Workers build the connector tools from this snapshot instead of fetching
+    # and parsing the spec on every cold start. It ships inside ./app.
+    if connector_spec:
+        try:
+            snapshot = capture_connector_spec(**connector_settings())
+            bundled = load_connector_spec(DEFAULT_CONNECTOR_SPEC_PATH)
+            # Rewriting an unchanged spec would only move its capture time and
+            # change the package hash, so it is kept until half its max age.
+            if (
+                bundled is None
+                or bundled.version != snapshot.version
+                or bundled.age_seconds() > CONNECTOR_SPEC_MAX_AGE_HOURS * 3600 / 2
+            ):
+                save_connector_spec(snapshot, DEFAULT_CONNECTOR_SPEC_PATH)
+            logging.info(f"Bundling connector spec snapshot {snapshot.version}")
+        except Exception as e:
+            logging.warning(
+                f"Could not capture the connector spec ({e}); "
+                "workers will fetch it at start-up."
+            )
+
+    # The table's schema and statistics are read from this snapshot. It ships
+    # inside ./app, so workers never query them at start-up.
+    if schema_snapshot:
+        try:
+            from google.cloud import bigquery
+
+            table_snapshot = capture_snapshot(
+                bigquery.Client(project=project), DEFAULT_TABLE
+            )
+            bundled_snapshot = load_snapshot(SCHEMA_SNAPSHOT_PATH)
+            # Statistics drift on every capture. Rewriting an unchanged schema
+            # would only change the package hash, so it is kept until half its
+            # max age has passed.
+            if (
+                bundled_snapshot is None
+                or bundled_snapshot.version != table_snapshot.version
+                or bundled_snapshot.age_seconds()
+                > SCHEMA_SNAPSHOT_MAX_AGE_HOURS * 3600 / 2
+            ):
+                save_snapshot(table_snapshot, SCHEMA_SNAPSHOT_PATH)
+            logging.info(f"Bundling schema snapshot {table_snapshot.version}")
+        except Exception as e:
+            logging.warning(
+                f"Could not capture the schema snapshot ({e}); "
+                "deploying with the bundled one, if any."
+            )
+
     # Initialize vertexai client
     client = vertexai.Client(
         project=project,
@@ -212,14 +389,28 @@ def deploy_agent_engine_app(
     # Read requirements
     with open(requirements_file) as f:
         requirements = f.read().strip().split("\n")
+    def artifact_service_builder() -> GcsArtifactService:
+        return GcsArtifactService(bucket_name=artifacts_bucket_name)
+
     agent_engine = AgentEngineApp(
         agent=root_agent,
-        artifact_service_builder=lambda: GcsArtifactService(
-            bucket_name=artifacts_bucket_name
+        artifact_service_builder=artifact_service_builder,
+        # SESSION_STORE=bounded keeps sessions in the worker, bounded, with
+        # large tool outputs saved to the artifacts bucket.
+        session_service_builder=session_service_builder(
+            env_vars, artifact_service_builder
         ),
     )
-    # Set worker parallelism to 1
-    env_vars["NUM_WORKERS"] = "1"
+    # The agent keeps no per-request state at module level; everything shared
+    # between sessions is a thread-safe cache keyed by user, so the container
+    # can run several workers. `tests/load_test/worker_sweep.py` finds the
+    # best worker count for a container size.
+    if num_workers is None:
+        num_workers = max(1, int(float(cpu)))
+    env_vars["NUM_WORKERS"] = str(num_workers)
+    container_concurrency = (
+        num_workers * worker_concurrency if worker_concurrency is not None else None
+    )
 
     # Common configuration for both create and update operations
     labels: dict[str, str] = {}
@@ -234,6 +425,10 @@ def deploy_agent_engine_app(
         staging_bucket=staging_bucket_uri,
         labels=labels,
         gcs_dir_name=agent_name,
+        resource_limits={"cpu": cpu, "memory": memory},
+        container_concurrency=container_concurrency,
+        min_instances=min_instances,
+        max_instances=max_instances,
     )
 
     agent_config = {
@@ -242,26 +437,45 @@ def deploy_agent_engine_app(
     }
     logging.info(f"Agent config: {agent_config}")
 
-    # Check if an agent with this name already exists
-    existing_agents = list(client.agent_engines.list())
-    matching_agents = [
-        agent
-        for agent in existing_agents
-        if agent.api_resource.display_name == agent_name
-    ]
+    # Only inputs that change the deployed agent are hashed; an update uploads
+    # and rebuilds the whole package, so it is skipped when they are unchanged.
+    hashes = deployment_hashes(
+        extra_packages_list,
+        requirements,
+        env_vars,
+        config.model_dump(
+            mode="json",
+            exclude={"extra_packages", "env_vars", "requirements"},
+            exclude_none=True,
+        ),
+    )
+    plan = plan_deployment(
+        client, agent_name, location, hashes, read_deployment_metadata()
+    )
+
+    if plan.skip and not force:
+        logging.info(
+            f"\n⏭️  {agent_name} is up to date with this deploy's package, "
+            "requirements, env vars and settings; skipping the update. "
+            "Pass --force to update anyway."
+        )
+        return plan.existing
 
-    if matching_agents:
+    if plan.existing is not None:
         # Update the existing agent with new configuration
-        logging.info(f"\n📝 Updating existing agent: {agent_name}")
+        logging.info(
+            f"\n📝 Updating existing agent: {agent_name} "
+            f"(changed: {', '.join(plan.changed) or 'forced'})"
+        )
         remote_agent = client.agent_engines.update(
-            name=matching_agents[0].api_resource.name, **agent_config
+            name=plan.existing.api_resource.name, **agent_config
         )
     else:
         # Create a new agent if none exists
         logging.info(f"\n🚀 Creating new agent: {agent_name}")
         remote_agent = client.agent_engines.create(**agent_config)
 
-    write_deployment_metadata(remote_agent)
+    write_deployment_metadata(remote_agent, content_hashes=hashes)
     print_deployment_success(remote_agent, location, project)
 
     return remote_agent
@@ -14,34 +14,211 @@
 
 """Defines the external tools available to the agent."""
 
+import asyncio
+import importlib
+import logging
 import os
-from dotenv import load_dotenv
+import threading
+from collections.abc import Callable
+from typing import Any
 
-import google.auth
-from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
-
-#from .oauth import oauth2_scheme, oauth2_credential
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
 
+# from .oauth import oauth2_scheme, oauth2_credential
 from .prompts import app_int_cloud_bqoauth_instructions
-load_dotenv()
-
+from .utils.concurrency import KeyedConcurrencyLimiter
 
 project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 
+# Prefix given to the tools generated for the BigQuery connector. Callbacks use
+# it to recognise ExecuteCustomQuery calls.
+BQ_TOOL_NAME_PREFIX = "bqcitibike"
+
+
+# Optional "module:callable" returning a stand-in for the connector toolset,
+# e.g. "tests.load_test.fakes:FakeBigQueryConnector" for offline load tests.
+BQ_CONNECTOR_FACTORY = os.getenv("BQ_CONNECTOR_FACTORY")
+
+BQ_CONNECTOR_ACTIONS = ["ExecuteCustomQuery"]
+
+# The connector's OpenAPI spec is read from a snapshot shipped with the package
+# (see `app/utils/connector_spec.py`) and only fetched when the snapshot is
+# missing, older than CONNECTOR_SPEC_MAX_AGE_HOURS or captured for another
+# connection. CONNECTOR_SPEC_PATH overrides the snapshot location.
+CONNECTOR_SPEC_PATH = os.getenv("CONNECTOR_SPEC_PATH")
+CONNECTOR_SPEC_MAX_AGE_HOURS = float(os.getenv("CONNECTOR_SPEC_MAX_AGE_HOURS", "720"))
+
+# Independent queries the model issues in one response run concurrently: ADK
+# executes parallel function calls as tasks and returns their responses in call
+# order. Each user runs at most QUERY_MAX_CONCURRENCY_PER_USER queries through
+# the connector at once; further calls wait for a slot.
+QUERY_MAX_CONCURRENCY_PER_USER = int(os.getenv("QUERY_MAX_CONCURRENCY_PER_USER", "4"))
+
+
+def connector_settings() -> dict[str, Any]:
+    """Returns the `ApplicationIntegrationToolset` arguments for the BigQuery connector."""
+    return {
+        "project": project_id,
+        "location": os.getenv("BQ_CONNECTION_REGION"),
+        "connection": os.getenv("BQ_CONNECTION_NAME"),
+        "actions": BQ_CONNECTOR_ACTIONS,
+        "tool_name_prefix": BQ_TOOL_NAME_PREFIX,
+        "tool_instructions": app_int_cloud_bqoauth_instructions,
+    }
+
+
+def build_bq_connector() -> BaseToolset:
+    """Builds the toolset that runs SQL against BigQuery.
+
+    This toolset connects to a Google Cloud Application Integration connector.
+    Application Integration provides a managed, low-code way to connect to various
+    enterprise systems and Google Cloud services.
+    In this case, it's configured to connect to a BigQuery database, allowing the
+    agent to execute a custom query. The specific connection details are loaded
+    from environment variables, and the tools are built from the bundled spec
+    snapshot when it is usable.
+    """
+    if BQ_CONNECTOR_FACTORY:
+        module_name, _, factory_name = BQ_CONNECTOR_FACTORY.partition(":")
+        return getattr(importlib.import_module(module_name), factory_name)()
+    # Imported here: the OpenAPI tool stack is only needed once the connector is built.
+    from google.adk.tools.application_integration_tool.application_integration_toolset import (
+        ApplicationIntegrationToolset,
+    )
+
+    from .utils.connector_spec import (
+        DEFAULT_CONNECTOR_SPEC_PATH,
+        SnapshotConnectorToolset,
+        connector_key,
+        usable_connector_spec,
+    )
+
+    settings = connector_settings()
+    snapshot = usable_connector_spec(
+        CONNECTOR_SPEC_PATH or DEFAULT_CONNECTOR_SPEC_PATH,
+        connector_key(**settings),
+        max_age_seconds=CONNECTOR_SPEC_MAX_AGE_HOURS * 3600,
+    )
+    if snapshot is not None:
+        try:
+            toolset = SnapshotConnectorToolset(snapshot)
+            logging.info(
+                f"Built the connector tools from spec snapshot {snapshot.version}."
+            )
+            return toolset
+        except Exception:
+            logging.exception(
+                "Could not build the connector tools from the spec snapshot; fetching the spec."
+            )
+    return ApplicationIntegrationToolset(
+        **settings,
+        # auth_credential=oauth2_credential,
+        # auth_scheme=oauth2_scheme,
+    )
+
+
+class ConcurrencyLimitedTool(BaseTool):
+    """Runs the wrapped tool holding one of the calling user's slots of `limiter`."""
+
+    def __init__(self, tool: BaseTool, limiter: KeyedConcurrencyLimiter) -> None:
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            is_long_running=tool.is_long_running,
+        )
+        self.tool = tool
+        self.limiter = limiter
+
+    def _get_declaration(self) -> Any:
+        return self.tool._get_declaration()
+
+    async def run_async(
+        self, *, args: dict[str, Any], tool_context: ToolContext
+    ) -> Any:
+        async with self.limiter.slot(user_scope(tool_context)):
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+
+
+class LazyToolset(BaseToolset):
+    """Builds the wrapped toolset the first time its tools are requested.
+
+    `ApplicationIntegrationToolset` fetches the connection details and the
+    OpenAPI spec over the network in its constructor. Deferring that keeps it
+    off the import of `app.agent`, so cold starts and `adk web` reloads do not
+    wait for it. A failed build is retried on the next request.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], BaseToolset],
+        wrap_tool: Callable[[BaseTool], BaseTool] | None = None,
+    ) -> None:
+        super().__init__()
+        self._factory = factory
+        self._wrap_tool = wrap_tool
+        self._toolset: BaseToolset | None = None
+        self._lock = threading.Lock()
+
+    def build(self) -> BaseToolset:
+        """Returns the wrapped toolset, building it once."""
+        with self._lock:
+            if self._toolset is None:
+                self._toolset = self._factory()
+            return self._toolset
+
+    def prefetch(self) -> None:
+        """Builds the wrapped toolset in the background, e.g. at server start-up."""
+
+        def run() -> None:
+            try:
+                self.build()
+            except Exception:
+                logging.exception("Prefetching the connector toolset failed.")
+
+        threading.Thread(target=run, name="toolset-prefetch", daemon=True).start()
+
+    async def get_tools(
+        self, readonly_context: ReadonlyContext | None = None
+    ) -> list[BaseTool]:
+        toolset = self._toolset
+        if toolset is None:
+            toolset = await asyncio.to_thread(self.build)
+        tools = await toolset.get_tools(readonly_context)
+        if self._wrap_tool is None:
+            return tools
+        return [self._wrap_tool(tool) for tool in tools]
+
+    async def close(self) -> None:
+        # Agent tools close their toolsets after every run. The built toolset
+        # is shared by every run of the process and is left open, so the next
+        # run neither rebuilds it nor uses a closed one.
+        pass
+
+
+def is_bq_query_tool(tool: BaseTool) -> bool:
+    """Returns True if `tool` runs SQL through the BigQuery connector."""
+    return tool.name.startswith(BQ_TOOL_NAME_PREFIX)
+
+
+def user_scope(tool_context: ToolContext) -> str:
+    """Returns the identity that scopes tokens, cached results and query slots to a user."""
+    session = tool_context.session
+    return session.user_id or session.id
+
+
+query_limiter = KeyedConcurrencyLimiter(QUERY_MAX_CONCURRENCY_PER_USER)
+
+
+def limit_query_concurrency(tool: BaseTool) -> BaseTool:
+    """Caps the concurrent BigQuery queries of each user."""
+    return (
+        ConcurrencyLimitedTool(tool, query_limiter) if is_bq_query_tool(tool) else tool
+    )
+
 
-# This toolset connects to a Google Cloud Application Integration connector.
-# Application Integration provides a managed, low-code way to connect to various
-# enterprise systems and Google Cloud services.
-# In this case, it's configured to connect to a BigQuery database, allowing the
-# agent to execute a custom query. The specific connection details are loaded
-# from environment variables.
-app_int_cloud_bqoauth_connector = ApplicationIntegrationToolset(
-    project=project_id,
-    location=os.getenv("BQ_CONNECTION_REGION"),
-    connection=os.getenv("BQ_CONNECTION_NAME"),
-    actions=["ExecuteCustomQuery"],
-    tool_name_prefix="bqcitibike",
-    tool_instructions=app_int_cloud_bqoauth_instructions,
-    # auth_credential=oauth2_credential,
-    # auth_scheme=oauth2_scheme,
-)
\ No newline at end of file
+app_int_cloud_bqoauth_connector = LazyToolset(
+    build_bq_connector, wrap_tool=limit_query_concurrency
+)
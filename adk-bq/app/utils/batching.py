@@ -0,0 +1,146 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class BatchWorkerStats:
+    """Counters describing what a `BatchWorker` did with submitted items."""
+
+    submitted: int = 0
+    dropped: int = 0
+    processed: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class BatchWorker(Generic[T]):
+    """Hands items to a handler in batches from a background thread.
+
+    Producers never block: `submit` enqueues into a bounded queue and, when the
+    queue is full, drops the item and counts it. A single daemon thread drains
+    the queue and calls the handler once per batch, when `max_batch_size` items
+    are waiting or `flush_interval_seconds` has passed since the first one.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list[T]], None],
+        max_batch_size: int = 100,
+        flush_interval_seconds: float = 1.0,
+        max_queue_size: int = 10_000,
+        name: str = "batch-worker",
+    ) -> None:
+        """Initialize and start the worker.
+
+        Args:
+            handler: Called with each batch; exceptions are logged and counted
+            max_batch_size: Maximum number of items handed over at once
+            flush_interval_seconds: Maximum time an item waits for a batch
+            max_queue_size: Items queued beyond this are dropped
+            name: Name of the background thread
+        """
+        self._handler = handler
+        self._max_batch_size = max_batch_size
+        self._flush_interval = flush_interval_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self.stats = BatchWorkerStats()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> bool:
+        """Queue `item` for the handler. Returns False if it was dropped."""
+        if self._closed:
+            with self._stats_lock:
+                self.stats.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats.dropped += 1
+            return False
+        with self._stats_lock:
+            self.stats.submitted += 1
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every item queued so far has been handled.
+
+        Returns:
+            True if the queue drained before `timeout` seconds elapsed
+        """
+        marker = threading.Event()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def shutdown(self, timeout: float | None = 10.0) -> None:
+        """Flush queued items and stop accepting new ones."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+
+    def _run(self) -> None:
+        while True:
+            batch: list[T] = []
+            markers: list[threading.Event] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    # A flush was requested: hand over what we have right away.
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self._max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._handle(batch)
+            for marker in markers:
+                marker.set()
+
+    def _handle(self, batch: list[T]) -> None:
+        try:
+            self._handler(batch)
+        except Exception as e:
+            logging.warning(f"Batch handler failed for {len(batch)} items: {e}")
+            with self._stats_lock:
+                self.stats.failed += len(batch)
+                self.stats.batches += 1
+            return
+        with self._stats_lock:
+            self.stats.processed += len(batch)
+            self.stats.batches += 1
@@ -0,0 +1,112 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Hashable
+from contextlib import asynccontextmanager
+
+_Waiter = tuple[asyncio.AbstractEventLoop, asyncio.Future]
+
+
+class KeyedConcurrencyLimiter:
+    """Caps how many coroutines hold a slot for the same key at once.
+
+    Unlike a dictionary of `asyncio.Semaphore`s this is safe to share between
+    event loops: Agent Engine serves `stream_query` and `async_stream_query`
+    on different loops, and callers for one user may arrive on either. Waiters
+    are woken in FIFO order on their own loop, and nothing is kept for keys
+    without active or waiting callers.
+    """
+
+    def __init__(self, max_concurrent: int) -> None:
+        """Initialize the limiter.
+
+        Args:
+            max_concurrent: Slots per key, at least 1
+        """
+        if max_concurrent < 1:
+            raise ValueError(f"max_concurrent must be at least 1, got {max_concurrent}")
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._active: dict[Hashable, int] = {}
+        self._waiters: dict[Hashable, deque[_Waiter]] = {}
+
+    def active(self, key: Hashable) -> int:
+        with self._lock:
+            return self._active.get(key, 0)
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable) -> AsyncIterator[None]:
+        """Hold one of `key`'s slots for the duration of the block."""
+        await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    async def _acquire(self, key: Hashable) -> None:
+        with self._lock:
+            if self._active.get(key, 0) < self.max_concurrent:
+                self._active[key] = self._active.get(key, 0) + 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.setdefault(key, deque()).append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._waiters.get(key)
+                queued = queue is not None and waiter in queue
+                if queue is not None and queued:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._waiters[key]
+            future = waiter[1]
+            if not queued and future.done() and not future.cancelled():
+                # `_hand_over` gave this waiter the slot just before the
+                # cancellation landed; pass it on.
+                self._release(key)
+            # Otherwise, if the slot was already picked for this waiter,
+            # `_hand_over` passes it on when it finds the future cancelled.
+            raise
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            queue = self._waiters.get(key)
+            if queue:
+                # The slot passes straight to the next waiter, so the active
+                # count is unchanged and no newcomer can overtake it.
+                loop, future = queue.popleft()
+                if not queue:
+                    del self._waiters[key]
+            else:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+                return
+        try:
+            loop.call_soon_threadsafe(self._hand_over, key, future)
+        except RuntimeError:
+            # The waiter's loop has closed; pass the slot on.
+            self._release(key)
+
+    def _hand_over(self, key: Hashable, future: asyncio.Future) -> None:
+        if future.done():
+            # The waiter was cancelled after it was picked.
+            self._release(key)
+        else:
+            future.set_result(None)
@@ -0,0 +1,201 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for reading and rewriting Application Integration connector output.
+
+ExecuteCustomQuery returns rows as JSON objects that repeat every column name
+in every row, often with numbers as strings. Before a result reaches the model
+it can be re-encoded column-wise: the column names and types are listed once
+and each row becomes a list of typed values (`columnar`) or a CSV line (`csv`).
+`get_rows` reads every encoding back as row objects.
+"""
+
+import csv
+import io
+import json
+import re
+from collections.abc import Callable
+from typing import Any
+
+# ExecuteCustomQuery returns the result set as a list of row objects under this
+# key of the tool response.
+CONNECTOR_ROWS_KEY = "connectorOutputPayload"
+RESULT_ENCODINGS = ("json", "columnar", "csv")
+
+_INTEGER = re.compile(r"-?(0|[1-9][0-9]*)")
+# Only canonical numbers, so that identifiers such as "00123" stay strings.
+_FLOAT = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+
+
+def get_rows(response: Any) -> list[dict[str, Any]] | None:
+    """Return the result rows of a connector response, if it has any.
+
+    Args:
+        response: The tool response returned by the connector tool
+
+    Returns:
+        The list of row dictionaries, or None if the response carries no rows
+    """
+    if not isinstance(response, dict):
+        return None
+    rows = response.get(CONNECTOR_ROWS_KEY)
+    if isinstance(rows, list):
+        return rows
+    if isinstance(rows, dict) and rows.get("encoding") in RESULT_ENCODINGS:
+        return decode_rows(rows)
+    return None
+
+
+def with_rows(response: dict[str, Any], rows: Any) -> dict[str, Any]:
+    """Return a shallow copy of `response` with its rows replaced by `rows`."""
+    return {**response, CONNECTOR_ROWS_KEY: rows}
+
+
+def _is_integer(value: Any) -> bool:
+    if isinstance(value, str):
+        return _INTEGER.fullmatch(value) is not None
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, str):
+        return _FLOAT.fullmatch(value) is not None
+    return isinstance(value, int | float) and not isinstance(value, bool)
+
+
+def _column_type(values: list[Any]) -> str:
+    """Type of a column from its non-null values."""
+    present = [value for value in values if value is not None]
+    if any(isinstance(value, dict | list) for value in present):
+        return "JSON"
+    if present and all(isinstance(value, bool) for value in present):
+        return "BOOLEAN"
+    if present and all(_is_integer(value) for value in present):
+        return "INTEGER"
+    if present and all(_is_number(value) for value in present):
+        return "FLOAT"
+    return "STRING"
+
+
+_CONVERTERS = {"INTEGER": int, "FLOAT": float}
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, dict | list):
+        return json.dumps(value)
+    return value
+
+
+def encode_rows(rows: list[dict[str, Any]], encoding: str) -> Any:
+    """Encode row objects as `encoding`.
+
+    Args:
+        rows: The result rows
+        encoding: One of `RESULT_ENCODINGS`
+
+    Returns:
+        `rows` itself for `json`, otherwise a dictionary with the `columns`
+        and their `types` listed once, the `row_count`, and the values as
+        `rows` (columnar) or as `csv` text without a header line
+    """
+    if encoding == "json":
+        return rows
+    if encoding not in RESULT_ENCODINGS:
+        raise ValueError(
+            f"Unknown result encoding {encoding!r}; expected one of {RESULT_ENCODINGS}"
+        )
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    grid = [[row.get(column) for column in columns] for row in rows]
+    types = [_column_type([values[i] for values in grid]) for i in range(len(columns))]
+    for i, column_type in enumerate(types):
+        convert = _CONVERTERS.get(column_type)
+        if convert is not None:
+            for values in grid:
+                if values[i] is not None:
+                    values[i] = convert(values[i])
+    encoded: dict[str, Any] = {
+        "encoding": encoding,
+        "columns": columns,
+        "types": types,
+        "row_count": len(rows),
+    }
+    if encoding == "columnar":
+        encoded["rows"] = grid
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for values in grid:
+            writer.writerow([_csv_value(value) for value in values])
+        encoded["csv"] = buffer.getvalue()
+    return encoded
+
+
+def decode_rows(encoded: dict[str, Any]) -> list[dict[str, Any]]:
+    """Row objects of a result encoded by `encode_rows`.
+
+    CSV values are converted back by column type; a NULL and an empty string
+    both decode to None.
+    """
+    columns = encoded["columns"]
+    if encoded["encoding"] == "columnar":
+        return [dict(zip(columns, values, strict=False)) for values in encoded["rows"]]
+    decoders: list[Callable[[str], Any]] = []
+    for column_type in encoded["types"]:
+        if column_type == "BOOLEAN":
+            decoders.append(lambda value: value == "true")
+        elif column_type == "JSON":
+            decoders.append(json.loads)
+        else:
+            decoders.append(_CONVERTERS.get(column_type, str))
+    return [
+        {
+            column: decode(value) if value != "" else None
+            for column, decode, value in zip(columns, decoders, values, strict=False)
+        }
+        for values in csv.reader(io.StringIO(encoded["csv"]))
+    ]
+
+
+def encode_result(response: Any, encoding: str) -> dict[str, Any] | None:
+    """Return `response` with its rows encoded as `encoding`.
+
+    Returns:
+        The re-encoded response, or None if it carries no row objects or
+        `encoding` is `json`
+    """
+    if encoding == "json" or not isinstance(response, dict):
+        return None
+    rows = response.get(CONNECTOR_ROWS_KEY)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return None
+    return with_rows(response, encode_rows(rows, encoding))
+
+
+def parse_result_encodings(value: str) -> dict[str, str]:
+    """Parse `"RootAgent=csv,cloud_bqoauth_agent=columnar"` into an encoding per agent."""
+    encodings = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        agent, _, encoding = item.partition("=")
+        encoding = encoding.strip().lower()
+        if encoding not in RESULT_ENCODINGS:
+            raise ValueError(
+                f"Unknown result encoding {encoding!r} for {agent.strip()}; "
+                f"expected one of {RESULT_ENCODINGS}"
+            )
+        encodings[agent.strip()] = encoding
+    return encodings
@@ -0,0 +1,258 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Versioned snapshot of the BigQuery connector's generated OpenAPI spec.
+
+`ApplicationIntegrationToolset` fetches the connection details and generates
+the connector's OpenAPI spec over the network every time it is constructed.
+The snapshot is captured ahead of time (`make connector-spec`, and on every
+`make deploy`), shipped inside the `app` package and used to build the same
+tools offline. It is only used while it matches the connector configuration
+and ADK version it was captured with and is younger than its maximum age.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import click
+from google.adk.tools.application_integration_tool.application_integration_toolset import (
+    ApplicationIntegrationToolset,
+)
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.version import __version__ as ADK_VERSION
+
+DEFAULT_CONNECTOR_SPEC_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "connector_spec.json"
+)
+CONNECTOR_SPEC_FORMAT_VERSION = 1
+
+
+def connector_key(
+    project: str | None,
+    location: str | None,
+    connection: str | None,
+    actions: list[str],
+    tool_name_prefix: str,
+    tool_instructions: str,
+) -> dict[str, Any]:
+    """The configuration a spec is generated from.
+
+    The ADK version is included because ADK generates the spec; instructions
+    are hashed as they are long and embedded in the spec anyway.
+    """
+    return {
+        "project": project,
+        "location": location,
+        "connection": connection,
+        "actions": sorted(actions),
+        "tool_name_prefix": tool_name_prefix,
+        "tool_instructions_sha256": hashlib.sha256(
+            tool_instructions.encode()
+        ).hexdigest(),
+        "adk_version": ADK_VERSION,
+    }
+
+
+@dataclass
+class ConnectorSpecSnapshot:
+    """Connection details and generated OpenAPI spec of a connector."""
+
+    key: dict[str, Any]
+    captured_at: str
+    connection_details: dict[str, Any]
+    spec: dict[str, Any]
+
+    @property
+    def sha256(self) -> str:
+        """Content hash of everything the tools are built from."""
+        material = json.dumps(
+            {
+                "key": self.key,
+                "connection_details": self.connection_details,
+                "spec": self.spec,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    @property
+    def version(self) -> str:
+        return self.sha256[:12]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "format_version": CONNECTOR_SPEC_FORMAT_VERSION,
+            "version": self.version,
+            "sha256": self.sha256,
+            "key": self.key,
+            "captured_at": self.captured_at,
+            "connection_details": self.connection_details,
+            "spec": self.spec,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ConnectorSpecSnapshot":
+        if data.get("format_version") != CONNECTOR_SPEC_FORMAT_VERSION:
+            raise ValueError(f"unsupported format {data.get('format_version')}")
+        snapshot = cls(
+            key=data["key"],
+            captured_at=data["captured_at"],
+            connection_details=data["connection_details"],
+            spec=data["spec"],
+        )
+        if snapshot.sha256 != data["sha256"]:
+            raise ValueError("content does not match its sha256")
+        return snapshot
+
+    def age_seconds(self) -> float:
+        captured_at = datetime.datetime.fromisoformat(self.captured_at)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (now - captured_at).total_seconds()
+
+
+def save_connector_spec(snapshot: ConnectorSpecSnapshot, path: str) -> None:
+    """Write `snapshot` to `path` as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(snapshot.to_dict(), f, indent=2)
+
+
+def load_connector_spec(path: str) -> ConnectorSpecSnapshot | None:
+    """Load a snapshot from `path`, returning None if it is missing or invalid."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return ConnectorSpecSnapshot.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable connector spec snapshot {path}: {e}")
+        return None
+
+
+def usable_connector_spec(
+    path: str, key: dict[str, Any], max_age_seconds: float
+) -> ConnectorSpecSnapshot | None:
+    """Return the snapshot at `path` if it was captured for `key` and is fresh."""
+    snapshot = load_connector_spec(path)
+    if snapshot is None:
+        return None
+    if snapshot.key != key:
+        changed = sorted(
+            name
+            for name in key.keys() | snapshot.key.keys()
+            if key.get(name) != snapshot.key.get(name)
+        )
+        logging.warning(
+            f"Connector spec snapshot {snapshot.version} was captured for a "
+            f"different {', '.join(changed)}; fetching the spec instead."
+        )
+        return None
+    if snapshot.age_seconds() > max_age_seconds:
+        logging.warning(
+            f"Connector spec snapshot {snapshot.version} is older than "
+            f"{max_age_seconds / 3600:.0f}h; fetching the spec instead. "
+            "Run `make connector-spec` to refresh it."
+        )
+        return None
+    return snapshot
+
+
+def capture_connector_spec(
+    project: str,
+    location: str,
+    connection: str,
+    actions: list[str],
+    tool_name_prefix: str,
+    tool_instructions: str,
+) -> ConnectorSpecSnapshot:
+    """Fetch the connection details and spec the same way the toolset does."""
+    from google.adk.tools.application_integration_tool.clients.connections_client import (
+        ConnectionsClient,
+    )
+    from google.adk.tools.application_integration_tool.clients.integration_client import (
+        IntegrationClient,
+    )
+
+    integration_client = IntegrationClient(
+        project, location, connection=connection, actions=actions
+    )
+    return ConnectorSpecSnapshot(
+        key=connector_key(
+            project, location, connection, actions, tool_name_prefix, tool_instructions
+        ),
+        captured_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        connection_details=ConnectionsClient(
+            project, location, connection
+        ).get_connection_details(),
+        spec=integration_client.get_openapi_spec_for_connection(
+            tool_name_prefix, tool_instructions
+        ),
+    )
+
+
+class SnapshotConnectorToolset(ApplicationIntegrationToolset):
+    """`ApplicationIntegrationToolset` built from a snapshot instead of the network.
+
+    Sets the state `ApplicationIntegrationToolset.__init__` would set for a
+    connection with actions, using the default service credential, then parses
+    the snapshot's spec into the same `IntegrationConnectorTool`s.
+    """
+
+    def __init__(self, snapshot: ConnectorSpecSnapshot) -> None:
+        BaseToolset.__init__(self)
+        self.project = snapshot.key["project"]
+        self.location = snapshot.key["location"]
+        self._connection_template_override = None
+        self._integration = None
+        self._triggers = None
+        self._connection = snapshot.key["connection"]
+        self._entity_operations = None
+        self._actions = snapshot.key["actions"]
+        self._tool_instructions = ""
+        self._service_account_json = None
+        self._auth_scheme = None
+        self._auth_credential = None
+        self._auth_config = None
+        self._openapi_toolset = None
+        self._tools = []
+        self._parse_spec_to_toolset(snapshot.spec, snapshot.connection_details)
+        self.snapshot_version = snapshot.version
+
+
+@click.command()
+@click.option(
+    "--output", default=DEFAULT_CONNECTOR_SPEC_PATH, help="Snapshot file to write"
+)
+def refresh_connector_spec(output: str) -> None:
+    """Capture the BigQuery connector's spec into OUTPUT."""
+    from app.tools import connector_settings
+
+    logging.basicConfig(level=logging.INFO)
+    previous = load_connector_spec(output)
+    snapshot = capture_connector_spec(**connector_settings())
+    save_connector_spec(snapshot, output)
+    if previous is not None and previous.version != snapshot.version:
+        logging.info(
+            f"Connector spec changed ({previous.version} -> {snapshot.version})"
+        )
+    logging.info(f"Wrote connector spec snapshot {snapshot.version} to {output}")
+
+
+if __name__ == "__main__":
+    refresh_connector_spec()
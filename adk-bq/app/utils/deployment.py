@@ -13,10 +13,19 @@
 # limitations under the License.
 
 import datetime
+import hashlib
 import json
 import logging
+import os
+from collections.abc import Iterable
+from dataclasses import dataclass, field
 from typing import Any
 
+DEPLOYMENT_METADATA_FILE = "deployment_metadata.json"
+# Generated files that never affect the deployed package's behaviour.
+_IGNORED_DIRS = {"__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache"}
+_IGNORED_SUFFIXES = (".pyc", ".pyo")
+
 
 def parse_env_vars(env_vars_string: str | None) -> dict[str, str]:
     """Parse environment variables from a comma-separated KEY=VALUE string.
@@ -38,20 +47,172 @@ def parse_env_vars(env_vars_string: str | None) -> dict[str, str]:
     return env_vars
 
 
+def hash_paths(paths: Iterable[str]) -> str:
+    """Return the SHA-256 of the files under `paths`, by path and content.
+
+    Args:
+        paths: Files and directories, e.g. the `extra_packages` of a deployment
+
+    Returns:
+        Hex digest that changes when a file is added, removed, renamed or edited
+    """
+    digest = hashlib.sha256()
+    for root in sorted(os.path.normpath(path) for path in paths):
+        if os.path.isfile(root):
+            files = [root]
+        else:
+            files = []
+            for directory, dirnames, filenames in os.walk(root):
+                dirnames[:] = [name for name in dirnames if name not in _IGNORED_DIRS]
+                files.extend(
+                    os.path.join(directory, name)
+                    for name in filenames
+                    if not name.endswith(_IGNORED_SUFFIXES)
+                )
+        for path in sorted(files):
+            digest.update(path.replace(os.sep, "/").encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def hash_json(value: Any) -> str:
+    """Return the SHA-256 of `value` serialized as canonical JSON."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def deployment_hashes(
+    extra_packages: Iterable[str],
+    requirements: list[str],
+    env_vars: dict[str, str],
+    config: dict[str, Any],
+) -> dict[str, str]:
+    """Content hashes of everything an agent engine update would change.
+
+    Args:
+        extra_packages: Files and directories uploaded with the agent
+        requirements: Requirement lines installed in the container
+        env_vars: Environment variables set on the agent engine
+        config: The remaining deployment settings, e.g. resource limits
+
+    Returns:
+        A hash per input, recorded in the deployment metadata
+    """
+    return {
+        "extra_packages": hash_paths(extra_packages),
+        "requirements": hash_json(
+            sorted(line.strip() for line in requirements if line.strip())
+        ),
+        "env_vars": hash_json(env_vars),
+        "config": hash_json(config),
+    }
+
+
+@dataclass
+class DeploymentPlan:
+    """What a deploy will do with the agent engine of the same name."""
+
+    existing: Any = None
+    changed: list[str] = field(default_factory=list)
+
+    @property
+    def skip(self) -> bool:
+        """True if the agent engine already runs exactly these inputs."""
+        return self.existing is not None and not self.changed
+
+
+def plan_deployment(
+    client: Any,
+    agent_name: str,
+    location: str,
+    hashes: dict[str, str],
+    metadata: dict[str, Any],
+) -> DeploymentPlan:
+    """Find the agent engine to update and whether its inputs changed.
+
+    The engine recorded in the deployment metadata is fetched by its resource
+    name; the project's agent engines are only listed when there is none, it is
+    in another location or was deleted, or it has another display name.
+
+    Args:
+        client: A `vertexai.Client`
+        agent_name: Display name of the agent engine
+        location: Region the agent engine is deployed to
+        hashes: `deployment_hashes` of the inputs about to be deployed
+        metadata: The last deployment's metadata, see `read_deployment_metadata`
+
+    Returns:
+        The existing agent engine, if any, and the names of the changed hashes
+    """
+    from google.genai.errors import ClientError
+
+    recorded_name = metadata.get("remote_agent_engine_id")
+    existing = None
+    if recorded_name and f"/locations/{location}/" in recorded_name:
+        try:
+            agent = client.agent_engines.get(name=recorded_name)
+        except ClientError as e:
+            if e.code != 404:
+                raise
+            logging.info(f"Recorded agent engine {recorded_name} no longer exists")
+        else:
+            if agent.api_resource.display_name == agent_name:
+                existing = agent
+    if existing is None:
+        existing = next(
+            (
+                agent
+                for agent in client.agent_engines.list()
+                if agent.api_resource.display_name == agent_name
+            ),
+            None,
+        )
+    if existing is None:
+        return DeploymentPlan()
+
+    recorded_hashes = (
+        metadata.get("content_hashes") or {}
+        if existing.api_resource.name == recorded_name
+        else {}
+    )
+    changed = [name for name in hashes if recorded_hashes.get(name) != hashes[name]]
+    return DeploymentPlan(existing=existing, changed=changed)
+
+
+def read_deployment_metadata(
+    metadata_file: str = DEPLOYMENT_METADATA_FILE,
+) -> dict[str, Any]:
+    """Read the last deployment's metadata, or an empty dict if there is none."""
+    try:
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable deployment metadata {metadata_file}: {e}")
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
 def write_deployment_metadata(
     remote_agent: Any,
-    metadata_file: str = "deployment_metadata.json",
+    metadata_file: str = DEPLOYMENT_METADATA_FILE,
+    content_hashes: dict[str, str] | None = None,
 ) -> None:
     """Write deployment metadata to file.
 
     Args:
         remote_agent: The deployed agent engine resource
         metadata_file: Path to write the metadata JSON file
+        content_hashes: `deployment_hashes` of the deployed inputs
     """
-    metadata = {
+    metadata: dict[str, Any] = {
         "remote_agent_engine_id": remote_agent.api_resource.name,
         "deployment_timestamp": datetime.datetime.now().isoformat(),
     }
+    if content_hashes is not None:
+        metadata["content_hashes"] = content_hashes
 
     with open(metadata_file, "w") as f:
         json.dump(metadata, f, indent=2)
@@ -0,0 +1,143 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Buffered writing of user feedback.
+
+`register_feedback` hands each entry to a `FeedbackWriter` and returns. The
+writer queues entries in a bounded buffer and a background thread writes them
+to a `FeedbackSink` in batches, by size or after a flush interval, so a burst
+of ratings costs one Cloud Logging request rather than one per rating.
+"""
+
+import logging
+import os
+import threading
+from collections.abc import Mapping
+from typing import Any, Protocol
+
+from app.utils.batching import BatchWorker, BatchWorkerStats
+
+
+class FeedbackSink(Protocol):
+    """Destination of feedback entries."""
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        """Write a batch of entries; exceptions count the batch as failed."""
+        ...
+
+
+class CloudLoggingFeedbackSink:
+    """Writes each batch with a single Cloud Logging `entries.write` call."""
+
+    def __init__(self, logger: Any, severity: str = "INFO") -> None:
+        """Initialize the sink.
+
+        Args:
+            logger: A `google.cloud.logging.Logger`
+            severity: Severity of the log entries
+        """
+        self.logger = logger
+        self.severity = severity
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        batch = self.logger.batch()
+        for entry in entries:
+            batch.log_struct(entry, severity=self.severity)
+        batch.commit()
+
+
+class InMemoryFeedbackSink:
+    """Keeps written batches in memory, for tests and local servers."""
+
+    def __init__(self) -> None:
+        self.batches: list[list[dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def entries(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [entry for batch in self.batches for entry in batch]
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self.batches.append(list(entries))
+
+
+class FeedbackWriter:
+    """Queues feedback entries and writes them to a sink in batches."""
+
+    def __init__(
+        self,
+        sink: FeedbackSink,
+        max_batch_size: int = 100,
+        flush_interval_seconds: float = 2.0,
+        max_queue_size: int = 10_000,
+    ) -> None:
+        """Initialize the writer and start its background thread.
+
+        Args:
+            sink: Where batches of entries are written
+            max_batch_size: Entries written per batch at most
+            flush_interval_seconds: Longest an entry waits for its batch
+            max_queue_size: Entries queued beyond this are dropped and counted
+        """
+        self.sink = sink
+        self._worker: BatchWorker[dict[str, Any]] = BatchWorker(
+            sink.write,
+            max_batch_size=max_batch_size,
+            flush_interval_seconds=flush_interval_seconds,
+            max_queue_size=max_queue_size,
+            name="feedback-writer",
+        )
+
+    @classmethod
+    def from_env(
+        cls, sink: FeedbackSink, environ: Mapping[str, str] = os.environ
+    ) -> "FeedbackWriter":
+        """Build the writer from the `FEEDBACK_*` environment variables."""
+        return cls(
+            sink,
+            max_batch_size=int(environ.get("FEEDBACK_BATCH_SIZE", "100")),
+            flush_interval_seconds=float(
+                environ.get("FEEDBACK_FLUSH_INTERVAL_SECONDS", "2")
+            ),
+            max_queue_size=int(environ.get("FEEDBACK_MAX_QUEUE_SIZE", "10000")),
+        )
+
+    @property
+    def stats(self) -> BatchWorkerStats:
+        """Entries submitted, dropped, written and failed so far."""
+        return self._worker.stats
+
+    def submit(self, entry: dict[str, Any]) -> bool:
+        """Queue `entry` for writing. Returns False if it was dropped."""
+        if self._worker.submit(entry):
+            return True
+        logging.warning(
+            f"Feedback queue full; dropped an entry "
+            f"({self.stats.dropped} dropped so far)"
+        )
+        return False
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Write every entry queued so far.
+
+        Returns:
+            True if they were written before `timeout` seconds elapsed
+        """
+        return self._worker.flush(timeout)
+
+    def shutdown(self, timeout: float | None = 10.0) -> None:
+        """Write queued entries and stop accepting new ones."""
+        self._worker.shutdown(timeout)
@@ -0,0 +1,236 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Artifact service that keeps artifacts in a local directory.
+
+ADK ships in-memory and GCS artifact services. Workers that move large tool
+outputs out of memory without a bucket, and local servers, use
+`LocalFileArtifactService`: each version of an artifact is one JSON file under
+`<root>/<app>/<user>/<session or "user">/<filename>/<version>.json`.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import urllib.parse
+from pathlib import Path
+from typing import Any
+
+from google.adk.artifacts import BaseArtifactService
+from google.adk.artifacts.base_artifact_service import ArtifactVersion
+from google.genai import types
+
+USER_NAMESPACE = "user:"
+
+
+def _quote(name: str) -> str:
+    # Names become single path components, so "/" and ".." cannot escape root.
+    return (
+        urllib.parse.quote(name, safe="") if name not in ("", ".", "..") else f"%{name}"
+    )
+
+
+class LocalFileArtifactService(BaseArtifactService):
+    """Stores artifact versions as JSON files under `root`."""
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def _artifact_dir(
+        self, app_name: str, user_id: str, filename: str, session_id: str | None
+    ) -> Path:
+        return self._scope_dir(app_name, user_id, filename, session_id) / _quote(
+            filename
+        )
+
+    def _scope_dir(
+        self, app_name: str, user_id: str, filename: str | None, session_id: str | None
+    ) -> Path:
+        if filename is not None and filename.startswith(USER_NAMESPACE):
+            scope = "user"
+        elif session_id is None:
+            raise ValueError(
+                "Session ID must be provided for session-scoped artifacts."
+            )
+        else:
+            scope = f"session-{session_id}"
+        return self.root / _quote(app_name) / _quote(user_id) / _quote(scope)
+
+    def _versions(self, artifact_dir: Path) -> list[int]:
+        if not artifact_dir.is_dir():
+            return []
+        return sorted(
+            int(path.stem)
+            for path in artifact_dir.glob("*.json")
+            if path.stem.isdigit()
+        )
+
+    def _read(self, artifact_dir: Path, version: int | None) -> dict[str, Any] | None:
+        versions = self._versions(artifact_dir)
+        if not versions:
+            return None
+        if version is None:
+            version = versions[-1]
+        try:
+            with open(artifact_dir / f"{version}.json") as f:
+                data: dict[str, Any] = json.load(f)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _write(
+        self,
+        artifact_dir: Path,
+        artifact: types.Part,
+        custom_metadata: dict[str, Any] | None,
+    ) -> int:
+        if artifact.inline_data is not None:
+            mime_type = artifact.inline_data.mime_type
+        elif artifact.text is not None:
+            mime_type = "text/plain"
+        elif artifact.file_data is not None:
+            mime_type = artifact.file_data.mime_type
+        else:
+            raise ValueError("Not supported artifact type.")
+        part = artifact.model_dump(mode="json", exclude_none=True)
+        artifact_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            versions = self._versions(artifact_dir)
+            version = versions[-1] + 1 if versions else 0
+            path = artifact_dir / f"{version}.json"
+            metadata = ArtifactVersion(
+                version=version,
+                canonical_uri=path.resolve().as_uri(),
+                custom_metadata=custom_metadata or {},
+                mime_type=mime_type,
+            )
+            data = {"part": part, "metadata": metadata.model_dump(mode="json")}
+            # Written to a temporary file first so readers never see a partial
+            # one, then linked into place, which fails if a concurrent save
+            # took the version first.
+            fd, tmp_path = tempfile.mkstemp(dir=artifact_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.link(tmp_path, path)
+            except FileExistsError:
+                continue
+            finally:
+                os.unlink(tmp_path)
+            return version
+
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        artifact: types.Part,
+        session_id: str | None = None,
+        custom_metadata: dict[str, Any] | None = None,
+    ) -> int:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        return await asyncio.to_thread(
+            self._write, artifact_dir, artifact, custom_metadata
+        )
+
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: str | None = None,
+        version: int | None = None,
+    ) -> types.Part | None:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        data = await asyncio.to_thread(self._read, artifact_dir, version)
+        return types.Part.model_validate(data["part"]) if data is not None else None
+
+    async def list_artifact_keys(
+        self, *, app_name: str, user_id: str, session_id: str | None = None
+    ) -> list[str]:
+        scopes = [self._scope_dir(app_name, user_id, USER_NAMESPACE, None)]
+        if session_id is not None:
+            scopes.append(self._scope_dir(app_name, user_id, None, session_id))
+        return await asyncio.to_thread(self._list_keys, scopes)
+
+    def _list_keys(self, scopes: list[Path]) -> list[str]:
+        return sorted(
+            urllib.parse.unquote(path.name)
+            for scope in scopes
+            if scope.is_dir()
+            for path in scope.iterdir()
+            if self._versions(path)
+        )
+
+    async def delete_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: str | None = None,
+    ) -> None:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        await asyncio.to_thread(shutil.rmtree, artifact_dir, ignore_errors=True)
+
+    async def list_versions(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: str | None = None,
+    ) -> list[int]:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        return await asyncio.to_thread(self._versions, artifact_dir)
+
+    async def list_artifact_versions(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: str | None = None,
+    ) -> list[ArtifactVersion]:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        return await asyncio.to_thread(self._read_versions, artifact_dir)
+
+    def _read_versions(self, artifact_dir: Path) -> list[ArtifactVersion]:
+        versions = []
+        for version in self._versions(artifact_dir):
+            data = self._read(artifact_dir, version)
+            if data is not None:
+                versions.append(ArtifactVersion.model_validate(data["metadata"]))
+        return versions
+
+    async def get_artifact_version(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: str | None = None,
+        version: int | None = None,
+    ) -> ArtifactVersion | None:
+        artifact_dir = self._artifact_dir(app_name, user_id, filename, session_id)
+        data = await asyncio.to_thread(self._read, artifact_dir, version)
+        return (
+            ArtifactVersion.model_validate(data["metadata"])
+            if data is not None
+            else None
+        )
@@ -0,0 +1,268 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compaction of the conversation history sent to the model.
+
+Every model call resends the whole conversation, including the rows of earlier
+query results and the markdown tables the answers rendered from them. Once the
+history exceeds a token budget, `HistoryCompactor` rewrites the oldest turns
+first: query results become a summary of their row count, columns and SQL, and
+markdown tables are cut to a few rows. The most recent turns are never touched.
+"""
+
+import re
+from collections import defaultdict, deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from google.genai import types
+
+from app.utils.connector_results import get_rows
+
+# Markdown table rows, including the `|---|---|` separator.
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|(\s*:?-+:?\s*\|)+\s*$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`, about four characters per token."""
+    return len(text) // 4
+
+
+def parse_token_budgets(value: str) -> dict[str, int]:
+    """Parse `"RootAgent=6000,cloud_bqoauth_agent=12000"` into a budget per agent."""
+    budgets = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        agent, _, budget = item.partition("=")
+        budgets[agent.strip()] = int(budget)
+    return budgets
+
+
+@dataclass
+class CompactionReport:
+    """What a compaction pass did to one model request."""
+
+    tokens_before: int
+    tokens_after: int
+    compacted_results: int = 0
+    compacted_tables: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class HistoryCompactor:
+    """Keeps the conversation sent to the model within a token budget."""
+
+    def __init__(
+        self,
+        keep_recent_turns: int = 2,
+        table_preview_rows: int = 5,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ) -> None:
+        """Initialize the compactor.
+
+        Args:
+            keep_recent_turns: Most recent turns, counting the current one,
+                that are always sent verbatim
+            table_preview_rows: Rows of a markdown table kept in older turns
+            count_tokens: Estimates the tokens of a piece of text
+        """
+        self.keep_recent_turns = keep_recent_turns
+        self.table_preview_rows = table_preview_rows
+        self._count_tokens = count_tokens
+
+    def count_content_tokens(self, content: types.Content) -> int:
+        return self._count_tokens(content.model_dump_json(exclude_none=True))
+
+    def compact(
+        self, contents: list[types.Content], token_budget: int
+    ) -> tuple[list[types.Content], CompactionReport]:
+        """Compact the oldest turns of `contents` until it fits `token_budget`.
+
+        Args:
+            contents: The conversation of a model request, oldest first
+            token_budget: Tokens the conversation may take
+
+        Returns:
+            The compacted conversation, sharing unchanged contents with
+            `contents`, and a report of the tokens saved
+        """
+        sizes = [self.count_content_tokens(content) for content in contents]
+        total = sum(sizes)
+        report = CompactionReport(tokens_before=total, tokens_after=total)
+        if total <= token_budget:
+            return contents, report
+
+        compacted = list(contents)
+        sql_by_response = _sql_by_response(contents)
+        for index in range(self._first_protected_index(contents)):
+            content, results, tables = self._compact_content(
+                contents[index], index, sql_by_response
+            )
+            if content is contents[index]:
+                continue
+            compacted[index] = content
+            size = self.count_content_tokens(content)
+            total -= sizes[index] - size
+            report.compacted_results += results
+            report.compacted_tables += tables
+            if total <= token_budget:
+                break
+        report.tokens_after = total
+        return compacted, report
+
+    def _first_protected_index(self, contents: list[types.Content]) -> int:
+        """Index of the first content of the turns that are kept verbatim."""
+        if self.keep_recent_turns <= 0:
+            return len(contents)
+        turn_starts = [
+            index
+            for index, content in enumerate(contents)
+            if content.role == "user" and any(part.text for part in content.parts or [])
+        ]
+        if len(turn_starts) < self.keep_recent_turns:
+            return 0
+        return turn_starts[-self.keep_recent_turns]
+
+    def _compact_content(
+        self,
+        content: types.Content,
+        index: int,
+        sql_by_response: dict[tuple[int, int], str],
+    ) -> tuple[types.Content, int, int]:
+        """Return `content`, at `index`, with its results summarized and tables cut."""
+        parts = []
+        results = tables = 0
+        for part_index, part in enumerate(content.parts or []):
+            if part.function_response is not None:
+                summary = self._summarize_response(
+                    part.function_response.response,
+                    sql_by_response.get((index, part_index)),
+                )
+                if summary is not None:
+                    part = part.model_copy(
+                        update={
+                            "function_response": part.function_response.model_copy(
+                                update={"response": summary}
+                            )
+                        }
+                    )
+                    results += 1
+            elif part.text:
+                text, cut = self.compact_tables(part.text)
+                if cut:
+                    part = part.model_copy(update={"text": text})
+                    tables += cut
+            parts.append(part)
+        if not results and not tables:
+            return content, 0, 0
+        return content.model_copy(update={"parts": parts}), results, tables
+
+    def _summarize_response(
+        self, response: dict[str, Any] | None, sql: str | None
+    ) -> dict[str, Any] | None:
+        """Summary of a tool response, or None to keep it as it is."""
+        if response is None or response.get("compacted"):
+            return None
+        rows = get_rows(response)
+        if rows is not None:
+            pagination = response.get("pagination") or {}
+            columns: dict[str, None] = {}
+            for row in rows:
+                if isinstance(row, dict):
+                    columns.update(dict.fromkeys(row))
+            summary: dict[str, Any] = {
+                "compacted": True,
+                "row_count": pagination.get("total_rows", len(rows)),
+                "columns": list(columns),
+            }
+            if sql:
+                summary["sql"] = sql
+            return summary
+        # Answers of a sub-agent called as a tool carry their tables as text.
+        result = response.get("result")
+        if isinstance(result, str):
+            text, cut = self.compact_tables(result)
+            if cut:
+                return {**response, "result": text}
+        return None
+
+    def compact_tables(self, text: str) -> tuple[str, int]:
+        """Cut markdown tables in `text` to `table_preview_rows` rows.
+
+        Returns:
+            The text and the number of tables that were cut
+        """
+        lines = text.split("\n")
+        output: list[str] = []
+        cut = 0
+        index = 0
+        while index < len(lines):
+            end = index
+            while end < len(lines) and _TABLE_ROW.match(lines[end]):
+                end += 1
+            if end == index:
+                output.append(lines[index])
+                index += 1
+                continue
+            table = lines[index:end]
+            header = 2 if len(table) > 1 and _TABLE_SEPARATOR.match(table[1]) else 0
+            body = table[header:]
+            if len(body) > self.table_preview_rows:
+                output.extend(table[: header + self.table_preview_rows])
+                output.append(
+                    f"({len(body) - self.table_preview_rows} more rows omitted)"
+                )
+                cut += 1
+            else:
+                output.extend(table)
+            index = end
+        return "\n".join(output), cut
+
+
+def _sql_by_response(contents: list[types.Content]) -> dict[tuple[int, int], str]:
+    """SQL of the query call each function response answers.
+
+    Keyed by the response's content and part index. Responses are matched to
+    their call by ID; calls without one are matched by position, the n-th
+    response of a tool answering its n-th unanswered call.
+    """
+    sql_by_id: dict[str, str | None] = {}
+    unanswered: dict[str, deque[str | None]] = defaultdict(deque)
+    sql_by_response = {}
+    for index, content in enumerate(contents):
+        for part_index, part in enumerate(content.parts or []):
+            if part.function_call is not None:
+                call = part.function_call
+                query = (call.args or {}).get("query")
+                sql = query if isinstance(query, str) else None
+                if call.id:
+                    sql_by_id[call.id] = sql
+                else:
+                    unanswered[call.name or ""].append(sql)
+            elif part.function_response is not None:
+                response = part.function_response
+                if response.id:
+                    sql = sql_by_id.get(response.id)
+                else:
+                    pending = unanswered[response.name or ""]
+                    sql = pending.popleft() if pending else None
+                if sql is not None:
+                    sql_by_response[(index, part_index)] = sql
+    return sql_by_response
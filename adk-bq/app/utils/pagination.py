@@ -0,0 +1,169 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from app.utils.connector_results import get_rows, with_rows
+
+
+@dataclass
+class _PagedResult:
+    scope: str
+    rows: list[Any]
+    template: dict[str, Any]
+    expires_at: float
+
+
+class ResultPager:
+    """Bounds how many rows and bytes of a query result reach the model.
+
+    Oversized results are split: the model receives the first page plus a
+    continuation token, and the full result is held in a bounded, expiring
+    in-memory store from which further pages can be fetched.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 50,
+        max_bytes: int = 16 * 1024,
+        ttl_seconds: float = 900.0,
+        max_results: int = 64,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize the pager.
+
+        Args:
+            max_rows: Maximum number of rows in a page
+            max_bytes: Maximum JSON size in bytes of the rows in a page
+            ttl_seconds: How long a paged result can be continued
+            max_results: Maximum number of paged results held at once
+            clock: Source of the current time in seconds
+        """
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_results = max_results
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._results: OrderedDict[str, _PagedResult] = OrderedDict()
+
+    def paginate(self, response: Any, scope: str) -> dict[str, Any] | None:
+        """Return the first page of `response` if it exceeds the page bounds.
+
+        Args:
+            response: The connector tool response
+            scope: Identity allowed to continue the result
+
+        Returns:
+            The bounded response, or None if `response` already fits in a page
+        """
+        rows = get_rows(response)
+        if rows is None:
+            return None
+        page_size = self._page_size(rows, 0)
+        if page_size == len(rows):
+            return None
+
+        result_id = secrets.token_urlsafe(12)
+        template = dict(response)
+        with self._lock:
+            self._evict_expired()
+            self._results[result_id] = _PagedResult(
+                scope=scope,
+                rows=rows,
+                template=template,
+                expires_at=self._clock() + self.ttl_seconds,
+            )
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return self._render_page(result_id, template, rows, 0, page_size)
+
+    def fetch_page(self, continuation_token: str, scope: str) -> dict[str, Any]:
+        """Return the page identified by `continuation_token`.
+
+        Args:
+            continuation_token: Token returned with the previous page
+            scope: Identity requesting the page
+
+        Returns:
+            The next page, or an error payload the model can act on
+        """
+        result_id, _, offset_str = continuation_token.partition(":")
+        with self._lock:
+            self._evict_expired()
+            paged = self._results.get(result_id)
+        if paged is None or paged.scope != scope or not offset_str.isdigit():
+            return {
+                "error": "Unknown or expired continuation_token. "
+                "Re-run the query, preferably with aggregation or a LIMIT."
+            }
+        offset = int(offset_str)
+        if offset >= len(paged.rows):
+            return {
+                "error": f"continuation_token offset {offset} is past the end of "
+                f"the result ({len(paged.rows)} rows); there are no more pages."
+            }
+        page_size = self._page_size(paged.rows, offset)
+        return self._render_page(
+            result_id, paged.template, paged.rows, offset, page_size
+        )
+
+    def _page_size(self, rows: list[Any], offset: int) -> int:
+        """Number of rows from `offset` that fit in a page.
+
+        At least one row, unless `offset` is past the last row.
+        """
+        if offset >= len(rows):
+            return 0
+        total_bytes = 0
+        end = min(len(rows), offset + self.max_rows)
+        for index in range(offset, end):
+            total_bytes += len(json.dumps(rows[index], default=str))
+            if total_bytes > self.max_bytes and index > offset:
+                return index - offset
+        return end - offset
+
+    def _render_page(
+        self,
+        result_id: str,
+        template: dict[str, Any],
+        rows: list[Any],
+        offset: int,
+        page_size: int,
+    ) -> dict[str, Any]:
+        next_offset = offset + page_size
+        has_more = next_offset < len(rows)
+        page = with_rows(template, rows[offset:next_offset])
+        page["pagination"] = {
+            "total_rows": len(rows),
+            "offset": offset,
+            "returned_rows": page_size,
+            "continuation_token": f"{result_id}:{next_offset}" if has_more else None,
+        }
+        return page
+
+    def _evict_expired(self) -> None:
+        now = self._clock()
+        expired = [
+            key for key, value in self._results.items() if value.expires_at <= now
+        ]
+        for key in expired:
+            del self._results[key]
@@ -0,0 +1,238 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, Protocol
+
+from app.utils.batching import BatchWorker
+
+
+class BlobStore(Protocol):
+    """Minimal object store used to offload large telemetry payloads."""
+
+    def exists(self) -> bool:
+        """Return True if the underlying bucket or directory exists."""
+        ...
+
+    def upload(
+        self, name: str, data: bytes, content_type: str, content_encoding: str | None
+    ) -> None: ...
+
+    def uri(self, name: str) -> str: ...
+
+    def url(self, name: str) -> str: ...
+
+
+class GcsBlobStore:
+    """`BlobStore` backed by a Google Cloud Storage bucket."""
+
+    def __init__(self, bucket: Any) -> None:
+        """
+        :param bucket: A `google.cloud.storage.Bucket`
+        """
+        self.bucket = bucket
+
+    def exists(self) -> bool:
+        return self.bucket.exists()
+
+    def upload(
+        self, name: str, data: bytes, content_type: str, content_encoding: str | None
+    ) -> None:
+        blob = self.bucket.blob(name)
+        # With Content-Encoding set, GCS serves the object decompressed to
+        # clients that do not accept gzip.
+        blob.content_encoding = content_encoding
+        blob.upload_from_string(data, content_type=content_type)
+
+    def uri(self, name: str) -> str:
+        return f"gs://{self.bucket.name}/{name}"
+
+    def url(self, name: str) -> str:
+        return f"https://storage.mtls.cloud.google.com/{self.bucket.name}/{name}"
+
+
+class LocalBlobStore:
+    """`BlobStore` writing to a local directory, for tests and offline runs."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.root)
+
+    def upload(
+        self, name: str, data: bytes, content_type: str, content_encoding: str | None
+    ) -> None:
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, name: str) -> bytes:
+        """Return the stored bytes of `name`, decompressed."""
+        with open(os.path.join(self.root, name), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def uri(self, name: str) -> str:
+        return f"file://{os.path.join(self.root, name)}"
+
+    def url(self, name: str) -> str:
+        return self.uri(name)
+
+
+class PayloadOffloader:
+    """Compresses and uploads large payloads from a background queue.
+
+    `offload` returns immediately; compression and upload happen on the worker
+    thread. Whether the destination exists is checked at most once per
+    `exists_ttl_seconds`, and only the cached answer is consulted on the
+    caller's thread.
+
+    `offload_content` stores payloads under the hash of their content, so
+    values repeated across spans (system instructions, conversation history)
+    are uploaded once. A bounded in-memory index remembers which hashes have
+    already been uploaded by this process.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore,
+        exists_ttl_seconds: float = 300.0,
+        max_queue_size: int = 256,
+        compress_level: int = 6,
+        max_indexed_hashes: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param store: Destination of the payloads
+        :param exists_ttl_seconds: How long a destination existence check is trusted
+        :param max_queue_size: Payloads waiting beyond this are dropped and counted
+        :param compress_level: gzip compression level
+        :param max_indexed_hashes: Number of uploaded content hashes remembered
+        :param clock: Source of the current time in seconds
+        """
+        self.store = store
+        self.exists_ttl_seconds = exists_ttl_seconds
+        self.compress_level = compress_level
+        self._clock = clock
+        self._exists_lock = threading.Lock()
+        self._exists: bool | None = None
+        self._exists_checked_at = float("-inf")
+        self.max_indexed_hashes = max_indexed_hashes
+        self._index_lock = threading.Lock()
+        self._uploaded: OrderedDict[str, None] = OrderedDict()
+        self.content_hits = 0
+        self.content_uploads = 0
+        # Queued as (name, payload, digest); digest is None unless the payload
+        # is stored under its content hash.
+        self.worker: BatchWorker[tuple[str, bytes, str | None]] = BatchWorker(
+            self._upload_batch,
+            max_batch_size=8,
+            flush_interval_seconds=0.1,
+            max_queue_size=max_queue_size,
+            name="payload-offload",
+        )
+
+    def known_missing(self) -> bool:
+        """Return True only if the last existence check found no destination."""
+        with self._exists_lock:
+            return self._exists is False and not self._exists_expired()
+
+    def store_exists(self) -> bool:
+        """Return whether the destination exists, checking at most once per TTL."""
+        with self._exists_lock:
+            if self._exists is not None and not self._exists_expired():
+                return self._exists
+        exists = self.store.exists()
+        with self._exists_lock:
+            self._exists = exists
+            self._exists_checked_at = self._clock()
+        return exists
+
+    def offload(self, name: str, payload: bytes) -> bool:
+        """Queue `payload` for upload as `name`. Returns False if it was dropped."""
+        return self.worker.submit((name, payload, None))
+
+    def offload_content(
+        self, data: bytes, prefix: str = "blobs/"
+    ) -> tuple[str, str] | None:
+        """Queue `data` for upload under its SHA-256 unless already uploaded.
+
+        :param data: The payload to store
+        :param prefix: Object name prefix for content-addressed payloads
+        :return: The object name and hex digest, or None if the payload was dropped
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{prefix}{digest}.json"
+        with self._index_lock:
+            if digest in self._uploaded:
+                self._uploaded.move_to_end(digest)
+                self.content_hits += 1
+                return name, digest
+            # Index before the upload finishes so concurrent spans carrying
+            # the same value do not queue it again.
+            self._remember(digest)
+        if not self.worker.submit((name, data, digest)):
+            self._forget(digest)
+            return None
+        with self._index_lock:
+            self.content_uploads += 1
+        return name, digest
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return self.worker.flush(timeout)
+
+    def shutdown(self) -> None:
+        self.worker.shutdown()
+
+    def _remember(self, digest: str) -> None:
+        self._uploaded[digest] = None
+        while len(self._uploaded) > self.max_indexed_hashes:
+            self._uploaded.popitem(last=False)
+
+    def _forget(self, digest: str) -> None:
+        with self._index_lock:
+            self._uploaded.pop(digest, None)
+
+    def _exists_expired(self) -> bool:
+        return self._clock() - self._exists_checked_at > self.exists_ttl_seconds
+
+    def _upload_batch(self, batch: list[tuple[str, bytes, str | None]]) -> None:
+        if not self.store_exists():
+            logging.warning(
+                f"Payload destination not found; dropped {len(batch)} large payloads."
+            )
+            for _, _, digest in batch:
+                if digest is not None:
+                    self._forget(digest)
+            return
+        for name, payload, digest in batch:
+            try:
+                self.store.upload(
+                    name,
+                    gzip.compress(payload, compresslevel=self.compress_level),
+                    content_type="application/json",
+                    content_encoding="gzip",
+                )
+            except Exception as e:
+                logging.warning(f"Failed to upload large payload {name}: {e}")
+                if digest is not None:
+                    self._forget(digest)
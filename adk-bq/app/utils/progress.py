@@ -0,0 +1,161 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Progress of agents run as tools, streamed while they are still working.
+
+An agent wrapped in an `AgentTool` runs in a runner of its own, and the parent
+only sees its final answer once it has finished. `stream_with_progress` opens a
+`ProgressChannel` for one streamed query; callbacks of the inner agent call
+`publish_progress` to send notices through it, and they are interleaved with
+the query's own events as soon as they are published. Notices are shaped like
+partial ADK events, so clients render them as streamed text, and they are never
+written to the session.
+
+The channel is found through a context variable, which the tasks ADK creates
+for tool calls inherit. Outside a streamed query `publish_progress` does
+nothing.
+"""
+
+import asyncio
+import contextvars
+import time
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import Any
+
+PROGRESS_METADATA_KEY = "progress"
+
+_channel: contextvars.ContextVar["ProgressChannel | None"] = contextvars.ContextVar(
+    "progress_channel", default=None
+)
+
+
+class _Done:
+    """Marks the end of the wrapped event stream."""
+
+    def __init__(self, error: BaseException | None = None) -> None:
+        self.error = error
+
+
+class ProgressChannel:
+    """Queue of the events and progress notices of one streamed query."""
+
+    def __init__(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[Any] = asyncio.Queue()
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """Queue `event` for the stream; safe to call from any thread."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._queue.put_nowait(event)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    async def _pump(self, events: AsyncIterator[dict[str, Any]]) -> None:
+        try:
+            async for event in events:
+                self._queue.put_nowait(event)
+        except Exception as e:
+            self._queue.put_nowait(_Done(e))
+        else:
+            self._queue.put_nowait(_Done())
+
+
+def progress_event(
+    author: str, text: str, kind: str, invocation_id: str = ""
+) -> dict[str, Any]:
+    """A partial model event carrying `text`, as `dump_event_for_json` shapes it.
+
+    Args:
+        author: The agent the notice is about
+        text: Markdown shown to the user
+        kind: What the notice reports, e.g. `sql` or `result`, kept in the
+            event's `custom_metadata`
+        invocation_id: The invocation of the agent publishing the notice
+
+    Returns:
+        The event as a JSON-compatible dictionary.
+    """
+    return {
+        "id": str(uuid.uuid4()),
+        "invocation_id": invocation_id,
+        "author": author,
+        "timestamp": time.time(),
+        "partial": True,
+        "content": {"role": "model", "parts": [{"text": text}]},
+        "custom_metadata": {PROGRESS_METADATA_KEY: kind},
+    }
+
+
+def progress_enabled() -> bool:
+    """True while a streamed query is collecting progress notices."""
+    return _channel.get() is not None
+
+
+def publish_progress(
+    author: str, text: str, kind: str, invocation_id: str = ""
+) -> bool:
+    """Send a progress notice to the streamed query this code runs in.
+
+    Args:
+        author: The agent the notice is about
+        text: Markdown shown to the user
+        kind: What the notice reports, see `progress_event`
+        invocation_id: The invocation of the agent publishing the notice
+
+    Returns:
+        Whether the notice was sent; False outside a streamed query.
+    """
+    channel = _channel.get()
+    if channel is None or not text:
+        return False
+    channel.publish(progress_event(author, text, kind, invocation_id))
+    return True
+
+
+async def stream_with_progress(
+    events: AsyncIterator[dict[str, Any]],
+) -> AsyncGenerator[dict[str, Any], None]:
+    """Yield `events` with the progress notices published while producing them.
+
+    `events` must not have started yet: it is consumed by a task created with
+    the channel set, so everything it runs, including tool calls, can publish.
+    Errors raised by `events` are raised here after the events before them.
+    """
+    channel = ProgressChannel()
+    token = _channel.set(channel)
+    try:
+        producer = asyncio.create_task(channel._pump(events))
+    finally:
+        _channel.reset(token)
+    try:
+        while True:
+            item = await channel._queue.get()
+            if isinstance(item, _Done):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        if not producer.done():
+            # The client went away; stop the agent rather than finish the turn.
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
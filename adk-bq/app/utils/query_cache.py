@@ -0,0 +1,226 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalize SQL text so that trivially different spellings share a key.
+
+    Whitespace runs outside of quoted strings and identifiers are collapsed to a
+    single space and trailing semicolons are dropped. Case is preserved because
+    BigQuery table names and string literals are case sensitive.
+
+    Args:
+        sql: The SQL text generated by the model
+
+    Returns:
+        The normalized SQL text
+    """
+    out: list[str] = []
+    quote: str | None = None
+    pending_space = False
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        if quote:
+            out.append(char)
+            if char == "\\" and i + 1 < len(sql):
+                out.append(sql[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char.isspace():
+            pending_space = True
+        else:
+            if pending_space and out:
+                out.append(" ")
+            pending_space = False
+            out.append(char)
+            if char in ("'", '"', "`"):
+                quote = char
+        i += 1
+    return "".join(out).rstrip("; ")
+
+
+class ResultCacheBackend(Protocol):
+    """Storage used by `QueryResultCache`.
+
+    Implementations must be safe to call from multiple threads.
+    """
+
+    def get(self, key: str) -> dict[str, Any] | None: ...
+
+    def add(self, key: str, value: dict[str, Any], ttl_seconds: float) -> bool:
+        """Store `value` unless a live entry for `key` exists. Returns True if stored."""
+        ...
+
+
+class InMemoryResultBackend:
+    """Process-local backend with TTL expiry and size-bounded LRU eviction."""
+
+    def __init__(
+        self, max_entries: int = 512, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self._max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def add(self, key: str, value: dict[str, Any], ttl_seconds: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._entries[key] = (now + ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+
+class RedisResultBackend:
+    """Shared backend for any Redis-compatible client (e.g. Memorystore).
+
+    The client is passed in so that `redis` stays an optional dependency.
+    """
+
+    def __init__(self, client: Any, prefix: str = "adk-bq:query:") -> None:
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        raw = self._client.get(self._prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def add(self, key: str, value: dict[str, Any], ttl_seconds: float) -> bool:
+        return bool(
+            self._client.set(
+                self._prefix + key,
+                json.dumps(value),
+                ex=max(1, int(ttl_seconds)),
+                nx=True,
+            )
+        )
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a cache."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class QueryResultCache:
+    """Read-through cache for BigQuery connector query results.
+
+    Entries are keyed on the normalized SQL, the remaining tool arguments and
+    the auth scope (the identity whose credentials ran the query), so results
+    are never served across users.
+    """
+
+    def __init__(
+        self,
+        backend: ResultCacheBackend,
+        ttl_seconds: float = 300.0,
+        ignored_args: tuple[str, ...] = (),
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            backend: Storage for cached results
+            ttl_seconds: How long a result may be served from the cache
+            ignored_args: Tool arguments that do not affect the result
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.ignored_args = ignored_args
+        self.stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    def make_key(self, sql: str, scope: str, args: Mapping[str, Any]) -> str:
+        """Build the cache key for a query run under `scope`."""
+        extra = {
+            name: value
+            for name, value in args.items()
+            if name not in self.ignored_args and name != "query"
+        }
+        material = json.dumps(
+            [scope, normalize_sql(sql), extra], sort_keys=True, default=str
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def lookup(self, key: str) -> dict[str, Any] | None:
+        """Return the cached result for `key` and update hit/miss counters."""
+        value = self.backend.get(key)
+        with self._stats_lock:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return value
+
+    def store(self, key: str, result: dict[str, Any]) -> None:
+        """Cache `result` for `key` unless a live entry already exists."""
+        if self.backend.add(key, result, self.ttl_seconds):
+            with self._stats_lock:
+                self.stats.stores += 1
+
+
+def redis_backend_from_url(url: str) -> RedisResultBackend:
+    """Create a `RedisResultBackend` from a redis:// URL.
+
+    Requires the optional `redis` package.
+    """
+    try:
+        import redis
+    except ImportError as e:
+        raise ImportError(
+            "QUERY_CACHE_REDIS_URL is set but the 'redis' package is not installed."
+        ) from e
+    return RedisResultBackend(redis.Redis.from_url(url))
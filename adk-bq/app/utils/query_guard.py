@@ -0,0 +1,404 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-flight cost check of the SQL the agent is about to run.
+
+`QueryCostGuard` parses a query with sqlglot and estimates the bytes BigQuery
+would scan from the schema snapshot: BigQuery stores tables by column, so a
+query scans the columns it references, narrowed to the partitions its filters
+select. Queries over the budget, and large scans of a partitioned table without
+a filter on the partition column, are rejected with a structured hint the model
+can act on. Queries without a LIMIT get one, so a result never grows unbounded;
+the decision reports the added LIMIT so the caller can flag truncated rows.
+"""
+
+import datetime
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.utils.schema_snapshot import SchemaSnapshot, _format_bytes
+
+# Approximate stored bytes per value, for types of a fixed width.
+_TYPE_WIDTHS = {
+    "BOOL": 1,
+    "BOOLEAN": 1,
+    "INT64": 8,
+    "INTEGER": 8,
+    "FLOAT64": 8,
+    "FLOAT": 8,
+    "DATE": 8,
+    "DATETIME": 8,
+    "TIME": 8,
+    "TIMESTAMP": 8,
+    "NUMERIC": 16,
+    "BIGNUMERIC": 32,
+}
+# Variable-width values are their length plus a 2 byte header.
+_DEFAULT_STRING_LENGTH = 16
+_DEFAULT_WIDTH = 64
+
+
+@dataclass
+class GuardDecision:
+    """Outcome of checking one query."""
+
+    sql: str
+    estimated_bytes: int | None = None
+    rewrites: list[str] = field(default_factory=list)
+    rejection: dict[str, Any] | None = None
+    # The LIMIT added to a query that had none.
+    limit_applied: int | None = None
+
+    @property
+    def allowed(self) -> bool:
+        return self.rejection is None
+
+    def report(self) -> dict[str, Any]:
+        """What the guard changed, to attach to the query's tool response."""
+        report: dict[str, Any] = {
+            "rewrites": list(self.rewrites),
+            "limit_applied": self.limit_applied,
+        }
+        if self.limit_applied:
+            report["note"] = (
+                f"The query had no LIMIT, so at most {self.limit_applied} rows "
+                f"were returned. If there are {self.limit_applied} rows the "
+                "result is truncated: say so, or aggregate in SQL."
+            )
+        return report
+
+
+class QueryCostGuard:
+    """Rejects expensive queries and bounds result sizes before they run."""
+
+    def __init__(
+        self,
+        snapshot_provider: Callable[[], SchemaSnapshot | None],
+        max_bytes: int = 10 * 1024**3,
+        partition_filter_bytes: int = 4 * 1024**3,
+        default_limit: int = 1000,
+    ) -> None:
+        """Initialize the guard.
+
+        Args:
+            snapshot_provider: Returns the metadata of the table queries run
+                against, or None when no snapshot has been captured
+            max_bytes: Estimated bytes scanned above which a query is rejected
+            partition_filter_bytes: Estimated bytes above which a query of a
+                partitioned table must filter on the partition column
+            default_limit: LIMIT added to queries that have none, 0 to disable
+        """
+        self.snapshot_provider = snapshot_provider
+        self.max_bytes = max_bytes
+        self.partition_filter_bytes = partition_filter_bytes
+        self.default_limit = default_limit
+
+    def check(self, sql: str) -> GuardDecision:
+        """Estimate, and if needed rewrite or reject, `sql`."""
+        # Imported on first use; sqlglot takes about 0.1s to import.
+        import sqlglot
+        from sqlglot import exp
+
+        try:
+            statements = [
+                s for s in sqlglot.parse(sql, read="bigquery") if s is not None
+            ]
+        except sqlglot.errors.ParseError as e:
+            # BigQuery reports syntax errors more helpfully than the parser.
+            logging.info(f"Cost guard could not parse the query, passing it on: {e}")
+            return GuardDecision(sql=sql)
+        if len(statements) != 1:
+            return GuardDecision(
+                sql=sql,
+                rejection=_rejection("Run exactly one SQL statement per call."),
+            )
+        query = statements[0]
+        if not isinstance(query, exp.Query):
+            return GuardDecision(
+                sql=sql,
+                rejection=_rejection("Only SELECT queries can be run."),
+            )
+
+        decision = GuardDecision(sql=sql)
+        snapshot = self.snapshot_provider()
+        if snapshot is not None:
+            self._check_cost(query, snapshot, decision)
+            if not decision.allowed:
+                return decision
+        if (
+            self.default_limit
+            and not query.args.get("limit")
+            and not _returns_single_row(query)
+        ):
+            query = query.limit(self.default_limit)
+            decision.sql = query.sql(dialect="bigquery")
+            decision.rewrites.append(f"added LIMIT {self.default_limit}")
+            decision.limit_applied = self.default_limit
+        return decision
+
+    def _check_cost(
+        self, query: Any, snapshot: SchemaSnapshot, decision: GuardDecision
+    ) -> None:
+        from sqlglot import exp
+
+        estimate = _estimate_scan(query, snapshot)
+        if estimate is None:
+            return
+        column_bytes, fraction, decision.estimated_bytes = estimate
+        partition = (snapshot.partitioning or {}).get("field")
+
+        suggestions = []
+        if len(column_bytes) == len(snapshot.columns) > 1:
+            suggestions.append(
+                "Select only the columns the answer needs instead of SELECT *."
+            )
+        if partition and fraction is None:
+            suggestions.append(f"Filter on the partition column `{partition}`.")
+        if not query.find(exp.AggFunc):
+            suggestions.append(
+                "Aggregate in SQL (COUNT, SUM, AVG with GROUP BY) rather than "
+                "reading raw rows."
+            )
+
+        if decision.estimated_bytes > self.max_bytes:
+            reason = (
+                f"Query would scan about {_format_bytes(decision.estimated_bytes)}, "
+                f"over the {_format_bytes(self.max_bytes)} budget."
+            )
+        elif (
+            partition
+            and fraction is None
+            and decision.estimated_bytes > self.partition_filter_bytes
+        ):
+            reason = (
+                f"Query scans about {_format_bytes(decision.estimated_bytes)} of "
+                f"`{snapshot.table}` without a filter on its partition column "
+                f"`{partition}`."
+            )
+        else:
+            return
+        details: dict[str, Any] = {
+            "estimated_bytes": decision.estimated_bytes,
+            "max_bytes": self.max_bytes,
+            "table": snapshot.table,
+            "largest_columns": [
+                name
+                for name, _ in sorted(column_bytes.items(), key=lambda item: -item[1])[
+                    :5
+                ]
+            ],
+            "suggestions": suggestions,
+        }
+        if partition:
+            column = snapshot.column(partition)
+            details["partition_column"] = partition
+            if column is not None and column.min_value is not None:
+                details["partition_range"] = [column.min_value, column.max_value]
+        decision.rejection = _rejection(reason, details)
+
+
+def _rejection(reason: str, details: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Tool response returned instead of running a rejected query."""
+    response: dict[str, Any] = {
+        "error": f"Query not run: {reason} Rewrite the query and call the tool again."
+    }
+    if details:
+        response["cost_guard"] = details
+    return response
+
+
+def estimate_scan_bytes(query: Any, snapshot: SchemaSnapshot) -> int | None:
+    """Estimated bytes a parsed query scans of the snapshot's table.
+
+    Returns None when the query does not read the table.
+    """
+    estimate = _estimate_scan(query, snapshot)
+    return None if estimate is None else estimate[2]
+
+
+def _estimate_scan(
+    query: Any, snapshot: SchemaSnapshot
+) -> tuple[dict[str, int], float | None, int] | None:
+    """Bytes of each column read, the partition fraction and the total."""
+    from sqlglot import exp
+
+    scans = [
+        table for table in query.find_all(exp.Table) if _is_table(table, snapshot.table)
+    ]
+    if not scans:
+        return None
+    widths = _column_bytes(snapshot)
+    if any(
+        isinstance(star.parent, exp.Select | exp.Column)
+        for star in query.find_all(exp.Star)
+    ):
+        columns = set(widths)
+    else:
+        referenced = {column.name.lower() for column in query.find_all(exp.Column)}
+        columns = {name for name in widths if name.lower() in referenced}
+    column_bytes = {name: widths[name] for name in columns}
+
+    # Each scan is narrowed by the filters of the SELECT that reads the table,
+    # which may be a CTE or subquery rather than the outermost query.
+    fraction = None
+    partition = (snapshot.partitioning or {}).get("field")
+    if partition:
+        fractions = [_scan_fraction(table, partition, snapshot) for table in scans]
+        if None not in fractions:
+            fraction = sum(f for f in fractions if f is not None) / len(fractions)
+    full_bytes = sum(column_bytes.values()) * len(scans)
+    return (
+        column_bytes,
+        fraction,
+        int(full_bytes * (fraction if fraction is not None else 1.0)),
+    )
+
+
+def _scan_fraction(
+    table: Any, partition: str, snapshot: SchemaSnapshot
+) -> float | None:
+    """Fraction of the partitions one reference to the table reads.
+
+    The WHERE of the SELECT reading the table is used; when it does not bound
+    the partition column, the enclosing SELECTs are tried, as BigQuery pushes
+    their filters down into simple subqueries.
+    """
+    from sqlglot import exp
+
+    select = table.find_ancestor(exp.Select)
+    while select is not None:
+        fraction = _partition_fraction(select.args.get("where"), partition, snapshot)
+        if fraction is not None:
+            return fraction
+        select = select.find_ancestor(exp.Select)
+    return None
+
+
+def _is_table(table: Any, table_id: str) -> bool:
+    """True if `table` names `table_id`, fully qualified or not."""
+    referenced = [part for part in (table.catalog, table.db, table.name) if part]
+    # `project.dataset.table` in one backquoted identifier is parsed as the name.
+    referenced = ".".join(referenced).lower().split(".")
+    expected = table_id.lower().split(".")
+    return expected[-len(referenced) :] == referenced
+
+
+def _column_bytes(snapshot: SchemaSnapshot) -> dict[str, int]:
+    """Estimated stored bytes of each column, scaled to the table's size."""
+    widths = {}
+    for column in snapshot.columns:
+        if column.type in ("STRING", "BYTES"):
+            width = 2 + (column.avg_length or _DEFAULT_STRING_LENGTH)
+        else:
+            width = _TYPE_WIDTHS.get(column.type, _DEFAULT_WIDTH)
+        widths[column.name] = width * (1 - (column.null_fraction or 0.0))
+    total = sum(widths.values()) * snapshot.num_rows
+    scale = snapshot.num_bytes / total if total and snapshot.num_bytes else 1.0
+    return {
+        name: int(width * snapshot.num_rows * scale) for name, width in widths.items()
+    }
+
+
+def _returns_single_row(query: Any) -> bool:
+    """True for a SELECT of only aggregates without GROUP BY, e.g. COUNT(*)."""
+    from sqlglot import exp
+
+    return (
+        isinstance(query, exp.Select)
+        and not query.args.get("group")
+        and all(projection.find(exp.AggFunc) for projection in query.expressions)
+    )
+
+
+def _parse_time(value: str) -> datetime.datetime | None:
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip()[:19])
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def _partition_fraction(
+    where: Any, partition: str, snapshot: SchemaSnapshot
+) -> float | None:
+    """Fraction of the partitions selected by the top-level filters of `where`.
+
+    Only conditions ANDed at the top level are used, as anything under an OR
+    may select every partition. Returns None when no condition bounds the
+    partition column.
+    """
+    from sqlglot import exp
+
+    if where is None:
+        return None
+    column = snapshot.column(partition)
+    if column is None or column.min_value is None or column.max_value is None:
+        return None
+    first, last = _parse_time(column.min_value), _parse_time(column.max_value)
+    if first is None or last is None or last <= first:
+        return None
+
+    low, high = first, last
+    bounded = False
+    for condition in (
+        where.this.flatten() if isinstance(where.this, exp.And) else [where.this]
+    ):
+        if isinstance(condition, exp.Between) and _is_partition(
+            condition.this, partition
+        ):
+            bounds = [(">=", condition.args["low"]), ("<=", condition.args["high"])]
+        elif isinstance(condition, exp.GT | exp.GTE | exp.LT | exp.LTE | exp.EQ):
+            op = {exp.GT: ">", exp.GTE: ">=", exp.LT: "<", exp.LTE: "<=", exp.EQ: "="}[
+                type(condition)
+            ]
+            if _is_partition(condition.this, partition):
+                bounds = [(op, condition.expression)]
+            elif _is_partition(condition.expression, partition):
+                flipped = {">": "<", ">=": "<=", "<": ">", "<=": ">=", "=": "="}
+                bounds = [(flipped[op], condition.this)]
+            else:
+                continue
+        else:
+            continue
+        for op, value in bounds:
+            literal = (
+                value if isinstance(value, exp.Literal) else value.find(exp.Literal)
+            )
+            moment = _parse_time(literal.name) if literal is not None else None
+            if moment is None:
+                continue
+            bounded = True
+            if op in (">", ">=", "="):
+                low = max(low, moment)
+            if op in ("<", "<=", "="):
+                high = min(
+                    high, moment + datetime.timedelta(days=1) if op == "=" else moment
+                )
+    if not bounded:
+        return None
+    return max(0.0, min(1.0, (high - low) / (last - first)))
+
+
+def _is_partition(node: Any, partition: str) -> bool:
+    """True for the partition column, bare or wrapped as in DATE(column)."""
+    from sqlglot import exp
+
+    if isinstance(node, exp.Column):
+        return node.name.lower() == partition.lower()
+    if isinstance(node, exp.Func):
+        column = node.find(exp.Column)
+        return column is not None and column.name.lower() == partition.lower()
+    return False
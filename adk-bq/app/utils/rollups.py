@@ -0,0 +1,556 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-aggregated rollups of the Citi Bike table and routing of queries to them.
+
+Most questions are aggregates over a few dimensions: trips per day, per
+station, per rider type. A rollup is a summary table grouped by such
+dimensions that holds the number of trips and, for each measure column, its
+sum, count, minimum and maximum per group. Rollups are built ahead of time
+(`make rollups`), which also writes a manifest of the tables built.
+`RollupRouter` rewrites a generated query to read the smallest rollup that
+answers it exactly; any query it cannot prove equivalent runs unchanged.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+import click
+
+from app.utils.query_guard import _is_table, _parse_time, estimate_scan_bytes
+from app.utils.schema_snapshot import (
+    DEFAULT_SNAPSHOT_PATH,
+    DEFAULT_TABLE,
+    SchemaSnapshot,
+    _format_bytes,
+    load_snapshot,
+)
+
+DEFAULT_ROLLUP_MANIFEST_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "rollups.json"
+)
+ROLLUP_MANIFEST_FORMAT_VERSION = 1
+TRIPS_COLUMN = "trips"
+
+
+@dataclass
+class Rollup:
+    """A summary of the base table grouped by its dimensions.
+
+    Each row holds `trips`, the number of rows in its group, and for each
+    measure column `m` the columns `sum_m`, `count_m`, `min_m` and `max_m`.
+    """
+
+    name: str
+    # Output column name -> expression over the base table.
+    dimensions: dict[str, str]
+    measures: tuple[str, ...] = ()
+    partition_by: str | None = None
+    cluster_by: tuple[str, ...] = ()
+
+    @property
+    def version(self) -> str:
+        """Content hash of the definition; a changed rollup must be rebuilt."""
+        material = json.dumps([self.dimensions, list(self.measures)], sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()[:12]
+
+    def select_sql(self, base_table: str) -> str:
+        """The query computing the rollup from `base_table`."""
+        selects = [
+            expression if expression == name else f"{expression} AS {name}"
+            for name, expression in self.dimensions.items()
+        ]
+        selects.append(f"COUNT(*) AS {TRIPS_COLUMN}")
+        for measure in self.measures:
+            selects += [
+                f"SUM({measure}) AS sum_{measure}",
+                f"COUNT({measure}) AS count_{measure}",
+                f"MIN({measure}) AS min_{measure}",
+                f"MAX({measure}) AS max_{measure}",
+            ]
+        return (
+            f"SELECT {', '.join(selects)} FROM `{base_table}` "
+            f"GROUP BY {', '.join(self.dimensions)}"
+        )
+
+    def create_sql(self, base_table: str, table_id: str) -> str:
+        """DDL that (re)builds the rollup as `table_id`."""
+        options = ""
+        if self.partition_by:
+            options += f" PARTITION BY DATE_TRUNC({self.partition_by}, MONTH)"
+        if self.cluster_by:
+            options += f" CLUSTER BY {', '.join(self.cluster_by)}"
+        return (
+            f"CREATE OR REPLACE TABLE `{table_id}`{options} AS "
+            f"{self.select_sql(base_table)}"
+        )
+
+
+DAILY_STATION_TRIPS = Rollup(
+    name="citibike_daily_station_trips",
+    dimensions={
+        "trip_date": "DATE(starttime)",
+        "start_station_id": "start_station_id",
+        "start_station_name": "start_station_name",
+        "usertype": "usertype",
+        "gender": "gender",
+    },
+    measures=("tripduration",),
+    partition_by="trip_date",
+    cluster_by=("start_station_id",),
+)
+HOURLY_USAGE = Rollup(
+    name="citibike_hourly_usage",
+    dimensions={
+        "trip_date": "DATE(starttime)",
+        "trip_hour": "EXTRACT(HOUR FROM starttime)",
+        "usertype": "usertype",
+        "gender": "gender",
+    },
+    measures=("tripduration",),
+    partition_by="trip_date",
+)
+DEFAULT_ROLLUPS = (DAILY_STATION_TRIPS, HOURLY_USAGE)
+
+
+@dataclass
+class MaterializedRollup:
+    """A rollup table as built by `materialize_rollups`."""
+
+    table: str
+    version: str
+    refreshed_at: str
+    num_rows: int
+    num_bytes: int
+
+
+@dataclass
+class RollupManifest:
+    """The rollup tables built from a base table."""
+
+    base_table: str
+    # Schema version of the base table the rollups were built from.
+    base_version: str | None
+    rollups: dict[str, MaterializedRollup] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"format_version": ROLLUP_MANIFEST_FORMAT_VERSION, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RollupManifest":
+        return cls(
+            base_table=data["base_table"],
+            base_version=data.get("base_version"),
+            rollups={
+                name: MaterializedRollup(**rollup)
+                for name, rollup in data["rollups"].items()
+            },
+        )
+
+
+def save_manifest(manifest: RollupManifest, path: str) -> None:
+    """Write `manifest` to `path` as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest.to_dict(), f, indent=2)
+
+
+def load_manifest(path: str) -> RollupManifest | None:
+    """Load a manifest from `path`, returning None if it is missing or invalid."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return RollupManifest.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable rollup manifest {path}: {e}")
+        return None
+
+
+@dataclass
+class RouteDecision:
+    """Where one query runs."""
+
+    sql: str
+    rollup: str | None = None
+    estimated_bytes_saved: int | None = None
+    # Why the query was not routed, for logging.
+    reason: str | None = None
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "rollup": self.rollup,
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+        }
+
+
+class _NotRoutable(Exception):
+    pass
+
+
+class RollupRouter:
+    """Rewrites aggregate queries of the base table to read a rollup.
+
+    A query is routed only when the result is provably the same: it reads
+    the base table alone, aggregates, and every column it uses outside an
+    aggregate is a rollup dimension. Its aggregates must be derivable from
+    the rollup's columns: COUNT(*), COUNT, SUM, AVG, MIN and MAX of a measure,
+    MIN, MAX and COUNT(DISTINCT) of a dimension. Filters on the raw timestamp
+    are accepted when they fall on day boundaries, e.g.
+    `starttime >= '2018-01-01' AND starttime < '2018-02-01'`.
+    """
+
+    def __init__(
+        self,
+        manifest: RollupManifest | None,
+        rollups: Sequence[Rollup] = DEFAULT_ROLLUPS,
+        snapshot_provider: Callable[[], SchemaSnapshot | None] = lambda: None,
+    ) -> None:
+        """Initialize the router.
+
+        Args:
+            manifest: The rollup tables built, or None if none have been
+            rollups: Definitions of the rollups; built tables whose definition
+                has changed since are not used
+            snapshot_provider: Returns the current schema snapshot of the base
+                table, used to estimate the bytes saved and to detect schema
+                changes since the rollups were built
+        """
+        self.manifest = manifest
+        self.rollups = rollups
+        self.snapshot_provider = snapshot_provider
+
+    def route(self, sql: str) -> RouteDecision:
+        """Return `sql` rewritten to read the smallest rollup answering it."""
+        if self.manifest is None or not self.manifest.rollups:
+            return RouteDecision(sql=sql, reason="no rollups have been built")
+        snapshot = self.snapshot_provider()
+        if (
+            snapshot is not None
+            and self.manifest.base_version is not None
+            and snapshot.version != self.manifest.base_version
+        ):
+            return RouteDecision(
+                sql=sql,
+                reason=f"rollups were built for schema {self.manifest.base_version}",
+            )
+
+        import sqlglot
+
+        try:
+            statements = [
+                s for s in sqlglot.parse(sql, read="bigquery") if s is not None
+            ]
+        except sqlglot.errors.ParseError:
+            return RouteDecision(sql=sql, reason="the query could not be parsed")
+        if len(statements) != 1:
+            return RouteDecision(sql=sql, reason="not a single statement")
+        query = statements[0]
+        reason = _unroutable_reason(query, self.manifest.base_table)
+        if reason is not None:
+            return RouteDecision(sql=sql, reason=reason)
+
+        best = None
+        for rollup in self.rollups:
+            materialized = self.manifest.rollups.get(rollup.name)
+            if materialized is None or materialized.version != rollup.version:
+                continue
+            try:
+                rewritten = _rewrite(query, rollup, materialized.table)
+            except _NotRoutable:
+                continue
+            if best is None or materialized.num_bytes < best[1].num_bytes:
+                best = (rollup, materialized, rewritten)
+        if best is None:
+            return RouteDecision(
+                sql=sql, reason="no rollup has the columns and aggregates it uses"
+            )
+        rollup, materialized, rewritten = best
+        return RouteDecision(
+            sql=rewritten.sql(dialect="bigquery"),
+            rollup=rollup.name,
+            estimated_bytes_saved=_bytes_saved(
+                query, rewritten, rollup, materialized, snapshot
+            ),
+        )
+
+
+def _unroutable_reason(query: Any, base_table: str) -> str | None:
+    """Why `query` cannot be answered from any rollup, or None."""
+    from sqlglot import exp
+
+    if not isinstance(query, exp.Select):
+        return "not a SELECT"
+    tables = list(query.find_all(exp.Table))
+    if len(tables) != 1 or not _is_table(tables[0], base_table):
+        return "does not read the base table alone"
+    if any(select is not query for select in query.find_all(exp.Select)) or query.find(
+        exp.With, exp.Join, exp.Window, exp.Qualify, exp.Unnest, exp.TableSample
+    ):
+        return "uses subqueries, joins or window functions"
+    if not (
+        query.args.get("group")
+        or query.args.get("distinct")
+        or any(projection.find(exp.AggFunc) for projection in query.expressions)
+    ):
+        return "does not aggregate"
+    return None
+
+
+def _normalize(node: Any) -> str:
+    """Comparable form of an expression over the single table read."""
+    from sqlglot import exp
+
+    node = node.copy()
+    for column in node.find_all(exp.Column):
+        for part in ("table", "db", "catalog"):
+            column.set(part, None)
+    if isinstance(node, exp.Cast) and node.to.is_type("date"):
+        node = exp.Date(this=node.this)
+    return node.sql(dialect="bigquery").lower()
+
+
+def _rewrite(query: Any, rollup: Rollup, table_id: str) -> Any:
+    """`query` reading `table_id`, raising `_NotRoutable` if it cannot."""
+    import sqlglot
+    from sqlglot import exp
+
+    dimensions = {}
+    day_columns = {}
+    for name, expression in rollup.dimensions.items():
+        parsed = sqlglot.parse_one(expression, read="bigquery")
+        dimensions[_normalize(parsed)] = name
+        if isinstance(parsed, exp.Date) and isinstance(parsed.this, exp.Column):
+            day_columns[parsed.this.name.lower()] = name
+    measures = {measure.lower() for measure in rollup.measures}
+    aliases = {
+        projection.alias.lower()
+        for projection in query.expressions
+        if isinstance(projection, exp.Alias)
+    }
+
+    def dimension(node: Any) -> str | None:
+        if not isinstance(node, exp.Column | exp.Func):
+            return None
+        return dimensions.get(_normalize(node))
+
+    def aggregate(node: Any) -> Any:
+        argument = node.this
+        if isinstance(argument, exp.Distinct):
+            if not isinstance(node, exp.Count):
+                raise _NotRoutable
+            columns = []
+            for expression in argument.expressions:
+                name = dimension(expression)
+                if name is None:
+                    raise _NotRoutable
+                columns.append(exp.column(name))
+            return exp.Count(this=exp.Distinct(expressions=columns))
+        measure = None
+        if isinstance(argument, exp.Column) and argument.name.lower() in measures:
+            measure = argument.name.lower()
+        if isinstance(node, exp.Count):
+            if isinstance(argument, exp.Star | exp.Literal):
+                # SUM over no rows is NULL where COUNT is 0.
+                return sqlglot.parse_one(f"COALESCE(SUM({TRIPS_COLUMN}), 0)")
+            if measure:
+                return sqlglot.parse_one(f"COALESCE(SUM(count_{measure}), 0)")
+        elif isinstance(node, exp.Sum) and measure:
+            return sqlglot.parse_one(f"SUM(sum_{measure})")
+        elif isinstance(node, exp.Avg) and measure:
+            return sqlglot.parse_one(
+                f"SAFE_DIVIDE(SUM(sum_{measure}), SUM(count_{measure}))",
+                read="bigquery",
+            )
+        elif isinstance(node, exp.Min | exp.Max):
+            function = "MIN" if isinstance(node, exp.Min) else "MAX"
+            if measure:
+                return sqlglot.parse_one(f"{function}({function.lower()}_{measure})")
+            name = dimension(argument)
+            if name is not None:
+                return sqlglot.parse_one(f"{function}({name})")
+        raise _NotRoutable
+
+    def day_boundary(node: Any) -> Any:
+        """`column >= day` or `column < day` as a filter on the date dimension."""
+        column, value = node.this, node.expression
+        if not isinstance(column, exp.Column) or column.name.lower() not in day_columns:
+            return None
+        if isinstance(value, exp.Cast):
+            value = value.this
+        if not isinstance(value, exp.Literal) or not value.is_string:
+            return None
+        moment = _parse_time(value.name)
+        if moment is None or moment.time() != datetime.time(0):
+            return None
+        return type(node)(
+            this=exp.column(day_columns[column.name.lower()]),
+            expression=exp.Literal.string(moment.date().isoformat()),
+        )
+
+    def replace(node: Any) -> Any:
+        if isinstance(node, exp.AggFunc):
+            return aggregate(node)
+        if isinstance(node, exp.GTE | exp.LT):
+            boundary = day_boundary(node)
+            if boundary is not None:
+                return boundary
+        name = dimension(node)
+        if name is not None:
+            return exp.column(name)
+        if isinstance(node, exp.Column):
+            # GROUP BY, HAVING and ORDER BY may name a column of the result.
+            if node.name.lower() in aliases and node.find_ancestor(
+                exp.Group, exp.Having, exp.Order
+            ):
+                return node
+            raise _NotRoutable
+        if isinstance(node, exp.Star):
+            raise _NotRoutable
+        if isinstance(node, exp.Table):
+            return exp.Table(
+                this=exp.to_identifier(table_id, quoted=True),
+                alias=node.args.get("alias"),
+            )
+        return node
+
+    rewritten = query.transform(replace)
+    for before, after in zip(query.expressions, rewritten.expressions, strict=True):
+        # BigQuery names an unaliased expression f0_, f1_, ... but a column
+        # after itself, so an expression must not become a column.
+        if not isinstance(before, exp.Alias | exp.Column) and isinstance(
+            after, exp.Column
+        ):
+            raise _NotRoutable
+    return rewritten
+
+
+def _bytes_saved(
+    query: Any,
+    rewritten: Any,
+    rollup: Rollup,
+    materialized: MaterializedRollup,
+    snapshot: SchemaSnapshot | None,
+) -> int | None:
+    """Estimated bytes the base table query would scan over the rollup query.
+
+    The rollup's columns are assumed to be of equal width, and its
+    partitions are not pruned, so the saving is understated.
+    """
+    from sqlglot import exp
+
+    if snapshot is None:
+        return None
+    base_bytes = estimate_scan_bytes(query, snapshot)
+    if base_bytes is None:
+        return None
+    columns = [*rollup.dimensions, TRIPS_COLUMN]
+    for measure in rollup.measures:
+        columns += [f"{kind}_{measure}" for kind in ("sum", "count", "min", "max")]
+    referenced = {column.name.lower() for column in rewritten.find_all(exp.Column)}
+    read = sum(1 for column in columns if column.lower() in referenced)
+    rollup_bytes = materialized.num_bytes * max(read, 1) // len(columns)
+    return max(0, base_bytes - rollup_bytes)
+
+
+def materialize_rollups(
+    client: Any,
+    rollups: Sequence[Rollup] = DEFAULT_ROLLUPS,
+    base_table: str = DEFAULT_TABLE,
+    dataset: str | None = None,
+    base_version: str | None = None,
+) -> RollupManifest:
+    """Build or rebuild each rollup of `base_table`.
+
+    Args:
+        client: A `google.cloud.bigquery.Client`
+        rollups: The rollups to build
+        base_table: Fully qualified ID of the table summarized
+        dataset: `project.dataset` the rollups are written to, by default
+            the base table's
+        base_version: Schema version of the base table
+
+    Returns:
+        The manifest of the rollup tables built
+    """
+    dataset = dataset or base_table.rsplit(".", 1)[0]
+    manifest = RollupManifest(base_table=base_table, base_version=base_version)
+    for rollup in rollups:
+        table_id = f"{dataset}.{rollup.name}"
+        logging.info(f"Building rollup {table_id}")
+        client.query(rollup.create_sql(base_table, table_id)).result()
+        table = client.get_table(table_id)
+        manifest.rollups[rollup.name] = MaterializedRollup(
+            table=table_id,
+            version=rollup.version,
+            refreshed_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            num_rows=table.num_rows or 0,
+            num_bytes=table.num_bytes or 0,
+        )
+    return manifest
+
+
+@click.command()
+@click.option("--table", default=DEFAULT_TABLE, help="Fully qualified table ID")
+@click.option(
+    "--dataset", default=None, help="Dataset to write the rollups to (project.dataset)"
+)
+@click.option(
+    "--output", default=DEFAULT_ROLLUP_MANIFEST_PATH, help="Manifest file to write"
+)
+@click.option("--project", default=None, help="Project to run the queries in")
+@click.option("--dry-run", is_flag=True, help="Print the DDL instead of running it")
+def refresh_rollups(
+    table: str, dataset: str | None, output: str, project: str | None, dry_run: bool
+) -> None:
+    """Build the rollups of TABLE and record them in OUTPUT."""
+    logging.basicConfig(level=logging.INFO)
+    if dry_run:
+        for rollup in DEFAULT_ROLLUPS:
+            target = f"{dataset or table.rsplit('.', 1)[0]}.{rollup.name}"
+            click.echo(rollup.create_sql(table, target) + ";")
+        return
+
+    from google.cloud import bigquery
+
+    snapshot = load_snapshot(DEFAULT_SNAPSHOT_PATH)
+    if snapshot is None or snapshot.table != table:
+        logging.warning(
+            "No schema snapshot of the table; the rollups will not be checked "
+            "against later schema changes. Run `make schema-snapshot` first."
+        )
+        snapshot = None
+    manifest = materialize_rollups(
+        bigquery.Client(project=project),
+        base_table=table,
+        dataset=dataset,
+        base_version=snapshot.version if snapshot else None,
+    )
+    save_manifest(manifest, output)
+    for name, materialized in manifest.rollups.items():
+        logging.info(
+            f"{name}: {materialized.num_rows:,} rows, "
+            f"{_format_bytes(materialized.num_bytes)}"
+        )
+    logging.info(f"Wrote rollup manifest to {output}")
+
+
+if __name__ == "__main__":
+    refresh_rollups()
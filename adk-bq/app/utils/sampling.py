@@ -0,0 +1,376 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Head and tail sampling policies for the agent telemetry pipeline.
+
+Head sampling keeps a configurable ratio of spans per operation (span name
+prefix). A span whose parent is sampled is always sampled, so a kept span is
+exported with everything below it. Other decisions depend only on the trace ID,
+so an operation with a higher ratio is kept in every trace where one with a
+lower ratio is.
+
+Tail sampling additionally keeps every span of traces that were slow, had an
+error, or later received low user feedback. It needs all spans to be
+recorded, so it happens in `TailSamplingSpanProcessor` rather than in the
+sampler.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_ON,
+    Decision,
+    Sampler,
+    SamplingResult,
+)
+from opentelemetry.trace import Link, SpanKind, StatusCode, get_current_span
+from opentelemetry.util.types import Attributes
+
+INVOCATION_ID_ATTRIBUTE = "gcp.vertex.agent.invocation_id"
+_TRACE_ID_LIMIT = (1 << 64) - 1
+
+
+def trace_id_sampled(trace_id: int, ratio: float) -> bool:
+    """Return the deterministic sampling decision for `trace_id` at `ratio`.
+
+    Uses the same bound as OpenTelemetry's `TraceIdRatioBased` sampler.
+    """
+    return trace_id & _TRACE_ID_LIMIT < round(ratio * (_TRACE_ID_LIMIT + 1))
+
+
+def parse_ratios(value: str) -> dict[str, float]:
+    """Parse `"call_llm=0.1,execute_tool=0.5"` into a ratio per operation."""
+    ratios = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        operation, _, ratio = item.partition("=")
+        ratios[operation.strip()] = _ratio(ratio, f"ratio of {operation.strip()}")
+    return ratios
+
+
+def _ratio(value: str, name: str) -> float:
+    ratio = float(value)
+    if not 0.0 <= ratio <= 1.0:
+        raise ValueError(f"Sampling {name} must be between 0 and 1, got {value}")
+    return ratio
+
+
+@dataclass
+class SamplingPolicy:
+    """Which spans and attributes of the agent telemetry are exported."""
+
+    default_ratio: float = 1.0
+    operation_ratios: dict[str, float] = field(default_factory=dict)
+    tail_sampling: bool = False
+    tail_latency_seconds: float = 10.0
+    tail_feedback_max_score: float = 2.0
+    tail_feedback_window_seconds: float = 300.0
+    tail_max_traces: int = 1000
+    large_attribute_ratio: float = 1.0
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "SamplingPolicy":
+        """Build the policy from the `TRACE_*` environment variables."""
+        return cls(
+            default_ratio=_ratio(
+                environ.get("TRACE_SAMPLE_RATIO", "1.0"), "TRACE_SAMPLE_RATIO"
+            ),
+            operation_ratios=parse_ratios(environ.get("TRACE_SAMPLE_RATIOS", "")),
+            tail_sampling=environ.get("TRACE_TAIL_SAMPLING", "false").lower() == "true",
+            tail_latency_seconds=float(environ.get("TRACE_TAIL_LATENCY_SECONDS", "10")),
+            tail_feedback_max_score=float(
+                environ.get("TRACE_TAIL_FEEDBACK_MAX_SCORE", "2")
+            ),
+            tail_feedback_window_seconds=float(
+                environ.get("TRACE_TAIL_FEEDBACK_WINDOW_SECONDS", "300")
+            ),
+            tail_max_traces=int(environ.get("TRACE_TAIL_MAX_TRACES", "1000")),
+            large_attribute_ratio=_ratio(
+                environ.get("TRACE_LARGE_ATTRIBUTE_RATIO", "1.0"),
+                "TRACE_LARGE_ATTRIBUTE_RATIO",
+            ),
+        )
+
+    def ratio_for(self, span_name: str) -> float:
+        """Return the head sampling ratio of the operation `span_name` belongs to.
+
+        The longest configured operation that prefixes the span name wins, so
+        `execute_tool` covers every `execute_tool <name>` span.
+        """
+        best = ""
+        for operation in self.operation_ratios:
+            if span_name.startswith(operation) and len(operation) > len(best):
+                best = operation
+        return self.operation_ratios[best] if best else self.default_ratio
+
+    def head_sampled(self, span_name: str, trace_id: int) -> bool:
+        return trace_id_sampled(trace_id, self.ratio_for(span_name))
+
+    def keep_large_attributes(self, trace_id: int) -> bool:
+        return trace_id_sampled(trace_id, self.large_attribute_ratio)
+
+    def sampler(self) -> Sampler:
+        """Return the sampler to install on the `TracerProvider`.
+
+        With tail sampling every span must be recorded, so the head policy is
+        applied by `TailSamplingSpanProcessor` instead.
+        """
+        if self.tail_sampling:
+            return ALWAYS_ON
+        return OperationRatioSampler(self)
+
+
+class OperationRatioSampler(Sampler):
+    """Head sampler applying a `SamplingPolicy`'s per-operation ratios.
+
+    Children of a sampled span, local or remote, are always sampled; the
+    operation's ratio decides for root spans and children of dropped spans.
+    """
+
+    def __init__(self, policy: SamplingPolicy) -> None:
+        self.policy = policy
+
+    def should_sample(
+        self,
+        parent_context: Context | None,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: Any = None,
+    ) -> SamplingResult:
+        parent_span_context = get_current_span(parent_context).get_span_context()
+        if (
+            parent_span_context.is_valid and parent_span_context.trace_flags.sampled
+        ) or self.policy.head_sampled(name, trace_id):
+            decision = Decision.RECORD_AND_SAMPLE
+        else:
+            decision = Decision.DROP
+        return SamplingResult(
+            decision,
+            attributes if decision == Decision.RECORD_AND_SAMPLE else None,
+            parent_span_context.trace_state if parent_span_context else None,
+        )
+
+    def get_description(self) -> str:
+        return (
+            f"OperationRatioSampler{{default={self.policy.default_ratio}, "
+            f"operations={self.policy.operation_ratios}}}"
+        )
+
+
+@dataclass
+class _Trace:
+    spans: list[ReadableSpan] = field(default_factory=list)
+    invocation_ids: set[str] = field(default_factory=set)
+    finished: bool = False
+
+
+@dataclass
+class TailSamplingStats:
+    """Counts of traces by tail sampling outcome."""
+
+    kept_slow: int = 0
+    kept_error: int = 0
+    kept_feedback: int = 0
+    head_only: int = 0
+    evicted: int = 0
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """Buffers the spans of each trace and decides what to export when it ends.
+
+    When the local root span ends, every span of the trace is handed to the
+    wrapped processor if the root took at least `tail_latency_seconds` or any
+    span has an error status. Otherwise only the spans selected by the head
+    policy are, and the rest is held for `tail_feedback_window_seconds` in
+    case `record_feedback` reports a low score for one of the trace's
+    invocations. At most `tail_max_traces` traces are buffered.
+    """
+
+    def __init__(
+        self,
+        next_processor: SpanProcessor,
+        policy: SamplingPolicy,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param next_processor: Processor that exports the kept spans
+        :param policy: Head policy and tail thresholds
+        :param clock: Source of the current time in seconds
+        """
+        self.next_processor = next_processor
+        self.policy = policy
+        self.stats = TailSamplingStats()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._traces: OrderedDict[int, _Trace] = OrderedDict()
+        self._invocations: dict[str, int] = {}
+        # Finished traces held for feedback, with their deadline.
+        self._held: OrderedDict[int, float] = OrderedDict()
+        # Traces already exported in full; late spans of these follow directly.
+        self._kept: OrderedDict[int, None] = OrderedDict()
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        self.next_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        export: list[ReadableSpan] = []
+        with self._lock:
+            self._expire_locked()
+            if trace_id in self._kept:
+                export.append(span)
+            else:
+                trace = self._traces.get(trace_id)
+                if trace is None:
+                    trace = self._traces[trace_id] = _Trace()
+                    export.extend(self._evict_locked())
+                invocation_id = (span.attributes or {}).get(INVOCATION_ID_ATTRIBUTE)
+                if invocation_id:
+                    trace.invocation_ids.add(str(invocation_id))
+                    self._invocations[str(invocation_id)] = trace_id
+                if trace.finished and self.policy.head_sampled(span.name, trace_id):
+                    export.append(span)
+                else:
+                    trace.spans.append(span)
+                if not trace.finished and (
+                    span.parent is None or span.parent.is_remote
+                ):
+                    export.extend(self._finish_locked(trace_id, trace, span))
+        for kept in export:
+            self.next_processor.on_end(kept)
+
+    def record_feedback(self, invocation_id: str, score: float) -> bool:
+        """Export the held spans of the invocation's trace if `score` is low.
+
+        :return: True if spans were exported because of the feedback
+        """
+        if score > self.policy.tail_feedback_max_score:
+            return False
+        with self._lock:
+            trace_id = self._invocations.get(invocation_id)
+            if trace_id is None:
+                return False
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return False
+            self.stats.kept_feedback += 1
+            export = self._keep_locked(trace_id, trace)
+        for span in export:
+            self.next_processor.on_end(span)
+        return True
+
+    def shutdown(self) -> None:
+        self.next_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.next_processor.force_flush(timeout_millis)
+
+    def _finish_locked(
+        self, trace_id: int, trace: _Trace, root: ReadableSpan
+    ) -> list[ReadableSpan]:
+        duration = ((root.end_time or 0) - (root.start_time or 0)) / 1e9
+        if duration >= self.policy.tail_latency_seconds:
+            self.stats.kept_slow += 1
+            return self._keep_locked(trace_id, trace)
+        if any(s.status.status_code == StatusCode.ERROR for s in trace.spans):
+            self.stats.kept_error += 1
+            return self._keep_locked(trace_id, trace)
+        self.stats.head_only += 1
+        export, held = _partition(trace.spans, trace_id, self.policy)
+        trace.spans = held
+        trace.finished = True
+        if trace.invocation_ids:
+            self._held[trace_id] = (
+                self._clock() + self.policy.tail_feedback_window_seconds
+            )
+        else:
+            # No feedback can refer to this trace.
+            self._drop_locked(trace_id)
+        return export
+
+    def _keep_locked(self, trace_id: int, trace: _Trace) -> list[ReadableSpan]:
+        self._drop_locked(trace_id)
+        self._kept[trace_id] = None
+        while len(self._kept) > self.policy.tail_max_traces:
+            self._kept.popitem(last=False)
+        return trace.spans
+
+    def _drop_locked(self, trace_id: int) -> None:
+        self._held.pop(trace_id, None)
+        trace = self._traces.pop(trace_id, None)
+        if trace is None:
+            return
+        for invocation_id in trace.invocation_ids:
+            if self._invocations.get(invocation_id) == trace_id:
+                del self._invocations[invocation_id]
+
+    def _expire_locked(self) -> None:
+        # The feedback window is fixed, so held traces expire in order.
+        now = self._clock()
+        while self._held:
+            trace_id, deadline = next(iter(self._held.items()))
+            if deadline > now:
+                break
+            self._drop_locked(trace_id)
+
+    def _evict_locked(self) -> list[ReadableSpan]:
+        """Drop the oldest traces beyond the buffer size, keeping head-sampled spans."""
+        export: list[ReadableSpan] = []
+        while len(self._traces) > self.policy.tail_max_traces:
+            trace_id, trace = next(iter(self._traces.items()))
+            if not trace.finished:
+                export.extend(_partition(trace.spans, trace_id, self.policy)[0])
+            self._drop_locked(trace_id)
+            self.stats.evicted += 1
+            logging.debug(f"Tail sampling buffer full; dropped trace {trace_id:x}")
+        return export
+
+
+def _partition(
+    spans: list[ReadableSpan], trace_id: int, policy: SamplingPolicy
+) -> tuple[list[ReadableSpan], list[ReadableSpan]]:
+    """Split `spans` into those the head policy keeps and the rest.
+
+    As in `OperationRatioSampler`, a span is kept with its head-sampled parent.
+    """
+    by_id = {span.context.span_id: span for span in spans}
+    kept: dict[int, bool] = {}
+
+    def head_kept(span: ReadableSpan) -> bool:
+        span_id = span.context.span_id
+        if span_id not in kept:
+            parent = by_id.get(span.parent.span_id) if span.parent else None
+            kept[span_id] = policy.head_sampled(span.name, trace_id) or (
+                parent is not None and head_kept(parent)
+            )
+        return kept[span_id]
+
+    sampled: list[ReadableSpan] = []
+    rest: list[ReadableSpan] = []
+    for span in spans:
+        (sampled if head_kept(span) else rest).append(span)
+    return sampled, rest
@@ -0,0 +1,331 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Versioned schema and statistics snapshot of the Citi Bike table.
+
+The snapshot is captured ahead of time (`make schema-snapshot`) and rendered
+into the SQL-writing agent's instructions, so the model knows the columns,
+partitioning and value ranges without spending tool calls to discover them.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+import click
+
+DEFAULT_TABLE = "emea-pe-agentspace.citibike.citibike"
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "citibike_schema.json"
+)
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Columns with at most this many distinct values have their values listed.
+MAX_LISTED_VALUES = 20
+_ORDERABLE_TYPES = {
+    "INT64",
+    "INTEGER",
+    "FLOAT64",
+    "FLOAT",
+    "NUMERIC",
+    "BIGNUMERIC",
+    "DATE",
+    "DATETIME",
+    "TIMESTAMP",
+    "TIME",
+}
+
+
+@dataclass
+class ColumnSnapshot:
+    """Type and value statistics of a single column."""
+
+    name: str
+    type: str
+    mode: str = "NULLABLE"
+    distinct_count: int | None = None
+    null_fraction: float | None = None
+    min_value: str | None = None
+    max_value: str | None = None
+    avg_length: float | None = None
+    values: list[str] | None = None
+
+
+@dataclass
+class SchemaSnapshot:
+    """Schema, layout and statistics of a table at a point in time."""
+
+    table: str
+    captured_at: str
+    num_rows: int
+    num_bytes: int
+    columns: list[ColumnSnapshot]
+    partitioning: dict[str, str] | None = None
+    clustering: list[str] = field(default_factory=list)
+
+    @property
+    def version(self) -> str:
+        """Content hash of the schema, ignoring when it was captured.
+
+        Statistics are excluded so that routine refreshes of row counts and
+        ranges do not invalidate SQL validated against the same columns.
+        """
+        material = json.dumps(
+            {
+                "table": self.table,
+                "columns": [(c.name, c.type, c.mode) for c in self.columns],
+                "partitioning": self.partitioning,
+                "clustering": self.clustering,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode()).hexdigest()[:12]
+
+    def column(self, name: str) -> ColumnSnapshot | None:
+        """Return the column called `name` (case-insensitive), if present."""
+        lowered = name.lower()
+        for column in self.columns:
+            if column.name.lower() == lowered:
+                return column
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "version": self.version,
+            **asdict(self),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SchemaSnapshot":
+        return cls(
+            table=data["table"],
+            captured_at=data["captured_at"],
+            num_rows=data["num_rows"],
+            num_bytes=data["num_bytes"],
+            columns=[ColumnSnapshot(**column) for column in data["columns"]],
+            partitioning=data.get("partitioning"),
+            clustering=data.get("clustering", []),
+        )
+
+    def age_seconds(self) -> float:
+        captured_at = datetime.datetime.fromisoformat(self.captured_at)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (now - captured_at).total_seconds()
+
+
+def save_snapshot(snapshot: SchemaSnapshot, path: str) -> None:
+    """Write `snapshot` to `path` as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(snapshot.to_dict(), f, indent=2)
+
+
+def load_snapshot(path: str) -> SchemaSnapshot | None:
+    """Load a snapshot from `path`, returning None if it is missing or invalid."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return SchemaSnapshot.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable schema snapshot {path}: {e}")
+        return None
+
+
+def _format_bytes(num_bytes: int) -> str:
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def render_snapshot(snapshot: SchemaSnapshot) -> str:
+    """Render `snapshot` as a compact block for the agent instructions."""
+    lines = [
+        f"**Table schema** `{snapshot.table}` "
+        f"({snapshot.num_rows:,} rows, {_format_bytes(snapshot.num_bytes)}, "
+        f"schema {snapshot.version}, captured {snapshot.captured_at[:10]}):"
+    ]
+    if snapshot.partitioning:
+        lines.append(
+            f"Partitioned by {snapshot.partitioning.get('type', 'DAY')} on "
+            f"`{snapshot.partitioning['field']}`; filter on it to limit bytes scanned."
+        )
+    if snapshot.clustering:
+        lines.append(f"Clustered by {', '.join(snapshot.clustering)}.")
+    for column in snapshot.columns:
+        details = []
+        if column.values:
+            details.append(
+                "values " + "|".join(f"'{value}'" for value in column.values)
+            )
+        elif column.min_value is not None:
+            details.append(f"{column.min_value} .. {column.max_value}")
+        if column.distinct_count is not None and not column.values:
+            details.append(f"~{column.distinct_count:,} distinct")
+        if column.null_fraction:
+            details.append(f"{column.null_fraction:.0%} null")
+        suffix = f": {'; '.join(details)}" if details else ""
+        mode = " REPEATED" if column.mode == "REPEATED" else ""
+        lines.append(f"- {column.name} {column.type}{mode}{suffix}")
+    return "\n".join(lines)
+
+
+class SchemaSnapshotProvider:
+    """Serves the snapshot on disk, reloading it when the file changes."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SNAPSHOT_PATH,
+        max_age_seconds: float = 7 * 24 * 3600,
+        check_interval_seconds: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self._lock = threading.Lock()
+        self._snapshot: SchemaSnapshot | None = None
+        self._mtime: float | None = None
+        self._checked_at = float("-inf")
+
+    def get(self) -> SchemaSnapshot | None:
+        """Return the current snapshot, or None if none has been captured."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval_seconds:
+                return self._snapshot
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                self._snapshot, self._mtime = None, None
+                return None
+            if mtime != self._mtime:
+                self._snapshot, self._mtime = load_snapshot(self.path), mtime
+                if self._snapshot is not None and (
+                    self._snapshot.age_seconds() > self.max_age_seconds
+                ):
+                    logging.warning(
+                        f"Schema snapshot {self.path} is older than "
+                        f"{self.max_age_seconds / 3600:.0f}h; run `make schema-snapshot`."
+                    )
+            return self._snapshot
+
+
+def capture_snapshot(client: Any, table: str = DEFAULT_TABLE) -> SchemaSnapshot:
+    """Capture the schema and column statistics of `table`.
+
+    Args:
+        client: A `google.cloud.bigquery.Client`
+        table: Fully qualified table ID
+
+    Returns:
+        The captured snapshot
+    """
+    bq_table = client.get_table(table)
+    columns = [
+        ColumnSnapshot(name=f.name, type=f.field_type, mode=f.mode or "NULLABLE")
+        for f in bq_table.schema
+    ]
+    partitioning = None
+    if bq_table.time_partitioning is not None:
+        partitioning = {
+            "field": bq_table.time_partitioning.field or "_PARTITIONTIME",
+            "type": bq_table.time_partitioning.type_,
+        }
+
+    scalar = [c for c in columns if c.mode != "REPEATED" and c.type != "RECORD"]
+    selects = ["COUNT(*) AS row_count"]
+    for i, column in enumerate(scalar):
+        name = f"`{column.name}`"
+        selects.append(f"APPROX_COUNT_DISTINCT({name}) AS d{i}")
+        selects.append(f"COUNTIF({name} IS NULL) AS n{i}")
+        if column.type in _ORDERABLE_TYPES:
+            selects.append(f"CAST(MIN({name}) AS STRING) AS lo{i}")
+            selects.append(f"CAST(MAX({name}) AS STRING) AS hi{i}")
+        if column.type == "STRING":
+            selects.append(f"AVG(LENGTH({name})) AS len{i}")
+    query = f"SELECT {', '.join(selects)} FROM `{table}`"
+    stats = dict(next(iter(client.query(query).result())).items())
+    row_count = stats["row_count"] or 1
+    low_cardinality = []
+    for i, column in enumerate(scalar):
+        column.distinct_count = stats[f"d{i}"]
+        column.null_fraction = round(stats[f"n{i}"] / row_count, 4)
+        column.min_value = stats.get(f"lo{i}")
+        column.max_value = stats.get(f"hi{i}")
+        if stats.get(f"len{i}") is not None:
+            column.avg_length = round(stats[f"len{i}"], 1)
+        if column.type == "STRING" and column.distinct_count <= MAX_LISTED_VALUES:
+            low_cardinality.append(column)
+
+    if low_cardinality:
+        tops = ", ".join(
+            f"APPROX_TOP_COUNT(`{c.name}`, {MAX_LISTED_VALUES}) AS `{c.name}`"
+            for c in low_cardinality
+        )
+        row = dict(
+            next(iter(client.query(f"SELECT {tops} FROM `{table}`").result())).items()
+        )
+        for column in low_cardinality:
+            column.values = [
+                str(top["value"])
+                for top in row[column.name]
+                if top["value"] is not None
+            ]
+
+    return SchemaSnapshot(
+        table=table,
+        captured_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        num_rows=bq_table.num_rows or 0,
+        num_bytes=bq_table.num_bytes or 0,
+        columns=columns,
+        partitioning=partitioning,
+        clustering=list(bq_table.clustering_fields or []),
+    )
+
+
+@click.command()
+@click.option("--table", default=DEFAULT_TABLE, help="Fully qualified table ID")
+@click.option("--output", default=DEFAULT_SNAPSHOT_PATH, help="Snapshot file to write")
+@click.option(
+    "--project", default=None, help="Project to run the statistics queries in"
+)
+def refresh_schema_snapshot(table: str, output: str, project: str | None) -> None:
+    """Capture a fresh schema snapshot of TABLE into OUTPUT."""
+    from google.cloud import bigquery
+
+    logging.basicConfig(level=logging.INFO)
+    previous = load_snapshot(output)
+    snapshot = capture_snapshot(bigquery.Client(project=project), table)
+    save_snapshot(snapshot, output)
+    if previous is not None and previous.version != snapshot.version:
+        logging.warning(
+            f"Schema of {table} changed ({previous.version} -> {snapshot.version}); "
+            "cached SQL for the old schema will be invalidated."
+        )
+    logging.info(f"Wrote schema snapshot {snapshot.version} to {output}")
+
+
+if __name__ == "__main__":
+    refresh_schema_snapshot()
@@ -0,0 +1,277 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import itertools
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+
+class Embedder(Protocol):
+    """Turns texts into embedding vectors."""
+
+    def embed(self, texts: list[str]) -> list[list[float]]: ...
+
+
+class HashingEmbedder:
+    """Deterministic, dependency-free embedder based on feature hashing.
+
+    Words and word bigrams are hashed into a fixed number of buckets. It is a
+    local stand-in for a real embedding model in tests and offline runs; it
+    matches rewordings that share vocabulary, not true paraphrases.
+    """
+
+    def __init__(self, dimensions: int = 256) -> None:
+        self.dimensions = dimensions
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> list[float]:
+        words = [word.rstrip("s") for word in re.findall(r"[a-z0-9]+", text.lower())]
+        features = words + [f"{a} {b}" for a, b in itertools.pairwise(words)]
+        vector = [0.0] * self.dimensions
+        for feature in features:
+            digest = hashlib.md5(feature.encode()).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize(vector)
+
+
+class VertexAiEmbedder:
+    """Embedder backed by a Vertex AI text embedding model."""
+
+    def __init__(self, model: str = "text-embedding-005") -> None:
+        self.model = model
+        self._client: Any = None
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client()
+        response = self._client.models.embed_content(model=self.model, contents=texts)
+        return [_normalize(list(embedding.values)) for embedding in response.embeddings]
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return vector
+    return [value / norm for value in vector]
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b, strict=True))
+
+
+_LITERAL_WORDS = frozenset(
+    """
+    january february march april may june july august september october
+    november december jan feb mar apr jun jul aug sep sept oct nov dec
+    monday tuesday wednesday thursday friday saturday sunday
+    zero one two three four five six seven eight nine ten eleven twelve
+    twenty thirty forty fifty hundred thousand million first second third
+    """.split()
+)
+_TOKEN_PATTERN = re.compile(r"\"[^\"]*\"|(?<!\w)'[^']*'(?!\w)|[\w.:/'-]+")
+
+
+def _literals(question: str) -> tuple[str, ...]:
+    """Return the literal values in `question`: the parts its SQL depends on.
+
+    Numbers, dates, month, weekday and number words, quoted strings and
+    capitalized names such as stations are kept in order, lowercased. Two
+    questions can only share SQL when these match exactly, because embeddings
+    score "trips in March 2018" and "trips in April 2018" as near duplicates.
+    """
+    literals = []
+    for match in _TOKEN_PATTERN.finditer(question):
+        text = match.group()
+        token = text.strip(".:/'-")
+        sentence_start = question[: match.start()].rstrip()[-1:] in ("", ".", "?", "!")
+        if text[0] in "\"'" and text[-1] == text[0] and len(text) > 1:
+            literals.append(text[1:-1].lower())
+        elif any(char.isdigit() for char in token) or token.lower() in _LITERAL_WORDS:
+            literals.append(token.lower())
+        elif token[:1].isupper() and len(token) > 1 and not sentence_start:
+            literals.append(token.lower())
+    return tuple(literals)
+
+
+@dataclass
+class SqlCall:
+    """A validated tool call: the tool's name and the arguments it ran with."""
+
+    tool_name: str
+    args: dict[str, Any]
+
+
+@dataclass
+class SqlMatch:
+    """The cached tool calls that answered a sufficiently similar question."""
+
+    question: str
+    calls: list[SqlCall]
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    vector: list[float]
+    question: str
+    calls: list[SqlCall]
+    schema_version: str
+    literals: tuple[str, ...]
+
+
+def _copy_calls(calls: list[SqlCall]) -> list[SqlCall]:
+    return [SqlCall(call.tool_name, dict(call.args)) for call in calls]
+
+
+@dataclass
+class SemanticCacheStats:
+    """Hit rate and latency saved by the semantic SQL cache."""
+
+    lookups: int = 0
+    hits: int = 0
+    latency_saved_s: float = 0.0
+    avg_generation_latency_s: float = 0.0
+    _generation_samples: int = field(default=0, repr=False)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class SemanticSqlCache:
+    """Maps user questions to previously validated SQL by embedding similarity.
+
+    Only questions whose SQL ran successfully are stored. Every entry records
+    the schema version it was validated against and is dropped as soon as a
+    lookup or store happens under a different schema version. A question only
+    matches an entry whose literal values (numbers, dates, names) are the same.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        threshold: float = 0.92,
+        max_entries: int = 256,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            embedder: Embedder used for questions
+            threshold: Minimum cosine similarity for a question to match
+            max_entries: Maximum number of questions kept, oldest dropped first
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.stats = SemanticCacheStats()
+        self._lock = threading.Lock()
+        self._entries: list[_Entry] = []
+        # Questions embedded by `lookup` are usually stored right after their
+        # SQL runs, so keep their vectors to avoid embedding them twice.
+        self._recent_vectors: OrderedDict[str, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, question: str, schema_version: str = "") -> SqlMatch | None:
+        """Return the cached tool calls for the most similar question, if any."""
+        vector = self._embed(question)
+        literals = _literals(question)
+        with self._lock:
+            self._invalidate_locked(schema_version)
+            self.stats.lookups += 1
+            best: _Entry | None = None
+            best_score = self.threshold
+            for entry in self._entries:
+                if entry.literals != literals:
+                    continue
+                score = _dot(vector, entry.vector)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                return None
+            self.stats.hits += 1
+            self.stats.latency_saved_s += self.stats.avg_generation_latency_s
+            return SqlMatch(
+                question=best.question,
+                calls=_copy_calls(best.calls),
+                similarity=best_score,
+            )
+
+    def store(
+        self,
+        question: str,
+        calls: list[SqlCall],
+        schema_version: str = "",
+    ) -> None:
+        """Record that `calls`, all successful, answered `question` together.
+
+        A later store for a similar question replaces the entry, so storing the
+        growing set of a turn's calls after each one leaves the complete set.
+        """
+        vector = self._embed(question)
+        entry = _Entry(
+            vector, question, _copy_calls(calls), schema_version, _literals(question)
+        )
+        with self._lock:
+            self._invalidate_locked(schema_version)
+            self._entries = [
+                existing
+                for existing in self._entries
+                if existing.literals != entry.literals
+                or _dot(vector, existing.vector) < self.threshold
+            ]
+            self._entries.append(entry)
+            del self._entries[: -self.max_entries]
+
+    def invalidate_schema(self, schema_version: str) -> None:
+        """Drop every entry validated against a schema other than `schema_version`."""
+        with self._lock:
+            self._invalidate_locked(schema_version)
+
+    def record_generation_latency(self, seconds: float) -> None:
+        """Record how long a cache miss took to generate SQL with the model."""
+        with self._lock:
+            stats = self.stats
+            stats._generation_samples += 1
+            stats.avg_generation_latency_s += (
+                seconds - stats.avg_generation_latency_s
+            ) / stats._generation_samples
+
+    def _embed(self, question: str) -> list[float]:
+        with self._lock:
+            vector = self._recent_vectors.get(question)
+        if vector is None:
+            vector = self.embedder.embed([question])[0]
+            with self._lock:
+                self._recent_vectors[question] = vector
+                while len(self._recent_vectors) > 64:
+                    self._recent_vectors.popitem(last=False)
+        return vector
+
+    def _invalidate_locked(self, schema_version: str) -> None:
+        self._entries = [
+            entry for entry in self._entries if entry.schema_version == schema_version
+        ]
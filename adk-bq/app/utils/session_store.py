@@ -0,0 +1,371 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded in-memory session store for long-lived workers.
+
+`InMemorySessionService` keeps every session, with its full event history and
+state, for the life of the process. `BoundedInMemorySessionService` keeps the
+same semantics for live sessions but bounds what a worker holds: sessions are
+evicted least recently used first and after an idle TTL, each session's history
+is trimmed to a byte cap by dropping its oldest turns, and large tool outputs
+are moved out of the stored history into the artifact service.
+"""
+
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from google.adk.artifacts import BaseArtifactService
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.genai import types
+
+from app.utils.file_artifacts import LocalFileArtifactService
+
+SessionKey = tuple[str, str, str]
+
+
+def rss_bytes() -> int:
+    """Current resident set size of the process.
+
+    Reads `/proc/self/statm` where available and falls back to the peak RSS
+    reported by `getrusage` elsewhere.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+
+
+def event_size(event: Event) -> int:
+    """Approximate bytes an event holds, measured as its JSON encoding."""
+    return len(event.model_dump_json(exclude_none=True))
+
+
+@dataclass
+class _SessionEntry:
+    last_access: float
+    size_bytes: int = 0
+    artifacts: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SessionStoreStats:
+    """Memory gauge of a `BoundedInMemorySessionService`."""
+
+    sessions: int = 0
+    session_bytes: int = 0
+    evicted_lru: int = 0
+    evicted_idle: int = 0
+    trimmed_events: int = 0
+    offloaded_outputs: int = 0
+    offloaded_bytes: int = 0
+    rss_bytes: int = 0
+
+
+class BoundedInMemorySessionService(InMemorySessionService):
+    """`InMemorySessionService` with LRU and idle-TTL eviction and a size cap.
+
+    Only the stored copy of a session is compacted. The session a runner holds
+    during an invocation keeps its events intact, so the model sees full tool
+    outputs in the turn that produced them; later turns see a reference to the
+    artifact the output was saved to instead.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl_seconds: float = 3600.0,
+        max_session_bytes: int = 256 * 1024,
+        offload_threshold_bytes: int = 8 * 1024,
+        artifact_service: BaseArtifactService | None = None,
+        gauge_interval_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize the store.
+
+        Args:
+            max_sessions: Sessions kept before the least recently used is evicted
+            idle_ttl_seconds: Sessions untouched for this long are evicted
+            max_session_bytes: Stored history per session before the oldest
+                turns are dropped
+            offload_threshold_bytes: Tool outputs larger than this are saved to
+                `artifact_service` and replaced by a reference
+            artifact_service: Where large tool outputs are saved. Defaults to a
+                `LocalFileArtifactService` in a temporary directory.
+            gauge_interval_seconds: How often the memory gauge is logged, 0 to
+                disable logging
+            clock: Monotonic source of the current time in seconds
+        """
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_session_bytes = max_session_bytes
+        self.offload_threshold_bytes = offload_threshold_bytes
+        if artifact_service is None:
+            artifact_service = LocalFileArtifactService(
+                tempfile.mkdtemp(prefix="session-artifacts-")
+            )
+        self.artifact_service = artifact_service
+        self.gauge_interval_seconds = gauge_interval_seconds
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._entries: OrderedDict[SessionKey, _SessionEntry] = OrderedDict()
+        # Artifacts of evicted sessions, deleted on the next `append_event`
+        # because eviction also happens in synchronous code paths.
+        self._orphaned_artifacts: list[tuple[SessionKey, str]] = []
+        self._stats = SessionStoreStats()
+        self._last_gauge = clock()
+
+    @classmethod
+    def from_env(
+        cls,
+        artifact_service: BaseArtifactService | None = None,
+        environ: Mapping[str, str] = os.environ,
+    ) -> "BoundedInMemorySessionService":
+        """Build the store from the `SESSION_*` environment variables."""
+        if artifact_service is None and environ.get("SESSION_ARTIFACT_DIR"):
+            artifact_service = LocalFileArtifactService(environ["SESSION_ARTIFACT_DIR"])
+        return cls(
+            max_sessions=int(environ.get("SESSION_MAX_SESSIONS", "1000")),
+            idle_ttl_seconds=float(environ.get("SESSION_IDLE_TTL_SECONDS", "3600")),
+            max_session_bytes=int(environ.get("SESSION_MAX_BYTES", "262144")),
+            offload_threshold_bytes=int(environ.get("SESSION_OFFLOAD_BYTES", "8192")),
+            artifact_service=artifact_service,
+            gauge_interval_seconds=float(
+                environ.get("SESSION_GAUGE_INTERVAL_SECONDS", "60")
+            ),
+        )
+
+    def stats(self) -> dict[str, Any]:
+        """Snapshot of the memory gauge, including the process RSS."""
+        with self._lock:
+            self._evict_idle()
+            self._stats.sessions = len(self._entries)
+            self._stats.session_bytes = sum(
+                entry.size_bytes for entry in self._entries.values()
+            )
+            self._stats.rss_bytes = rss_bytes()
+            return asdict(self._stats)
+
+    def _create_session_impl(self, **kwargs: Any) -> Session:
+        session = super()._create_session_impl(**kwargs)
+        with self._lock:
+            key = (session.app_name, session.user_id, session.id)
+            self._entries[key] = _SessionEntry(last_access=self._clock())
+            self._evict_idle()
+            while len(self._entries) > self.max_sessions:
+                self._evict(next(iter(self._entries)))
+                self._stats.evicted_lru += 1
+        return session
+
+    def _get_session_impl(
+        self, *, app_name: str, user_id: str, session_id: str, **kwargs: Any
+    ) -> Session | None:
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get((app_name, user_id, session_id))
+            if entry is not None:
+                entry.last_access = self._clock()
+                self._entries.move_to_end((app_name, user_id, session_id))
+        return super()._get_session_impl(
+            app_name=app_name, user_id=user_id, session_id=session_id, **kwargs
+        )
+
+    def _delete_session_impl(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        with self._lock:
+            if (app_name, user_id, session_id) in self._entries:
+                self._evict((app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session, event)
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        stored = self.sessions.get(key[0], {}).get(key[1], {}).get(key[2])
+        entry = self._entries.get(key)
+        if stored is not None and entry is not None and stored.events:
+            compacted = await self._offload_tool_outputs(key, stored.events[-1], entry)
+            stored.events[-1] = compacted
+            with self._lock:
+                entry.size_bytes += event_size(compacted)
+                entry.last_access = self._clock()
+                self._entries.move_to_end(key)
+                self._trim(stored, entry)
+        await self._delete_orphaned_artifacts()
+        self._maybe_log_gauge()
+        return event
+
+    async def _offload_tool_outputs(
+        self, key: SessionKey, event: Event, entry: _SessionEntry
+    ) -> Event:
+        """Return `event` with large function responses saved as artifacts."""
+        if not event.content or not event.content.parts:
+            return event
+        parts = list(event.content.parts)
+        changed = False
+        for i, part in enumerate(parts):
+            response = part.function_response
+            if response is None or response.response is None:
+                continue
+            payload = json.dumps(response.response, default=str)
+            if len(payload) <= self.offload_threshold_bytes:
+                continue
+            filename = f"tool-output-{event.id}-{i}.json"
+            version = await self.artifact_service.save_artifact(
+                app_name=key[0],
+                user_id=key[1],
+                session_id=key[2],
+                filename=filename,
+                artifact=types.Part.from_bytes(
+                    data=payload.encode(), mime_type="application/json"
+                ),
+            )
+            parts[i] = part.model_copy(
+                update={
+                    "function_response": response.model_copy(
+                        update={
+                            "response": {
+                                "offloaded_artifact": filename,
+                                "version": version,
+                                "bytes": len(payload),
+                                "preview": payload[:512],
+                            }
+                        }
+                    )
+                }
+            )
+            entry.artifacts.append(filename)
+            self._stats.offloaded_outputs += 1
+            self._stats.offloaded_bytes += len(payload)
+            changed = True
+        if not changed:
+            return event
+        # A copy, so the runner's copy of the session keeps the full output.
+        return event.model_copy(
+            update={"content": event.content.model_copy(update={"parts": parts})}
+        )
+
+    def _trim(self, stored: Session, entry: _SessionEntry) -> None:
+        """Drop the oldest whole turns until the history fits the byte cap.
+
+        A turn starts at a user event, so a function call is never separated
+        from its response. The latest turn is always kept.
+        """
+        while entry.size_bytes > self.max_session_bytes:
+            starts = [
+                i for i, event in enumerate(stored.events) if event.author == "user"
+            ]
+            # The end of the oldest turn: the start of the next one.
+            cut = next((i for i in starts if i > 0), None)
+            if cut is None:
+                return
+            dropped = stored.events[:cut]
+            del stored.events[:cut]
+            entry.size_bytes -= sum(event_size(event) for event in dropped)
+            self._stats.trimmed_events += len(dropped)
+
+    def _evict_idle(self) -> None:
+        """Evict sessions idle longer than the TTL, oldest first."""
+        deadline = self._clock() - self.idle_ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_access > deadline:
+                return
+            self._evict(key)
+            self._stats.evicted_idle += 1
+
+    def _evict(self, key: SessionKey) -> None:
+        app_name, user_id, session_id = key
+        entry = self._entries.pop(key)
+        self._orphaned_artifacts.extend((key, name) for name in entry.artifacts)
+        users = self.sessions.get(app_name, {})
+        users.get(user_id, {}).pop(session_id, None)
+        if user_id in users and not users[user_id]:
+            # User state outlives a session but not the last one of its user,
+            # otherwise it would grow with every user ever seen.
+            del users[user_id]
+            self.user_state.get(app_name, {}).pop(user_id, None)
+
+    async def _delete_orphaned_artifacts(self) -> None:
+        with self._lock:
+            orphaned, self._orphaned_artifacts = self._orphaned_artifacts, []
+        for (app_name, user_id, session_id), filename in orphaned:
+            try:
+                await self.artifact_service.delete_artifact(
+                    app_name=app_name,
+                    user_id=user_id,
+                    session_id=session_id,
+                    filename=filename,
+                )
+            except Exception as e:
+                logging.warning(f"Could not delete artifact {filename}: {e}")
+
+    def _maybe_log_gauge(self) -> None:
+        if not self.gauge_interval_seconds:
+            return
+        now = self._clock()
+        if now - self._last_gauge < self.gauge_interval_seconds:
+            return
+        self._last_gauge = now
+        logging.info(json.dumps({"session_store": self.stats()}))
+
+
+def session_service_builder(
+    environ: Mapping[str, str] = os.environ,
+    artifact_service_builder: Callable[[], BaseArtifactService] | None = None,
+) -> Callable[[], BaseSessionService] | None:
+    """Builder for the session store selected by `SESSION_STORE`.
+
+    Returns None for the default store (`SESSION_STORE` unset or `default`),
+    so the platform picks it: `InMemorySessionService` locally and the managed
+    `VertexAiSessionService` on Agent Engine.
+
+    Args:
+        environ: Environment the workers run with
+        artifact_service_builder: Builds the artifact service large tool
+            outputs are saved to; a local directory when omitted
+
+    Returns:
+        A callable creating the session service, or None
+    """
+    store = environ.get("SESSION_STORE", "default").lower()
+    if store == "default":
+        return None
+    if store != "bounded":
+        raise ValueError(f"SESSION_STORE must be default or bounded, not {store}")
+    settings = dict(environ)
+
+    def build() -> BaseSessionService:
+        return BoundedInMemorySessionService.from_env(
+            artifact_service=artifact_service_builder()
+            if artifact_service_builder
+            else None,
+            environ=settings,
+        )
+
+    return build
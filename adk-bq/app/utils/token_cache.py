@@ -0,0 +1,150 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CachedToken:
+    """An access token together with its absolute expiry (epoch seconds).
+
+    A `expires_at` of None means the expiry is unknown and the token is treated
+    as valid until it is replaced or evicted.
+    """
+
+    value: str
+    expires_at: float | None = None
+
+
+TokenFetcher = Callable[[Hashable], CachedToken | None]
+
+
+class TokenCache:
+    """Per-key, expiry-aware access token cache.
+
+    Lookups are O(1) and never block on the network while a valid token is
+    cached. Tokens that are close to expiry are refreshed ahead of time on a
+    background thread, and concurrent callers for the same key share a single
+    in-flight fetch. The number of cached keys is bounded with LRU eviction.
+    """
+
+    def __init__(
+        self,
+        fetcher: TokenFetcher,
+        max_entries: int = 1024,
+        refresh_margin_seconds: float = 300.0,
+        clock: Callable[[], float] = time.time,
+        executor: ThreadPoolExecutor | None = None,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            fetcher: Callable returning a fresh token for a key, or None
+            max_entries: Maximum number of keys kept before LRU eviction
+            refresh_margin_seconds: Refresh tokens this long before they expire
+            clock: Source of the current time in epoch seconds
+            executor: Executor used for background refreshes
+        """
+        self._fetcher = fetcher
+        self._max_entries = max_entries
+        self._refresh_margin = refresh_margin_seconds
+        self._clock = clock
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="token-refresh"
+        )
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, CachedToken] = OrderedDict()
+        self._inflight: dict[Hashable, Future] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable) -> str | None:
+        """Return a valid cached token for `key` without blocking.
+
+        If the token is within the refresh margin a background refresh is
+        scheduled. Expired or missing tokens return None.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            needs_refresh = (
+                entry.expires_at is not None
+                and entry.expires_at - now <= self._refresh_margin
+            )
+        if needs_refresh:
+            self._fetch_single_flight(key)
+        return entry.value
+
+    def get_or_fetch(self, key: Hashable, timeout: float | None = 30.0) -> str | None:
+        """Return a valid token for `key`, fetching it synchronously on a miss.
+
+        Concurrent misses for the same key wait on the same fetch.
+        """
+        token = self.get(key)
+        if token is not None:
+            return token
+        future = self._fetch_single_flight(key)
+        try:
+            entry = future.result(timeout=timeout)
+        except Exception as e:
+            logging.error(f"Token fetch failed for cache key {key!r}: {e}")
+            return None
+        return entry.value if entry is not None else None
+
+    def put(self, key: Hashable, token: CachedToken) -> None:
+        """Store a token for `key`, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = token
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop any cached token for `key`."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _fetch_single_flight(self, key: Hashable) -> Future:
+        """Start a fetch for `key` unless one is already running."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._fetch, key)
+            self._inflight[key] = future
+        return future
+
+    def _fetch(self, key: Hashable) -> CachedToken | None:
+        try:
+            entry = self._fetcher(key)
+            if entry is not None:
+                self.put(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
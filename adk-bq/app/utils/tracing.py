@@ -22,6 +22,91 @@ from google.cloud import logging as google_cloud_logging
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.sdk.util import ns_to_iso_str
+from opentelemetry.trace import StatusCode, format_span_id, format_trace_id
+
+from app.utils.batching import BatchWorker
+from app.utils.payload_offload import BlobStore, GcsBlobStore, PayloadOffloader
+from app.utils.sampling import trace_id_sampled
+
+# Cloud Logging rejects entries above 256 KB; span attributes above this size
+# are offloaded to GCS.
+LARGE_ATTRIBUTES_BYTES = 255 * 1024
+# When attributes are offloaded, values up to this size stay in the log entry.
+RETAINED_ATTRIBUTE_BYTES = 1024
+# Attribute values above this size are stored once under their content hash
+# and replaced by a reference, since prompts and history repeat across spans.
+CONTENT_ADDRESSED_BYTES = 16 * 1024
+CONTENT_PREFIX = "blobs/sha256/"
+# Attribute values above this size are dropped from spans whose trace is not
+# selected by the large attribute sample ratio.
+SAMPLED_ATTRIBUTE_BYTES = 4 * 1024
+
+LOG_LABELS = {
+    "type": "agent_telemetry",
+    "service_name": "adk-bq",
+}
+
+
+def _attribute_dict(attributes: Any) -> dict[str, Any]:
+    """Convert OpenTelemetry attributes to JSON-compatible values."""
+    if not attributes:
+        return {}
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in attributes.items()
+    }
+
+
+def span_to_dict(span: ReadableSpan) -> dict[str, Any]:
+    """Build the same dictionary as `json.loads(span.to_json())`.
+
+    Reads the span fields directly instead of serializing the span to a JSON
+    string and parsing it back.
+    """
+    context = span.get_span_context()
+    status = {"status_code": span.status.status_code.name}
+    if span.status.description:
+        status["description"] = span.status.description
+    return {
+        "name": span.name,
+        "context": {
+            "trace_id": f"0x{format_trace_id(context.trace_id)}",
+            "span_id": f"0x{format_span_id(context.span_id)}",
+            "trace_state": repr(context.trace_state),
+        },
+        "kind": str(span.kind),
+        "parent_id": (
+            f"0x{format_span_id(span.parent.span_id)}" if span.parent else None
+        ),
+        "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+        "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+        "status": status,
+        "attributes": _attribute_dict(span.attributes),
+        "events": [
+            {
+                "name": event.name,
+                "timestamp": ns_to_iso_str(event.timestamp),
+                "attributes": _attribute_dict(event.attributes),
+            }
+            for event in span.events
+        ],
+        "links": [
+            {
+                "context": {
+                    "trace_id": f"0x{format_trace_id(link.context.trace_id)}",
+                    "span_id": f"0x{format_span_id(link.context.span_id)}",
+                    "trace_state": repr(link.context.trace_state),
+                },
+                "attributes": _attribute_dict(link.attributes),
+            }
+            for link in span.links
+        ],
+        "resource": {
+            "attributes": _attribute_dict(span.resource.attributes),
+            "schema_url": span.resource.schema_url,
+        },
+    }
 
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
@@ -39,6 +124,12 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         storage_client: storage.Client | None = None,
         bucket_name: str | None = None,
         debug: bool = False,
+        async_logging: bool = True,
+        max_queue_size: int = 2048,
+        blob_store: BlobStore | None = None,
+        bucket_check_ttl_seconds: float = 300.0,
+        content_addressed_bytes: int | None = CONTENT_ADDRESSED_BYTES,
+        large_attribute_sample_ratio: float = 1.0,
         **kwargs: Any,
     ) -> None:
         """
@@ -48,6 +139,21 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param async_logging: Write log entries from a background thread so that
+            the Cloud Logging and Cloud Trace writes run concurrently
+        :param max_queue_size: Maximum number of span batches waiting to be
+            logged; further batches are dropped and counted
+        :param blob_store: Destination of offloaded payloads; defaults to the
+            GCS bucket. A `LocalBlobStore` can be used for tests
+        :param bucket_check_ttl_seconds: How long a bucket existence check is
+            trusted before it is repeated
+        :param content_addressed_bytes: Attribute values larger than this are
+            stored once under their SHA-256 and referenced from the span;
+            None disables content-addressed storage
+        :param large_attribute_sample_ratio: Fraction of traces whose attribute
+            values above `SAMPLED_ATTRIBUTE_BYTES` are kept. Other spans keep
+            their metadata and record only the size of the dropped values.
+            Spans with an error status always keep them
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
@@ -61,51 +167,100 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             bucket_name or f"{self.project_id}-adk-bq-logs"
         )
         self.bucket = self.storage_client.bucket(self.bucket_name)
+        self.offloader = PayloadOffloader(
+            blob_store or GcsBlobStore(self.bucket),
+            exists_ttl_seconds=bucket_check_ttl_seconds,
+        )
+        self.content_addressed_bytes = content_addressed_bytes
+        self.large_attribute_sample_ratio = large_attribute_sample_ratio
+        self.log_worker: BatchWorker[list[dict]] | None = None
+        if async_logging:
+            self.log_worker = BatchWorker(
+                self._write_log_entries,
+                max_batch_size=16,
+                flush_interval_seconds=0.5,
+                max_queue_size=max_queue_size,
+                name="span-log-writer",
+            )
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
         Export the spans to Google Cloud Logging and Cloud Trace.
 
+        The log entries for all spans are written in a single batch call. With
+        `async_logging` the batch is handed to a background writer, so the
+        Cloud Logging write runs concurrently with the Cloud Trace export
+        below and never blocks it.
+
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
+        entries = []
         for span in spans:
             span_context = span.get_span_context()
             trace_id = format(span_context.trace_id, "x")
             span_id = format(span_context.span_id, "x")
-            span_dict = json.loads(span.to_json())
+            span_dict = span_to_dict(span)
 
             span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
             span_dict["span_id"] = span_id
 
+            if not self._keep_large_attributes(span):
+                self._drop_large_attributes(span_dict)
             span_dict = self._process_large_attributes(
                 span_dict=span_dict, span_id=span_id
             )
 
             if self.debug:
                 print(span_dict)
+            entries.append(span_dict)
+
+        if self.log_worker is not None:
+            if not self.log_worker.submit(entries):
+                logging.warning(
+                    f"Span log queue full; dropped {len(entries)} span log entries "
+                    f"({self.log_worker.stats.dropped} batches dropped so far)"
+                )
+        else:
+            self._write_log_entries([entries])
 
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(
-                span_dict,
-                labels={
-                    "type": "agent_telemetry",
-                    "service_name": "adk-bq",
-                },
-                severity="INFO",
-            )
         # Export spans to Google Cloud Trace using the parent class method
         return super().export(spans)
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+    def _write_log_entries(self, batches: list[list[dict]]) -> None:
+        """Write span log entries to Google Cloud Logging in one batch call."""
+        batch = self.logger.batch()
+        for entries in batches:
+            for span_dict in entries:
+                batch.log_struct(span_dict, labels=LOG_LABELS, severity="INFO")
+        batch.commit()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Wait for queued payload uploads and span log entries to be written."""
+        flushed = self.offloader.flush(timeout_millis / 1000)
+        if self.log_worker is not None:
+            flushed = self.log_worker.flush(timeout_millis / 1000) and flushed
+        return flushed
+
+    def shutdown(self) -> None:
+        """Flush queued payload uploads and span log entries before shutting down."""
+        self.offloader.shutdown()
+        if self.log_worker is not None:
+            self.log_worker.shutdown()
+        super().shutdown()
+
+    def store_in_gcs(self, content: str | bytes, span_id: str) -> str:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Queue large content for storage in Google Cloud Storage.
+
+        The content is gzip-compressed and uploaded by a background worker, so
+        this never waits on GCS. The bucket existence check is memoized.
 
         :param content: The content to store
         :param span_id: The ID of the span
-        :return: The  GCS URI of the stored content
+        :return: The GCS URI the content is stored at
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
+        if self.offloader.known_missing():
             logging.warning(
                 f"Bucket {self.bucket_name} not found. "
                 "Unable to store span attributes in GCS."
@@ -113,33 +268,93 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             return "GCS bucket not found"
 
         blob_name = f"spans/{span_id}.json"
-        blob = self.bucket.blob(blob_name)
+        data = content.encode() if isinstance(content, str) else content
+        if not self.offloader.offload(blob_name, data):
+            logging.warning(
+                f"Large payload queue full; dropped attributes of span {span_id}"
+            )
+        return self.offloader.store.uri(blob_name)
+
+    def store_content_in_gcs(self, content: str) -> dict[str, Any] | None:
+        """
+        Queue an attribute value for storage in GCS under its content hash.
 
-        blob.upload_from_string(content, "application/json")
-        return f"gs://{self.bucket_name}/{blob_name}"
+        Values already uploaded by this process are not uploaded again.
+
+        :param content: The JSON-encoded attribute value
+        :return: A reference to the stored value, or None if it was not stored
+        """
+        if self.offloader.known_missing():
+            return None
+        stored = self.offloader.offload_content(content.encode(), prefix=CONTENT_PREFIX)
+        if stored is None:
+            return None
+        blob_name, digest = stored
+        return {
+            "sha256": digest,
+            "bytes": len(content),
+            "uri": self.offloader.store.uri(blob_name),
+        }
+
+    def _keep_large_attributes(self, span: ReadableSpan) -> bool:
+        """Return True if the large attribute values of `span` are exported."""
+        if span.status.status_code == StatusCode.ERROR:
+            return True
+        return trace_id_sampled(
+            span.get_span_context().trace_id, self.large_attribute_sample_ratio
+        )
+
+    @staticmethod
+    def _drop_large_attributes(span_dict: dict) -> None:
+        """Replace attribute values above `SAMPLED_ATTRIBUTE_BYTES` by their size."""
+        attributes = span_dict["attributes"]
+        for key, value in attributes.items():
+            if isinstance(value, str) and len(value) > SAMPLED_ATTRIBUTE_BYTES:
+                attributes[key] = {"sampled_out": True, "bytes": len(value)}
 
     def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
         """
         Process large attribute values by storing them in GCS if they exceed the size
         limit of Google Cloud Logging.
 
+        Each attribute value is JSON-encoded once; the encodings are used both
+        for the size check and to build the uploaded payload. Values above
+        `content_addressed_bytes` are first replaced by a reference to a copy
+        stored under their content hash.
+
         :param span_dict: The span data dictionary
-        :param trace_id: The trace ID
         :param span_id: The span ID
         :return: The updated span dictionary
         """
         attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
+        encoded = {key: json.dumps(value) for key, value in attributes.items()}
+        if self.content_addressed_bytes is not None:
+            for key, value in encoded.items():
+                if len(value) <= self.content_addressed_bytes:
+                    continue
+                reference = self.store_content_in_gcs(value)
+                if reference is not None:
+                    attributes[key] = reference
+                    encoded[key] = json.dumps(reference)
+        # Same bytes as json.dumps(attributes), which is ASCII-only.
+        payload = (
+            "{"
+            + ", ".join(f"{json.dumps(key)}: {value}" for key, value in encoded.items())
+            + "}"
+        ).encode()
+        if len(payload) > LARGE_ATTRIBUTES_BYTES:
             # Separate large payload from other attributes
-            attributes_payload = dict(attributes.items())
-            attributes_retain = dict(attributes.items())
+            attributes_retain = {
+                key: attributes[key]
+                for key, value in encoded.items()
+                if len(value) <= RETAINED_ATTRIBUTE_BYTES
+            }
 
             # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
+            gcs_uri = self.store_in_gcs(payload, span_id)
             attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
+            attributes_retain["url_payload"] = self.offloader.store.url(
+                f"spans/{span_id}.json"
             )
 
             span_dict["attributes"] = attributes_retain
@@ -113,3 +113,28 @@ resource "google_cloudbuild_trigger" "deploy_to_prod_pipeline" {
   ]
 
 }
+
+# d. Re-run the CD pipeline on main on a schedule. Its deploys capture a fresh
+# schema snapshot and connector spec, so the agent picks up schema and statistics
+# changes without a code change; prod still waits for approval as usual.
+resource "google_cloud_scheduler_job" "refresh_snapshots" {
+  name        = "refresh-snapshots-${var.project_name}"
+  project     = var.cicd_runner_project_id
+  region      = var.region
+  description = "Runs the ${google_cloudbuild_trigger.cd_pipeline.name} trigger on main"
+  schedule    = var.snapshot_refresh_schedule
+  time_zone   = "Etc/UTC"
+
+  http_target {
+    http_method = "POST"
+    uri         = "https://cloudbuild.googleapis.com/v1/${google_cloudbuild_trigger.cd_pipeline.id}:run"
+    body        = base64encode(jsonencode({ source = { branchName = "main" } }))
+    headers = {
+      "Content-Type" = "application/json"
+    }
+    oauth_token {
+      service_account_email = resource.google_service_account.cicd_runner_sa.email
+    }
+  }
+  depends_on = [resource.google_project_service.cicd_services]
+}
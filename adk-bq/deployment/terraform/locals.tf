@@ -20,7 +20,8 @@ locals {
     "serviceusage.googleapis.com",
     "bigquery.googleapis.com",
     "cloudresourcemanager.googleapis.com",
-    "cloudtrace.googleapis.com"
+    "cloudtrace.googleapis.com",
+    "cloudscheduler.googleapis.com"
   ]
 
   deploy_project_services = [
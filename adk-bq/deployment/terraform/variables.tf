@@ -85,7 +85,8 @@ variable "cicd_roles" {
     "roles/logging.logWriter",
     "roles/cloudtrace.agent",
     "roles/artifactregistry.writer",
-    "roles/cloudbuild.builds.builder"
+    "roles/cloudbuild.builds.builder",
+    "roles/bigquery.jobUser"
   ]
 }
 
@@ -130,3 +131,9 @@ variable "create_repository" {
   default     = false
 }
 
+
+variable "snapshot_refresh_schedule" {
+  description = "Cron schedule (UTC) on which the CD pipeline reruns to refresh the bundled schema snapshot"
+  type        = string
+  default     = "0 3 * * 1"
+}
@@ -0,0 +1,312 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Microbenchmarks of the hot-path functions, with JSON baselines.
+
+Covers `dynamic_token_injection` over session states of realistic size,
+`CloudTraceLoggingSpanExporter.export` and `_process_large_attributes` over
+synthetic span batches, `load_env_from_file`, `parse_env_vars` and a cold
+import of `app.agent`. Everything runs offline: the agent is built against the
+load-test stand-ins and the exporter against fake clients.
+
+Each case is timed `--repeats` times after calibrating the loop count, and the
+median time per call is reported. `--save` writes the results as a baseline;
+`--compare` checks them against it and exits non-zero on a regression larger
+than `--tolerance`. Baselines are only comparable on the same machine, so
+refresh the baseline before comparing on a new one.
+
+Usage:
+    uv run python -m tests.benchmarks.bench_hot_paths --save
+    uv run python -m tests.benchmarks.bench_hot_paths --compare --filter export
+"""
+
+import copy
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import click
+
+from tests.load_test.local_server import configure_offline_environment
+
+# Point the agent at the load-test stand-ins before anything imports `app`, so
+# no case reaches Google Cloud.
+configure_offline_environment("instant", 0, 20, "nested")
+
+DEFAULT_BASELINE = "tests/benchmarks/baselines/hot_paths.json"
+
+# A case runs `loops` calls and returns the seconds they took, so inputs that
+# calls consume can be prepared outside the timed region.
+Case = Callable[[int], float]
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    case: Case
+    # Cases that are too slow to loop are run exactly once per repeat.
+    calibrate: bool = True
+
+
+def timed(call: Callable[[], Any]) -> Case:
+    """Build a case that times `loops` calls of `call`."""
+
+    def run(loops: int) -> float:
+        start = time.perf_counter()
+        for _ in range(loops):
+            call()
+        return time.perf_counter() - start
+
+    return run
+
+
+def measure(benchmark: Benchmark, repeats: int, min_time_s: float) -> dict[str, Any]:
+    """Median, minimum and spread of the time per call, in microseconds."""
+    loops = 1
+    if benchmark.calibrate:
+        while benchmark.case(loops) < min_time_s:
+            loops *= 2
+    timings = [benchmark.case(loops) / loops * 1e6 for _ in range(repeats)]
+    return {
+        "median_us": round(statistics.median(timings), 3),
+        "min_us": round(min(timings), 3),
+        "stdev_us": round(statistics.stdev(timings), 3) if repeats > 1 else 0.0,
+        "loops": loops,
+        "repeats": repeats,
+    }
+
+
+def token_injection_benchmarks() -> list[Benchmark]:
+    """`dynamic_token_injection` with session states from a few keys to many."""
+    from google.adk.agents.invocation_context import InvocationContext
+    from google.adk.sessions import InMemorySessionService, Session
+    from google.adk.tools.tool_context import ToolContext
+
+    from app import agent
+    from tests.load_test.fakes import FakeExecuteCustomQueryTool
+
+    tool = FakeExecuteCustomQueryTool(latency_s=0, rows=0)
+    benchmarks = []
+    for size in (10, 100, 1000):
+        # Session state grows with conversation artefacts: cached pages,
+        # schema notes and per-turn bookkeeping.
+        state: dict[str, Any] = {
+            f"turn_{i}": {"question": "q" * 80, "rows": list(range(10))}
+            for i in range(size - 1)
+        }
+        if agent.auth_id:
+            state[agent.auth_id] = "ya29." + "t" * 200
+        session = Session(id="bench", app_name="app", user_id="bench-user", state=state)
+        invocation_context = InvocationContext(
+            session_service=InMemorySessionService(),
+            invocation_id="e-bench",
+            agent=agent.root_agent,
+            session=session,
+        )
+        tool_context = ToolContext(invocation_context)
+        args = {"query": "SELECT COUNT(*) FROM trips"}
+        benchmarks.append(
+            Benchmark(
+                f"dynamic_token_injection[state_keys={size}]",
+                timed(
+                    lambda tool_context=tool_context, args=args: (
+                        agent.dynamic_token_injection(tool, args, tool_context)
+                    )
+                ),
+            )
+        )
+    return benchmarks
+
+
+def exporter_benchmarks(blob_root: str) -> list[Benchmark]:
+    """`export` and `_process_large_attributes` over synthetic span batches."""
+    from app.utils.payload_offload import LocalBlobStore
+    from tests.benchmarks.bench_span_export import make_exporter, make_spans
+
+    benchmarks = []
+    exporter = make_exporter(0.0, async_logging=False)
+    for count in (16, 128, 512):
+        spans = make_spans(count)
+        benchmarks.append(
+            Benchmark(
+                f"export[spans={count}]",
+                timed(lambda spans=spans: exporter.export(spans)),
+            )
+        )
+
+    offloading = make_exporter(
+        0.0, async_logging=False, blob_store=LocalBlobStore(blob_root)
+    )
+    shapes = {
+        # Typical spans: every attribute stays inline.
+        "inline": {f"attr_{i}": "v" * 512 for i in range(10)},
+        # Prompts above the content-addressed threshold become references.
+        "content_addressed": {f"attr_{i}": "p" * 32 * 1024 for i in range(4)},
+        # Spans above the Cloud Logging entry limit are offloaded whole.
+        "oversized": {f"attr_{i}": str(i) * 15 * 1024 for i in range(20)},
+    }
+    for shape, attributes in shapes.items():
+        span_dict = {"attributes": attributes}
+
+        def run(loops: int, span_dict: dict = span_dict) -> float:
+            batch = [copy.deepcopy(span_dict) for _ in range(loops)]
+            start = time.perf_counter()
+            for i, item in enumerate(batch):
+                offloading._process_large_attributes(item, span_id=f"{i:016x}")
+            return time.perf_counter() - start
+
+        benchmarks.append(Benchmark(f"_process_large_attributes[{shape}]", run))
+    return benchmarks
+
+
+def env_parsing_benchmarks(env_dir: str) -> list[Benchmark]:
+    """`load_env_from_file` and `parse_env_vars` over small and large inputs."""
+    from app.agent_engine_app import load_env_from_file
+    from app.utils.deployment import parse_env_vars
+
+    benchmarks = []
+    for count in (10, 200):
+        path = os.path.join(env_dir, f"{count}.env")
+        with open(path, "w") as f:
+            f.write("# Generated for benchmarking\n")
+            for i in range(count):
+                f.write(f'VARIABLE_{i}="value-{i}-{"x" * 40}"\n')
+        benchmarks.append(
+            Benchmark(
+                f"load_env_from_file[vars={count}]",
+                timed(lambda path=path: load_env_from_file(path)),
+            )
+        )
+        env_vars = ",".join(f"VARIABLE_{i}=value-{i}" for i in range(count))
+        benchmarks.append(
+            Benchmark(
+                f"parse_env_vars[vars={count}]",
+                timed(lambda env_vars=env_vars: parse_env_vars(env_vars)),
+            )
+        )
+    return benchmarks
+
+
+def cold_import(loops: int) -> float:
+    """Time `import app.agent` in a fresh interpreter."""
+    total = 0.0
+    for _ in range(loops):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import time; start = time.perf_counter(); import app.agent; "
+                "print(time.perf_counter() - start)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=os.environ.copy(),
+        ).stdout
+        total += float(output.strip().splitlines()[-1])
+    return total
+
+
+def compare_to_baseline(
+    results: dict[str, dict[str, Any]], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """Print current against baseline medians and return the regressions."""
+    regressions = []
+    print(f"{'benchmark':<48} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            print(f"{name:<48} {'-':>12} {result['median_us']:>12.2f} {'new':>7}")
+            continue
+        ratio = result["median_us"] / reference["median_us"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(f"{name}: {ratio:.2f}x baseline")
+        print(
+            f"{name:<48} {reference['median_us']:>12.2f} "
+            f"{result['median_us']:>12.2f} {ratio:>6.2f}x{flag}"
+        )
+    return regressions
+
+
+@click.command()
+@click.option("--repeats", default=7, help="Timings per benchmark")
+@click.option("--min-time", default=0.05, help="Minimum seconds per timing")
+@click.option(
+    "--filter", "name_filter", default="", help="Run benchmarks containing this"
+)
+@click.option(
+    "--baseline", default=DEFAULT_BASELINE, help="Baseline file to save or compare"
+)
+@click.option("--save", is_flag=True, help="Write the results as the baseline")
+@click.option("--compare", is_flag=True, help="Compare the results to the baseline")
+@click.option(
+    "--tolerance", default=0.25, help="Allowed slowdown before failing, e.g. 0.25"
+)
+def main(
+    repeats: int,
+    min_time: float,
+    name_filter: str,
+    baseline: str,
+    save: bool,
+    compare: bool,
+    tolerance: float,
+) -> None:
+    """Time the hot-path functions and optionally save or compare a baseline."""
+    with tempfile.TemporaryDirectory() as scratch:
+        benchmarks = [
+            *token_injection_benchmarks(),
+            *exporter_benchmarks(scratch),
+            *env_parsing_benchmarks(scratch),
+            Benchmark("import app.agent[cold]", cold_import, calibrate=False),
+        ]
+        # Keep the per-call log lines of the measured paths off the report.
+        logging.disable(logging.WARNING)
+        results = {
+            benchmark.name: measure(benchmark, repeats, min_time)
+            for benchmark in benchmarks
+            if name_filter in benchmark.name
+        }
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if save:
+        os.makedirs(os.path.dirname(baseline) or ".", exist_ok=True)
+        with open(baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if compare:
+        with open(baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        if regressions:
+            raise click.ClickException("Regressions: " + "; ".join(regressions))
+    elif not save:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Token size and parse time of query results in each result encoding.
+
+Result sets are shaped like the connector's answers to typical Citi Bike
+questions, with values as strings as the connector returns them. For each
+encoding the tool response is serialized as the model receives it. Tokens are
+estimated at four characters per token, or counted by Gemini with
+`--count-tokens`. Encode time is the cost added to every tool call; parse time
+is `json.loads` of the serialized response plus `get_rows` back to row objects.
+
+Usage:
+    uv run python -m tests.benchmarks.bench_result_encoding --repeats 50
+"""
+
+import datetime
+import json
+import random
+import statistics
+import time
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+import click
+
+from app.utils.connector_results import (
+    CONNECTOR_ROWS_KEY,
+    RESULT_ENCODINGS,
+    encode_result,
+    get_rows,
+)
+from app.utils.history_compaction import estimate_tokens
+
+_STATIONS = [
+    "W 21 St & 6 Ave",
+    "Pershing Square North",
+    "E 17 St & Broadway",
+    "Broadway & E 22 St",
+    "West St & Chambers St",
+    "8 Ave & W 31 St",
+    "Lafayette St & E 8 St",
+    "Central Park S & 6 Ave",
+]
+
+
+def top_stations(rng: random.Random) -> list[dict[str, Any]]:
+    """Trips per start station, ordered by trips (GROUP BY one column)."""
+    return [
+        {
+            "start_station_name": f"{rng.choice(_STATIONS)} ({i})",
+            "trips": str(rng.randint(1_000, 250_000)),
+        }
+        for i in range(50)
+    ]
+
+
+def daily_trips(rng: random.Random) -> list[dict[str, Any]]:
+    """Trips and average duration per day of 2017."""
+    day = datetime.date(2017, 1, 1)
+    return [
+        {
+            "trip_date": str(day + datetime.timedelta(days=i)),
+            "trips": str(rng.randint(20_000, 70_000)),
+            "avg_duration_minutes": f"{rng.uniform(10, 20):.2f}",
+        }
+        for i in range(365)
+    ]
+
+
+def usertype_breakdown(rng: random.Random) -> list[dict[str, Any]]:
+    """Trips, duration and rider age per user type and gender."""
+    return [
+        {
+            "usertype": usertype,
+            "gender": gender,
+            "trips": str(rng.randint(100_000, 30_000_000)),
+            "avg_duration_minutes": f"{rng.uniform(10, 40):.2f}",
+            "avg_birth_year": f"{rng.uniform(1975, 1990):.1f}",
+        }
+        for usertype in ("Subscriber", "Customer")
+        for gender in ("male", "female", "unknown")
+    ]
+
+
+def raw_trips(rng: random.Random) -> list[dict[str, Any]]:
+    """A page of raw trips with every column (SELECT * ... LIMIT 50)."""
+    rows = []
+    for _ in range(50):
+        start = datetime.datetime(2018, 5, 1) + datetime.timedelta(
+            seconds=rng.randrange(30 * 86_400)
+        )
+        duration = rng.randint(60, 3_600)
+        station = rng.randint(72, 3_911)
+        rows.append(
+            {
+                "tripduration": str(duration),
+                "starttime": start.isoformat(sep=" "),
+                "stoptime": (start + datetime.timedelta(seconds=duration)).isoformat(
+                    sep=" "
+                ),
+                "start_station_id": str(station),
+                "start_station_name": rng.choice(_STATIONS),
+                "start_station_latitude": f"{rng.uniform(40.6, 40.8):.6f}",
+                "start_station_longitude": f"{rng.uniform(-74.02, -73.9):.6f}",
+                "end_station_id": str(rng.randint(72, 3_911)),
+                "end_station_name": rng.choice(_STATIONS),
+                "end_station_latitude": f"{rng.uniform(40.6, 40.8):.6f}",
+                "end_station_longitude": f"{rng.uniform(-74.02, -73.9):.6f}",
+                "bikeid": str(rng.randint(14_529, 33_699)),
+                "usertype": rng.choice(["Subscriber", "Customer"]),
+                "birth_year": str(rng.randint(1950, 2000)),
+                "gender": rng.choice(["male", "female", "unknown"]),
+                "customer_plan": "",
+            }
+        )
+    return rows
+
+
+RESULT_SETS: dict[str, Callable[[random.Random], list[dict[str, Any]]]] = {
+    "top_stations": top_stations,
+    "daily_trips": daily_trips,
+    "usertype_breakdown": usertype_breakdown,
+    "raw_trips": raw_trips,
+}
+
+
+def parse(serialized: str) -> list[dict[str, Any]] | None:
+    return get_rows(json.loads(serialized))
+
+
+def median_us(run: Callable[[], Any], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def make_token_counter(count_tokens: bool, model: str) -> Callable[[str], int]:
+    if not count_tokens:
+        return estimate_tokens
+    from google import genai
+
+    client = genai.Client()
+
+    def count(text: str) -> int:
+        result = client.models.count_tokens(model=model, contents=text)
+        return result.total_tokens or 0
+
+    return count
+
+
+@click.command()
+@click.option("--repeats", default=50, help="Timed runs per result set and encoding")
+@click.option(
+    "--count-tokens",
+    is_flag=True,
+    help="Count tokens with the Gemini API instead of estimating them",
+)
+@click.option("--model", default="gemini-2.5-flash", help="Model for --count-tokens")
+def main(repeats: int, count_tokens: bool, model: str) -> None:
+    """Print tokens, encode and parse time of each result set per encoding."""
+    tokens = make_token_counter(count_tokens, model)
+    report: dict[str, Any] = {}
+    for name, make_rows in RESULT_SETS.items():
+        response = {CONNECTOR_ROWS_KEY: make_rows(random.Random(0))}
+        baseline = None
+        report[name] = {"rows": len(response[CONNECTOR_ROWS_KEY])}
+        for encoding in RESULT_ENCODINGS:
+            encoded = encode_result(response, encoding) or response
+            serialized = json.dumps(encoded)
+            count = tokens(serialized)
+            baseline = baseline or count
+            report[name][encoding] = {
+                "tokens": count,
+                "tokens_vs_json": round(count / baseline, 2),
+                "encode_us": round(
+                    median_us(partial(encode_result, response, encoding), repeats), 1
+                ),
+                "parse_us": round(median_us(partial(parse, serialized), repeats), 1),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
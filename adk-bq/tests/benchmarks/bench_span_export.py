@@ -0,0 +1,184 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-span cost of CloudTraceLoggingSpanExporter.export, before and after batching.
+
+"before" replays the original exporter loop: `json.loads(span.to_json())` and
+one synchronous `log_struct` call per span, followed by the Cloud Trace write.
+"after" is the current exporter. Both run offline against fake clients whose
+calls sleep for a configurable round-trip time.
+
+Usage:
+    uv run python -m tests.benchmarks.bench_span_export --spans 64 --rtt-ms 5
+"""
+
+import json
+import statistics
+import time
+from typing import Any, cast
+
+import click
+from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter
+
+from app.utils.tracing import CloudTraceLoggingSpanExporter
+
+
+class _Collector(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: list[ReadableSpan] = []
+
+    def export(self, spans: Any) -> Any:
+        self.spans.extend(spans)
+
+
+class FakeBatch:
+    def __init__(self, rtt_s: float) -> None:
+        self.rtt_s = rtt_s
+
+    def log_struct(self, info: dict, **kwargs: Any) -> None:
+        pass
+
+    def commit(self) -> None:
+        time.sleep(self.rtt_s)
+
+
+class FakeLogger:
+    """Cloud Logging logger whose every write costs one round trip."""
+
+    def __init__(self, rtt_s: float) -> None:
+        self.rtt_s = rtt_s
+
+    def log_struct(self, info: dict, **kwargs: Any) -> None:
+        time.sleep(self.rtt_s)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self.rtt_s)
+
+
+class FakeLoggingClient:
+    def __init__(self, rtt_s: float) -> None:
+        self.rtt_s = rtt_s
+
+    def logger(self, name: str) -> FakeLogger:
+        return FakeLogger(self.rtt_s)
+
+
+class FakeStorageClient:
+    def bucket(self, name: str) -> Any:
+        return None
+
+
+class FakeTraceClient:
+    def __init__(self, rtt_s: float) -> None:
+        self.rtt_s = rtt_s
+
+    def batch_write_spans(self, **kwargs: Any) -> None:
+        time.sleep(self.rtt_s)
+
+
+def make_spans(count: int, attribute_bytes: int = 2048) -> list[ReadableSpan]:
+    """Create finished spans shaped like ADK agent spans."""
+    collector = _Collector()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(collector))
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        for i in range(count - 1):
+            with tracer.start_as_current_span(f"call_llm {i}") as span:
+                span.set_attribute("gen_ai.system", "gcp.vertex.agent")
+                span.set_attribute(
+                    "gcp.vertex.agent.llm_request", "x" * attribute_bytes
+                )
+                span.set_attribute("gcp.vertex.agent.invocation_id", f"e-{i}")
+    return collector.spans
+
+
+def make_exporter(rtt_s: float, **kwargs: Any) -> CloudTraceLoggingSpanExporter:
+    return CloudTraceLoggingSpanExporter(
+        project_id="bench-project",
+        client=FakeTraceClient(rtt_s),
+        logging_client=cast(Any, FakeLoggingClient(rtt_s)),
+        storage_client=FakeStorageClient(),
+        **kwargs,
+    )
+
+
+def legacy_export(
+    exporter: CloudTraceLoggingSpanExporter, spans: list[ReadableSpan]
+) -> None:
+    """The exporter loop as it was before batching."""
+    for span in spans:
+        span_context = span.get_span_context()
+        span_dict = json.loads(span.to_json())
+        span_dict["trace"] = (
+            f"projects/{exporter.project_id}/traces/{format(span_context.trace_id, 'x')}"
+        )
+        span_dict["span_id"] = format(span_context.span_id, "x")
+        span_dict = exporter._process_large_attributes(
+            span_dict=span_dict, span_id=span_dict["span_id"]
+        )
+        exporter.logger.log_struct(span_dict, labels={}, severity="INFO")
+    CloudTraceSpanExporter.export(exporter, spans)
+
+
+def per_span_us(run: Any, spans: list[ReadableSpan], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run(spans)
+        timings.append((time.perf_counter() - start) / len(spans) * 1e6)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option("--spans", default=64, help="Spans per export call")
+@click.option("--rtt-ms", default=5.0, help="Simulated round trip per API call")
+@click.option("--repeats", default=5, help="Export calls to time per variant")
+def main(spans: int, rtt_ms: float, repeats: int) -> None:
+    """Print the per-span export cost before and after batching."""
+    batch = make_spans(spans)
+    rtt_s = rtt_ms / 1000
+
+    legacy = make_exporter(rtt_s, async_logging=False)
+    before = per_span_us(lambda s: legacy_export(legacy, s), batch, repeats)
+
+    sync_batched = make_exporter(rtt_s, async_logging=False)
+    batched = per_span_us(sync_batched.export, batch, repeats)
+
+    current = make_exporter(rtt_s)
+    after = per_span_us(current.export, batch, repeats)
+    current.force_flush()
+    current.shutdown()
+
+    print(
+        json.dumps(
+            {
+                "spans_per_export": spans,
+                "rtt_ms": rtt_ms,
+                "before_us_per_span": round(before, 1),
+                "batched_sync_us_per_span": round(batched, 1),
+                "after_us_per_span": round(after, 1),
+                "dropped_batches": current.log_worker.stats.dropped
+                if current.log_worker
+                else 0,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares end-to-end latency and token use of the agent topologies.
+
+Runs the same Citi Bike questions through the `nested` and `direct` layouts of
+`app.agent.build_root_agent` against the live model and connector, and prints
+per-topology latency percentiles, LLM call counts and token totals.
+
+The query result cache and the semantic SQL cache are shared by every agent in
+the process, so they are turned off: otherwise a topology would be answered
+from the results and SQL cached while benchmarking the one before it.
+
+Usage:
+    uv run python -m tests.benchmarks.bench_topology --repeats 3
+"""
+
+import asyncio
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import click
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from app import agent
+from app.agent import AGENT_TOPOLOGIES, build_root_agent
+
+QUESTIONS = [
+    "How many trips are in the Citi Bike table?",
+    "What are the 5 most popular start stations?",
+    "How many trips were taken per month in 2018?",
+]
+
+
+@dataclass
+class TopologyResult:
+    topology: str
+    latencies_s: list[float] = field(default_factory=list)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+    def summary(self) -> dict[str, Any]:
+        latencies = sorted(self.latencies_s)
+        runs = len(latencies)
+        return {
+            "topology": self.topology,
+            "runs": runs,
+            "latency_p50_s": round(statistics.median(latencies), 3),
+            "latency_max_s": round(latencies[-1], 3),
+            "llm_calls_per_run": round(self.llm_calls / runs, 2),
+            "prompt_tokens_per_run": round(self.prompt_tokens / runs, 1),
+            "output_tokens_per_run": round(self.output_tokens / runs, 1),
+        }
+
+
+class UsageRecorder(BasePlugin):
+    """Counts model calls and tokens, including those made by sub-agents."""
+
+    def __init__(self, result: TopologyResult) -> None:
+        super().__init__(name="usage_recorder")
+        self.result = result
+
+    async def after_model_callback(
+        self, *, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> LlmResponse | None:
+        usage = llm_response.usage_metadata
+        if usage is not None and not llm_response.partial:
+            self.result.llm_calls += 1
+            self.result.prompt_tokens += usage.prompt_token_count or 0
+            self.result.output_tokens += usage.candidates_token_count or 0
+        return None
+
+
+async def run_topology(topology: str, repeats: int) -> TopologyResult:
+    """Runs every question `repeats` times in fresh sessions."""
+    result = TopologyResult(topology=topology)
+    runner = Runner(
+        agent=build_root_agent(topology),
+        app_name="bench",
+        session_service=InMemorySessionService(),
+        plugins=[UsageRecorder(result)],
+    )
+    for _ in range(repeats):
+        for question in QUESTIONS:
+            session = await runner.session_service.create_session(
+                app_name="bench", user_id="bench"
+            )
+            message = types.Content(
+                role="user", parts=[types.Part.from_text(text=question)]
+            )
+            start = time.perf_counter()
+            async for _event in runner.run_async(
+                user_id="bench", session_id=session.id, new_message=message
+            ):
+                pass
+            result.latencies_s.append(time.perf_counter() - start)
+    return result
+
+
+@click.command()
+@click.option("--repeats", default=1, help="Number of times to ask each question")
+@click.option(
+    "--topology",
+    "topologies",
+    multiple=True,
+    default=AGENT_TOPOLOGIES,
+    help="Topologies to compare (defaults to all)",
+)
+@click.option("--output", default=None, help="Optional path to write JSON results")
+def main(repeats: int, topologies: tuple[str, ...], output: str | None) -> None:
+    """Benchmark the agent topologies against each other."""
+    agent.QUERY_CACHE_ENABLED = False
+    agent.SEMANTIC_CACHE_ENABLED = False
+    summaries = []
+    for topology in topologies:
+        result = asyncio.run(run_topology(topology, repeats))
+        summaries.append(result.summary())
+        print(json.dumps(summaries[-1], indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import-time profile of the agent and a cold-start budget check.
+
+Imports `--module` in fresh interpreters with `-X importtime`, keeps the
+fastest run and prints where the time goes: the slowest modules by cumulative
+time and the self time per package. Exits non-zero when the import takes
+longer than `--budget-ms`.
+
+Usage:
+    uv run python -m tests.benchmarks.import_profile --budget-ms 1500
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+import click
+
+
+@dataclass(frozen=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def profile_import(module: str) -> list[ImportRecord]:
+    """Imports `module` in a fresh interpreter and parses `-X importtime`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=os.environ.copy(),
+    ).stderr
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        records.append(
+            ImportRecord(
+                module=name.strip(),
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+                depth=(len(name) - len(name.lstrip())) // 2,
+            )
+        )
+    return records
+
+
+def package_of(module: str, levels: int) -> str:
+    return ".".join(module.split(".")[:levels])
+
+
+@click.command()
+@click.option("--module", default="app.agent", help="Module to import")
+@click.option("--runs", default=3, help="Fresh interpreters to import in")
+@click.option("--top", default=20, help="Rows per table")
+@click.option(
+    "--package-depth", default=3, help="Dotted levels a package is grouped by"
+)
+@click.option(
+    "--budget-ms",
+    default=float(os.environ.get("IMPORT_BUDGET_MS", "1500")),
+    help="Maximum import time before failing",
+)
+def main(
+    module: str, runs: int, top: int, package_depth: int, budget_ms: float
+) -> None:
+    """Print the import-time breakdown of `--module` and check the budget."""
+    profiles = [profile_import(module) for _ in range(runs)]
+    # The root record is the last one printed for the requested module.
+    records = min(profiles, key=lambda profile: profile[-1].cumulative_us)
+    total_ms = records[-1].cumulative_us / 1000
+
+    print(f"Slowest imports of {module} by cumulative time")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in sorted(records, key=lambda r: -r.cumulative_us)[:top]:
+        print(
+            f"{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  "
+            f"{'  ' * record.depth}{record.module}"
+        )
+
+    by_package: dict[str, int] = defaultdict(int)
+    for record in records:
+        by_package[package_of(record.module, package_depth)] += record.self_us
+    print("\nSelf time by package")
+    print(f"{'self ms':>9}  package")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"{self_us / 1000:>9.1f}  {package}")
+
+    print(f"\nimport {module}: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    if total_ms > budget_ms:
+        raise click.ClickException(
+            f"import {module} took {total_ms:.0f} ms, over the {budget_ms:.0f} ms budget"
+        )
+
+
+if __name__ == "__main__":
+    main()
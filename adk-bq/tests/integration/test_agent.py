@@ -15,10 +15,10 @@
 # mypy: disable-error-code="union-attr"
 from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
 from app.agent import root_agent
+from app.utils.session_store import BoundedInMemorySessionService
 
 
 def test_agent_stream() -> None:
@@ -27,7 +27,7 @@ def test_agent_stream() -> None:
     Tests that the agent returns valid streaming responses.
     """
 
-    session_service = InMemorySessionService()
+    session_service = BoundedInMemorySessionService()
 
     session = session_service.create_session_sync(user_id="test_user", app_name="test")
     runner = Runner(agent=root_agent, session_service=session_service, app_name="test")
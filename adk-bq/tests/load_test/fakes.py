@@ -0,0 +1,233 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-ins for Gemini and the BigQuery connector used by load tests.
+
+`FakeGemini` answers like the real agents do (delegate to the sub-agent, call
+the connector with SQL, then summarise the rows) with latencies drawn from a
+profile, so the agent code itself runs unchanged and its overhead shows up in
+the measurements.
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass
+from typing import Any
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from app.tools import BQ_TOOL_NAME_PREFIX
+from app.utils.connector_results import CONNECTOR_ROWS_KEY
+from app.utils.schema_snapshot import DEFAULT_TABLE
+
+FAKE_MODEL_PREFIX = "fake-"
+
+
+@dataclass(frozen=True)
+class LlmProfile:
+    """Latency model of an LLM call.
+
+    A call takes `first_token_s` plus the prompt processed at
+    `prefill_tokens_per_s`, then emits `output_tokens` at `tokens_per_s`.
+    """
+
+    first_token_s: float
+    prefill_tokens_per_s: float
+    tokens_per_s: float
+    output_tokens: int
+    jitter: float = 0.2
+
+
+LLM_PROFILES = {
+    "instant": LlmProfile(0.0, float("inf"), float("inf"), 40, jitter=0.0),
+    "flash": LlmProfile(0.35, 40_000, 180, 120),
+    "pro": LlmProfile(1.2, 15_000, 70, 200),
+    "slow": LlmProfile(3.0, 5_000, 25, 200),
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _jittered(seconds: float, jitter: float) -> float:
+    return seconds * random.uniform(1 - jitter, 1 + jitter) if jitter else seconds
+
+
+class FakeGemini(BaseLlm):
+    """`BaseLlm` resolving `fake-<profile>` model names, e.g. `fake-flash`.
+
+    Registered with `LLMRegistry`, so setting `AGENT_MODEL=fake-flash` makes
+    every agent built by `app.agent` use it.
+    """
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [rf"{FAKE_MODEL_PREFIX}.*"]
+
+    @property
+    def profile(self) -> LlmProfile:
+        name = self.model.removeprefix(FAKE_MODEL_PREFIX)
+        return LLM_PROFILES.get(name, LLM_PROFILES["flash"])
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        profile = self.profile
+        prompt_tokens = _estimate_tokens(
+            str(llm_request.config.system_instruction or "")
+            + "".join(str(content) for content in llm_request.contents)
+        )
+        content, output_tokens = _respond(llm_request, profile.output_tokens)
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+        await asyncio.sleep(
+            _jittered(
+                profile.first_token_s + prompt_tokens / profile.prefill_tokens_per_s,
+                profile.jitter,
+            )
+        )
+        generation_s = _jittered(output_tokens / profile.tokens_per_s, profile.jitter)
+        text = content.parts[0].text if content.parts else None
+        if stream and text:
+            words = text.split(" ")
+            chunk = max(1, len(words) // 4)
+            for start in range(0, len(words), chunk):
+                await asyncio.sleep(generation_s * chunk / len(words))
+                yield LlmResponse(
+                    content=types.Content(
+                        role="model",
+                        parts=[types.Part(text=" ".join(words[start : start + chunk]))],
+                    ),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(generation_s)
+        yield LlmResponse(content=content, usage_metadata=usage)
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    for content in reversed(llm_request.contents):
+        for part in content.parts or []:
+            if content.role == "user" and part.text:
+                return part.text
+    return ""
+
+
+def _respond(llm_request: LlmRequest, output_tokens: int) -> tuple[types.Content, int]:
+    """Decides the next step the way the real agents would."""
+    last = llm_request.contents[-1] if llm_request.contents else None
+    answered = last is not None and any(
+        part.function_response for part in last.parts or []
+    )
+    question = _last_user_text(llm_request)
+    tools = [name for name in llm_request.tools_dict if name != "fetch_query_page"]
+    if not answered and tools:
+        bq_tools = [name for name in tools if name.startswith(BQ_TOOL_NAME_PREFIX)]
+        if bq_tools:
+            call = types.FunctionCall(
+                name=bq_tools[0], args={"query": fake_sql(question)}
+            )
+        else:
+            call = types.FunctionCall(name=tools[0], args={"request": question})
+        return types.Content(role="model", parts=[types.Part(function_call=call)]), 30
+    words = ["Citi", "Bike", "riders", "took", "trips", "from", "these", "stations."]
+    text = " ".join(words[i % len(words)] for i in range(output_tokens))
+    return types.Content(role="model", parts=[types.Part(text=text)]), output_tokens
+
+
+def fake_sql(question: str) -> str:
+    """Returns deterministic SQL for `question`, so repeated questions match."""
+    tag = hashlib.sha256(question.encode()).hexdigest()[:8]
+    return (
+        f"SELECT start_station_name, COUNT(*) AS trips FROM `{DEFAULT_TABLE}` "
+        f"WHERE bikeid IS NOT NULL GROUP BY start_station_name "
+        f"ORDER BY trips DESC LIMIT 20 -- {tag}"
+    )
+
+
+class FakeExecuteCustomQueryTool(BaseTool):
+    """Stand-in for the connector's `ExecuteCustomQuery` action."""
+
+    def __init__(self, latency_s: float, rows: int, jitter: float = 0.3) -> None:
+        super().__init__(
+            name=f"{BQ_TOOL_NAME_PREFIX}_execute_custom_query",
+            description="Runs a BigQuery SQL query against the Citi Bike data.",
+        )
+        self.latency_s = latency_s
+        self.rows = rows
+        self.jitter = jitter
+
+    def _get_declaration(self) -> types.FunctionDeclaration:
+        return types.FunctionDeclaration(
+            name=self.name,
+            description=self.description,
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={"query": types.Schema(type=types.Type.STRING)},
+                required=["query"],
+            ),
+        )
+
+    async def run_async(
+        self, *, args: dict[str, Any], tool_context: ToolContext
+    ) -> Any:
+        await asyncio.sleep(_jittered(self.latency_s, self.jitter))
+        seed = int(hashlib.sha256(str(args.get("query")).encode()).hexdigest(), 16)
+        rng = random.Random(seed)
+        return {
+            CONNECTOR_ROWS_KEY: [
+                {
+                    "start_station_name": f"Station {rng.randint(1, 900)}",
+                    "trips": rng.randint(1_000, 250_000),
+                }
+                for _ in range(self.rows)
+            ]
+        }
+
+
+class FakeBigQueryConnector(BaseToolset):
+    """Toolset exposing `FakeExecuteCustomQueryTool`.
+
+    Connector latency and result size come from `LOAD_TEST_CONNECTOR_LATENCY_MS`
+    and `LOAD_TEST_CONNECTOR_ROWS`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.tool = FakeExecuteCustomQueryTool(
+            latency_s=float(os.getenv("LOAD_TEST_CONNECTOR_LATENCY_MS", "800")) / 1000,
+            rows=int(os.getenv("LOAD_TEST_CONNECTOR_ROWS", "20")),
+        )
+
+    async def get_tools(
+        self, readonly_context: ReadonlyContext | None = None
+    ) -> list[BaseTool]:
+        return [self.tool]
+
+    async def close(self) -> None:
+        pass
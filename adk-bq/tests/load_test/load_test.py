@@ -15,9 +15,14 @@
 import json
 import logging
 import os
+import random
 import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
 
-from locust import HttpUser, between, task
+from locust import HttpUser, between, events, task
 
 # Configure logging
 logging.basicConfig(
@@ -25,9 +30,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Vertex AI and load agent config
-with open("deployment_metadata.json") as f:
-    remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
+# LOAD_TEST_TARGET=local drives `tests/load_test/local_server.py` instead of the
+# deployed agent engine.
+LOAD_TEST_TARGET = os.environ.get("LOAD_TEST_TARGET", "remote")
+
+if LOAD_TEST_TARGET == "local":
+    remote_agent_engine_id = "projects/local/locations/local/reasoningEngines/local"
+else:
+    # Initialize Vertex AI and load agent config
+    with open("deployment_metadata.json") as f:
+        remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
 
 parts = remote_agent_engine_id.split("/")
 project_id = parts[1]
@@ -35,38 +47,173 @@ location = parts[3]
 engine_id = parts[5]
 
 # Convert remote agent engine ID to streaming URL.
-base_url = f"https://{location}-aiplatform.googleapis.com"
-url_path = f"/v1/projects/{project_id}/locations/{location}/reasoningEngines/{engine_id}:streamQuery"
+if LOAD_TEST_TARGET == "local":
+    base_url = os.environ.get("LOAD_TEST_HOST", "http://127.0.0.1:8080")
+else:
+    base_url = f"https://{location}-aiplatform.googleapis.com"
+engine_path = (
+    f"/v1/projects/{project_id}/locations/{location}/reasoningEngines/{engine_id}"
+)
+url_path = f"{engine_path}:streamQuery"
+query_url_path = f"{engine_path}:query"
 
 logger.info("Using remote agent engine ID: %s", remote_agent_engine_id)
 logger.info("Using base URL: %s", base_url)
 logger.info("Using URL path: %s", url_path)
 
 
+@dataclass(frozen=True)
+class Scenario:
+    """A conversation drawn from the workload corpus.
+
+    Each turn is a question or a list of paraphrases one is picked from, so
+    recurring questions reach the caches the way real traffic does.
+    """
+
+    name: str
+    category: str
+    weight: float
+    turns: list[str | list[str]]
+
+    def questions(self, rng: random.Random) -> list[str]:
+        return [
+            turn if isinstance(turn, str) else rng.choice(turn) for turn in self.turns
+        ]
+
+
+SCENARIOS_PATH = Path(
+    os.environ.get(
+        "LOAD_TEST_SCENARIOS", Path(__file__).with_name("citibike_scenarios.json")
+    )
+)
+with open(SCENARIOS_PATH) as f:
+    SCENARIOS = [Scenario(**scenario) for scenario in json.load(f)]
+SCENARIO_WEIGHTS = [scenario.weight for scenario in SCENARIOS]
+
+# Latency breakdown reported next to the total of each turn.
+FIRST_EVENT_METRIC = "/streamQuery first_event"
+FIRST_TOOL_CALL_METRIC = "/streamQuery first_tool_call"
+FIRST_TOKEN_METRIC = "/streamQuery first_visible_token"
+CONNECTOR_METRIC = "/streamQuery connector"
+TOTAL_METRIC = "/streamQuery end"
+
+# Set by the agent on each connector round trip that missed the result cache.
+CONNECTOR_LATENCY_KEY = "connector_latency_ms"
+
+
+def _threshold(name: str, default: str) -> float | None:
+    value = os.environ.get(name, default)
+    return float(value) if value else None
+
+
+# Service level objectives checked when the run ends. A breach makes Locust
+# exit non-zero; set a threshold to an empty string to disable it.
+P95_SLOS_MS = {
+    FIRST_EVENT_METRIC: _threshold("LOAD_TEST_SLO_P95_FIRST_EVENT_MS", "10000"),
+    FIRST_TOKEN_METRIC: _threshold("LOAD_TEST_SLO_P95_FIRST_TOKEN_MS", "20000"),
+    TOTAL_METRIC: _threshold("LOAD_TEST_SLO_P95_TOTAL_MS", "60000"),
+}
+MAX_FAILURE_RATIO = _threshold("LOAD_TEST_SLO_MAX_FAILURE_RATIO", "0.01")
+
+
+def _function_calls(event: Any) -> list[str]:
+    if not isinstance(event, dict):
+        return []
+    parts = (event.get("content") or {}).get("parts") or []
+    return [
+        part["function_call"].get("name") for part in parts if part.get("function_call")
+    ]
+
+
+def _has_visible_text(event: Any) -> bool:
+    """True for an event with text the user sees, streamed or final."""
+    if not isinstance(event, dict):
+        return False
+    parts = (event.get("content") or {}).get("parts") or []
+    return any(part.get("text") and not part.get("thought") for part in parts)
+
+
+def _connector_latency_ms(event: Any) -> float | None:
+    if not isinstance(event, dict):
+        return None
+    state_delta = (event.get("actions") or {}).get("state_delta") or {}
+    return state_delta.get(CONNECTOR_LATENCY_KEY)
+
+
 class ChatStreamUser(HttpUser):
-    """Simulates a user interacting with the chat stream API."""
+    """Simulates a Citi Bike analyst holding multi-turn conversations."""
 
-    wait_time = between(1, 3)  # Wait 1-3 seconds between tasks
+    wait_time = between(1, 3)  # Wait 1-3 seconds between conversations
     host = base_url  # Set the base host URL for Locust
 
+    def on_start(self) -> None:
+        self.user_id = f"load-test-{uuid.uuid4().hex[:12]}"
+        self.rng = random.Random()
+        self.headers = {"Content-Type": "application/json"}
+        if LOAD_TEST_TARGET != "local":
+            self.headers["Authorization"] = f"Bearer {os.environ['_AUTH_TOKEN']}"
+
     @task
-    def chat_stream(self) -> None:
-        """Simulates a chat stream interaction."""
-        headers = {"Content-Type": "application/json"}
-        headers["Authorization"] = f"Bearer {os.environ['_AUTH_TOKEN']}"
+    def conversation(self) -> None:
+        """Runs a weighted scenario from the corpus in a fresh session."""
+        scenario = self.rng.choices(SCENARIOS, weights=SCENARIO_WEIGHTS)[0]
+        session_id = self.create_session()
+        if session_id is None:
+            return
+        for question in scenario.questions(self.rng):
+            if not self.chat_stream(session_id, question, scenario):
+                return
 
+    def create_session(self) -> str | None:
+        """Creates a session so follow-up questions share its history."""
+        with self.client.post(
+            query_url_path,
+            headers=self.headers,
+            json={
+                "class_method": "async_create_session",
+                "input": {"user_id": self.user_id},
+            },
+            catch_response=True,
+            name="/query async_create_session",
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"Unexpected status code: {response.status_code}")
+                return None
+            session_id = (response.json().get("output") or {}).get("id")
+            if session_id is None:
+                response.failure("No session id in response")
+            return session_id
+
+    def fire_metric(self, name: str, response_time_ms: float, response: Any) -> None:
+        self.environment.events.request.fire(
+            request_type="POST",
+            name=name,
+            response_time=response_time_ms,
+            response_length=0,
+            response=response,
+            context={},
+        )
+
+    def chat_stream(self, session_id: str, message: str, scenario: Scenario) -> bool:
+        """Sends one turn and reports its latency breakdown.
+
+        Returns:
+            Whether the turn succeeded, so a failed conversation can stop.
+        """
         data = {
             "class_method": "async_stream_query",
             "input": {
-                "user_id": "test",
-                "message": "What's the weather in San Francisco?",
+                "user_id": self.user_id,
+                "session_id": session_id,
+                "message": message,
             },
         }
 
         start_time = time.time()
+        first_event_at = first_tool_call_at = first_token_at = None
         with self.client.post(
             url_path,
-            headers=headers,
+            headers=self.headers,
             json=data,
             catch_response=True,
             name="/streamQuery async_stream_query",
@@ -78,6 +225,8 @@ class ChatStreamUser(HttpUser):
                 has_error = False
                 for line in response.iter_lines():
                     if line:
+                        if first_event_at is None:
+                            first_event_at = time.time()
                         line_str = line.decode("utf-8")
                         events.append(line_str)
 
@@ -109,20 +258,72 @@ class ChatStreamUser(HttpUser):
                                     )
                         except json.JSONDecodeError:
                             # If it's not valid JSON, continue processing
-                            pass
+                            continue
+
+                        if first_tool_call_at is None and _function_calls(event_data):
+                            first_tool_call_at = time.time()
+                        if first_token_at is None and _has_visible_text(event_data):
+                            first_token_at = time.time()
+                        connector_ms = _connector_latency_ms(event_data)
+                        if connector_ms is not None:
+                            self.fire_metric(CONNECTOR_METRIC, connector_ms, response)
 
                 end_time = time.time()
                 total_time = end_time - start_time
 
-                # Only fire success event if no errors were found
+                # Only fire success events if no errors were found
                 if not has_error:
-                    self.environment.events.request.fire(
-                        request_type="POST",
-                        name="/streamQuery end",
-                        response_time=total_time * 1000,  # Convert to milliseconds
-                        response_length=len(events),
-                        response=response,
-                        context={},
-                    )
+                    if first_event_at is not None:
+                        self.fire_metric(
+                            FIRST_EVENT_METRIC,
+                            (first_event_at - start_time) * 1000,
+                            response,
+                        )
+                    if first_tool_call_at is not None:
+                        self.fire_metric(
+                            FIRST_TOOL_CALL_METRIC,
+                            (first_tool_call_at - start_time) * 1000,
+                            response,
+                        )
+                    if first_token_at is not None:
+                        self.fire_metric(
+                            FIRST_TOKEN_METRIC,
+                            (first_token_at - start_time) * 1000,
+                            response,
+                        )
+                    for name in (TOTAL_METRIC, f"{TOTAL_METRIC} [{scenario.category}]"):
+                        self.environment.events.request.fire(
+                            request_type="POST",
+                            name=name,
+                            response_time=total_time * 1000,  # Convert to milliseconds
+                            response_length=len(events),
+                            response=response,
+                            context={},
+                        )
+                return not has_error
             else:
                 response.failure(f"Unexpected status code: {response.status_code}")
+                return False
+
+
+@events.quitting.add_listener
+def check_slos(environment: Any, **kwargs: Any) -> None:
+    """Fails the run when a service level objective is breached."""
+    violations = []
+    for name, threshold in P95_SLOS_MS.items():
+        entry = environment.stats.get(name, "POST")
+        if threshold is None:
+            continue
+        if entry.num_requests == 0:
+            violations.append(f"{name}: no successful samples")
+            continue
+        p95 = entry.get_response_time_percentile(0.95)
+        if p95 > threshold:
+            violations.append(f"{name}: p95 {p95:.0f} ms > {threshold:.0f} ms")
+    fail_ratio = environment.stats.total.fail_ratio
+    if MAX_FAILURE_RATIO is not None and fail_ratio > MAX_FAILURE_RATIO:
+        violations.append(f"failure ratio {fail_ratio:.3f} > {MAX_FAILURE_RATIO}")
+    for violation in violations:
+        logger.error("SLO breached: %s", violation)
+    if violations:
+        environment.process_exit_code = 1
@@ -0,0 +1,231 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serves `AgentEngineApp` locally over the Agent Engine `:streamQuery` contract.
+
+Gemini and the BigQuery connector are replaced by the stand-ins in
+`tests.load_test.fakes`, so `load_test.py` can measure the agent's own
+throughput and latency on a laptop, without a deployment or credentials.
+
+Usage:
+    uv run python -m tests.load_test.local_server --llm-profile flash
+    LOAD_TEST_TARGET=local locust -f tests/load_test/load_test.py ...
+"""
+
+import json
+import logging
+import os
+from collections.abc import AsyncIterator
+from typing import Any
+
+import click
+
+LOCAL_ENGINE_PATH = "projects/local/locations/local/reasoningEngines/local"
+LOCAL_AUTHORIZATION_ID = "load-test-oauth"
+
+
+def configure_offline_environment(
+    llm_profile: str, connector_latency_ms: float, connector_rows: int, topology: str
+) -> None:
+    """Point `app.agent` at the local stand-ins. Must run before importing `app`."""
+    os.environ.update(
+        {
+            "AGENT_MODEL": f"fake-{llm_profile}",
+            "AGENT_TOPOLOGY": topology,
+            "BQ_CONNECTOR_FACTORY": "tests.load_test.fakes:FakeBigQueryConnector",
+            "LOAD_TEST_CONNECTOR_LATENCY_MS": str(connector_latency_ms),
+            "LOAD_TEST_CONNECTOR_ROWS": str(connector_rows),
+            "SEMANTIC_CACHE_EMBEDDER": "hashing",
+            "BQ_AUTHORIZATION_ID": LOCAL_AUTHORIZATION_ID,
+        }
+    )
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "local-load-test")
+    os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "us-central1")
+
+
+class _LocalFeedbackSink:
+    """Writes feedback to the process log instead of Cloud Logging."""
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        for entry in entries:
+            logging.getLogger(__name__).info(json.dumps(entry))
+
+
+def build_local_app() -> Any:
+    """Create an `AgentEngineApp` wired to the stand-ins, ready to serve."""
+    import vertexai
+    from google.adk.models.registry import LLMRegistry
+    from google.auth.credentials import AnonymousCredentials
+    from vertexai.agent_engines.templates.adk import AdkApp
+
+    from app.agent import root_agent
+    from app.agent_engine_app import AgentEngineApp
+    from app.utils.feedback import FeedbackWriter
+    from app.utils.session_store import BoundedInMemorySessionService
+    from tests.load_test.fakes import FakeGemini
+
+    class OfflineAgentEngineApp(AgentEngineApp):
+        def set_up(self) -> None:
+            """Set up the ADK runner without Cloud Logging and Cloud Trace."""
+            AdkApp.set_up(self)
+            self.feedback_writer = FeedbackWriter.from_env(_LocalFeedbackSink())
+            self.tail_sampler = None
+
+    class OAuthSessionService(BoundedInMemorySessionService):
+        """Seeds new sessions with an OAuth token, as Gemini Enterprise does.
+
+        Bounded like a long-lived worker's store, so memory measured under
+        load reflects what a worker holds after days of traffic.
+        """
+
+        async def create_session(self, **kwargs: Any) -> Any:
+            kwargs["state"] = {
+                LOCAL_AUTHORIZATION_ID: "load-test-token",
+                **(kwargs.get("state") or {}),
+            }
+            return await super().create_session(**kwargs)
+
+    # Nothing calls Google Cloud, so no application default credentials are needed.
+    vertexai.init(
+        project=os.environ["GOOGLE_CLOUD_PROJECT"],
+        location=os.environ["GOOGLE_CLOUD_LOCATION"],
+        credentials=AnonymousCredentials(),
+    )
+    LLMRegistry.register(FakeGemini)
+    agent_engine = OfflineAgentEngineApp(
+        agent=root_agent, session_service_builder=OAuthSessionService.from_env
+    )
+    agent_engine.set_up()
+    return agent_engine
+
+
+def create_server(agent_engine: Any) -> Any:
+    """Create the FastAPI app exposing `agent_engine` like Agent Engine does."""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import StreamingResponse
+
+    server = FastAPI()
+    operations = agent_engine.register_operations()
+
+    @server.get("/health")
+    async def health() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @server.get("/memory")
+    async def memory() -> dict[str, Any]:
+        """Memory gauge of the session store and the worker's RSS."""
+        return agent_engine._tmpl_attrs["session_service"].stats()
+
+    @server.post("/v1/" + LOCAL_ENGINE_PATH + ":streamQuery")
+    async def stream_query(body: dict[str, Any]) -> StreamingResponse:
+        if body.get("class_method") not in operations.get("async_stream", []):
+            raise HTTPException(400, f"Unsupported method {body.get('class_method')}")
+        method = getattr(agent_engine, body["class_method"])
+
+        async def events() -> AsyncIterator[str]:
+            try:
+                async for event in method(**body.get("input", {})):
+                    yield json.dumps(event) + "\n"
+            except Exception as e:
+                logging.exception("Stream query failed")
+                yield json.dumps({"code": 500, "message": str(e)}) + "\n"
+
+        return StreamingResponse(events(), media_type="application/json")
+
+    @server.post("/v1/" + LOCAL_ENGINE_PATH + ":query")
+    async def query(body: dict[str, Any]) -> dict[str, Any]:
+        class_method = body.get("class_method", "")
+        if class_method in operations.get("", []):
+            output = getattr(agent_engine, class_method)(**body.get("input", {}))
+        elif class_method in operations.get("async", []):
+            output = await getattr(agent_engine, class_method)(**body.get("input", {}))
+        else:
+            raise HTTPException(400, f"Unsupported method {class_method}")
+        return {"output": output}
+
+    return server
+
+
+def create_local_server() -> Any:
+    """Uvicorn factory: one agent and server per worker process.
+
+    The configuration is read from the environment set by
+    `configure_offline_environment`, which worker processes inherit.
+    """
+    return create_server(build_local_app())
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Interface to listen on")
+@click.option("--port", default=8080, help="Port to listen on")
+@click.option(
+    "--llm-profile",
+    default="flash",
+    type=click.Choice(["instant", "flash", "pro", "slow"]),
+    help="Latency profile of the fake model",
+)
+@click.option(
+    "--connector-latency-ms",
+    default=800.0,
+    help="Mean latency of a fake BigQuery query",
+)
+@click.option("--connector-rows", default=20, help="Rows returned per fake query")
+@click.option(
+    "--topology",
+    default="nested",
+    type=click.Choice(["nested", "direct"]),
+    help="Agent topology to serve",
+)
+@click.option("--workers", default=1, help="Worker processes, like NUM_WORKERS")
+@click.option(
+    "--cpus",
+    default=None,
+    type=int,
+    help="Pin the server to this many CPUs to emulate a container size",
+)
+def serve_local_agent(
+    host: str,
+    port: int,
+    llm_profile: str,
+    connector_latency_ms: float,
+    connector_rows: int,
+    topology: str,
+    workers: int,
+    cpus: int | None,
+) -> None:
+    """Serve the agent with fake Gemini and connector back ends."""
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    configure_offline_environment(
+        llm_profile, connector_latency_ms, connector_rows, topology
+    )
+    if cpus is not None:
+        # Inherited by the worker processes.
+        os.sched_setaffinity(0, range(cpus))
+    logging.info(
+        f"Serving {LOCAL_ENGINE_PATH} on http://{host}:{port} with {workers} workers"
+    )
+    uvicorn.run(
+        "tests.load_test.local_server:create_local_server",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    serve_local_agent()
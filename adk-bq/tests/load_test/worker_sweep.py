@@ -0,0 +1,200 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Finds the worker count that serves the most traffic for a container size.
+
+For each candidate worker count, starts `local_server` pinned to `--cpus`
+CPUs, drives it with `load_test.py` and records throughput, latency and
+failures of the conversation turns. The best worker count is the one with the
+highest throughput whose p95 and failure ratio stay within the SLOs; deploy
+with it as `--num-workers`.
+
+Usage:
+    uv run python -m tests.load_test.worker_sweep --cpus 4 --workers 1,2,4,8 --users 50
+"""
+
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any
+
+import click
+
+SERVER_START_TIMEOUT_S = 180
+
+
+def wait_until_ready(url: str, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException("Local server exited during start-up")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise click.ClickException(
+        f"Local server not ready after {SERVER_START_TIMEOUT_S}s"
+    )
+
+
+def read_turn_stats(csv_prefix: str) -> dict[str, Any]:
+    """Reads the turn and aggregate rows of a Locust `_stats.csv` file."""
+    with open(f"{csv_prefix}_stats.csv") as f:
+        rows = {row["Name"]: row for row in csv.DictReader(f)}
+    turns = rows.get("/streamQuery end")
+    total = rows["Aggregated"]
+    requests = int(total["Request Count"])
+    return {
+        "turns_per_s": round(float(turns["Requests/s"]), 2) if turns else 0.0,
+        "p50_ms": float(turns["50%"]) if turns else None,
+        "p95_ms": float(turns["95%"]) if turns else None,
+        "failure_ratio": round(int(total["Failure Count"]) / requests, 4)
+        if requests
+        else 1.0,
+    }
+
+
+def run_point(
+    workers: int,
+    cpus: int,
+    users: int,
+    duration: str,
+    port: int,
+    server_args: list[str],
+    results_dir: str,
+) -> dict[str, Any]:
+    """Measures one worker count."""
+    host = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "tests.load_test.local_server",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--cpus",
+            str(cpus),
+            *server_args,
+        ]
+    )
+    try:
+        wait_until_ready(f"{host}/health", server)
+        # Let every worker finish importing the agent before load starts.
+        time.sleep(2 * workers)
+        csv_prefix = os.path.join(results_dir, f"workers_{workers}")
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "locust",
+                "-f",
+                "tests/load_test/load_test.py",
+                "--headless",
+                "--only-summary",
+                "-u",
+                str(users),
+                "-r",
+                str(max(1, users // 10)),
+                "-t",
+                duration,
+                "--csv",
+                csv_prefix,
+            ],
+            env={**os.environ, "LOAD_TEST_TARGET": "local", "LOAD_TEST_HOST": host},
+            check=False,
+        )
+        return {"workers": workers, **read_turn_stats(csv_prefix)}
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+@click.command()
+@click.option("--cpus", default=4, help="CPUs of the emulated container")
+@click.option("--workers", default="1,2,4,8", help="Comma-separated worker counts")
+@click.option("--users", default=50, help="Concurrent Locust users per run")
+@click.option("--duration", default="60s", help="Locust run time per worker count")
+@click.option("--port", default=8090, help="Port for the local server")
+@click.option(
+    "--llm-profile", default="flash", help="Latency profile of the fake model"
+)
+@click.option(
+    "--connector-latency-ms", default=800.0, help="Mean latency of a fake query"
+)
+@click.option(
+    "--max-p95-ms",
+    default=float(os.environ.get("LOAD_TEST_SLO_P95_TOTAL_MS", "60000")),
+    help="p95 turn latency a worker count must stay within",
+)
+@click.option(
+    "--max-failure-ratio",
+    default=float(os.environ.get("LOAD_TEST_SLO_MAX_FAILURE_RATIO", "0.01")),
+    help="Failure ratio a worker count must stay within",
+)
+def main(
+    cpus: int,
+    workers: str,
+    users: int,
+    duration: str,
+    port: int,
+    llm_profile: str,
+    connector_latency_ms: float,
+    max_p95_ms: float,
+    max_failure_ratio: float,
+) -> None:
+    """Sweep worker counts and print the best one for the container size."""
+    server_args = [
+        "--llm-profile",
+        llm_profile,
+        "--connector-latency-ms",
+        str(connector_latency_ms),
+    ]
+    points = []
+    with tempfile.TemporaryDirectory() as results_dir:
+        for count in (int(value) for value in workers.split(",")):
+            point = run_point(
+                count, cpus, users, duration, port, server_args, results_dir
+            )
+            point["within_slo"] = (
+                point["p95_ms"] is not None
+                and point["p95_ms"] <= max_p95_ms
+                and point["failure_ratio"] <= max_failure_ratio
+            )
+            points.append(point)
+
+    eligible = [point for point in points if point["within_slo"]]
+    best = max(eligible, key=lambda point: point["turns_per_s"], default=None)
+    print(
+        json.dumps(
+            {
+                "cpus": cpus,
+                "users": users,
+                "points": points,
+                "best_num_workers": best["workers"] if best else None,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+import vertexai
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.auth.credentials import AnonymousCredentials
+from google.genai import types
+from vertexai.agent_engines.templates.adk import AdkApp
+
+from app import agent_engine_app
+from app.agent_engine_app import AgentEngineApp
+
+
+class EchoLlm(BaseLlm):
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text="answer")])
+        )
+
+
+class OfflineAgentEngineApp(AgentEngineApp):
+    def set_up(self) -> None:
+        AdkApp.set_up(self)
+
+
+@pytest.mark.parametrize("progress", [False, True])
+def test_stream_query_runs_through_the_adk_app(
+    progress: bool, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(agent_engine_app, "PROGRESS_STREAMING_ENABLED", progress)
+    vertexai.init(
+        project="test-project",
+        location="us-central1",
+        credentials=AnonymousCredentials(),
+    )
+    app = OfflineAgentEngineApp(
+        agent=Agent(name="agent", model=EchoLlm(model="echo"), instruction="Answer.")
+    )
+    app.set_up()
+
+    async def run() -> list[dict[str, Any]]:
+        return [
+            event async for event in app.async_stream_query(message="hi", user_id="u")
+        ]
+
+    events = asyncio.run(run())
+    assert [event["content"]["parts"][0]["text"] for event in events] == ["answer"]
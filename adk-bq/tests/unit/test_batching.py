@@ -0,0 +1,65 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from app.utils.batching import BatchWorker
+
+
+def test_items_are_delivered_in_batches_in_order() -> None:
+    batches: list[list[int]] = []
+    worker = BatchWorker(batches.append, max_batch_size=3, flush_interval_seconds=5)
+    for i in range(7):
+        assert worker.submit(i)
+
+    assert worker.flush(timeout=5)
+    assert [item for batch in batches for item in batch] == list(range(7))
+    assert all(len(batch) <= 3 for batch in batches)
+    assert worker.stats.processed == 7
+
+
+def test_full_queue_drops_and_counts() -> None:
+    release = threading.Event()
+
+    def process(batch: list[int]) -> None:
+        release.wait(5)
+
+    worker = BatchWorker(process, max_batch_size=1, max_queue_size=2)
+    results = [worker.submit(i) for i in range(10)]
+    release.set()
+
+    assert worker.flush(timeout=5)
+    assert results.count(False) == worker.stats.dropped
+    assert worker.stats.dropped >= 7
+
+
+def test_handler_failures_are_counted_not_raised() -> None:
+    def fail(batch: list[int]) -> None:
+        raise RuntimeError("write failed")
+
+    worker = BatchWorker(fail)
+    worker.submit(1)
+
+    assert worker.flush(timeout=5)
+    assert worker.stats.failed == 1
+
+
+def test_shutdown_flushes_and_rejects_new_items() -> None:
+    batches: list[list[int]] = []
+    worker = BatchWorker(batches.append, flush_interval_seconds=60)
+    worker.submit(1)
+    worker.shutdown()
+
+    assert batches == [[1]]
+    assert not worker.submit(2)
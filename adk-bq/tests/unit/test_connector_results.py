@@ -0,0 +1,102 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from typing import Any
+
+import pytest
+
+from app.utils.connector_results import (
+    CONNECTOR_ROWS_KEY,
+    decode_rows,
+    encode_result,
+    encode_rows,
+    get_rows,
+    parse_result_encodings,
+)
+
+ROWS: list[dict[str, Any]] = [
+    {
+        "start_station_name": "W 21 St & 6 Ave, NE",
+        "trips": "120",
+        "avg_minutes": "13.5",
+        "zip": "00123",
+        "member": True,
+    },
+    {
+        "start_station_name": "Pershing Square North",
+        "trips": "7",
+        "avg_minutes": None,
+        "zip": "10017",
+        "member": False,
+    },
+]
+
+
+def test_columnar_lists_columns_once_with_typed_values() -> None:
+    encoded = encode_rows(ROWS, "columnar")
+
+    assert encoded["columns"] == [
+        "start_station_name",
+        "trips",
+        "avg_minutes",
+        "zip",
+        "member",
+    ]
+    assert encoded["types"] == ["STRING", "INTEGER", "FLOAT", "STRING", "BOOLEAN"]
+    assert encoded["row_count"] == 2
+    assert encoded["rows"][0] == ["W 21 St & 6 Ave, NE", 120, 13.5, "00123", True]
+    many = ROWS * 10
+    assert len(json.dumps(encode_rows(many, "columnar"))) < len(json.dumps(many)) * 0.6
+
+
+@pytest.mark.parametrize("encoding", ["columnar", "csv"])
+def test_encodings_read_back_as_typed_rows(encoding: str) -> None:
+    response = encode_result({CONNECTOR_ROWS_KEY: ROWS}, encoding)
+    assert response is not None
+
+    rows = get_rows(json.loads(json.dumps(response)))
+    assert rows is not None
+    assert [(row["trips"], row["avg_minutes"]) for row in rows] == [
+        (120, 13.5),
+        (7, None),
+    ]
+    assert [row["zip"] for row in rows] == ["00123", "10017"]
+    assert [row["member"] for row in rows] == [True, False]
+
+
+def test_csv_quotes_values_and_has_no_header_line() -> None:
+    encoded = encode_rows(ROWS, "csv")
+    assert encoded["csv"].splitlines() == [
+        '"W 21 St & 6 Ave, NE",120,13.5,00123,true',
+        "Pershing Square North,7,,10017,false",
+    ]
+    assert decode_rows(encoded)[1]["avg_minutes"] is None
+
+
+def test_responses_without_rows_are_left_alone() -> None:
+    assert encode_result({"error": "boom"}, "columnar") is None
+    assert encode_result({CONNECTOR_ROWS_KEY: ROWS}, "json") is None
+    with pytest.raises(ValueError):
+        encode_rows(ROWS, "xml")
+
+
+def test_parse_result_encodings() -> None:
+    assert parse_result_encodings("") == {}
+    assert parse_result_encodings("RootAgent=CSV, cloud_bqoauth_agent=json") == {
+        "RootAgent": "csv",
+        "cloud_bqoauth_agent": "json",
+    }
+    with pytest.raises(ValueError):
+        parse_result_encodings("RootAgent=yaml")
@@ -0,0 +1,108 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import datetime
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from google.adk.tools.application_integration_tool.application_integration_toolset import (
+    ApplicationIntegrationToolset,
+)
+from google.adk.tools.application_integration_tool.clients.connections_client import (
+    ConnectionsClient,
+)
+
+from app.utils.connector_spec import (
+    SnapshotConnectorToolset,
+    capture_connector_spec,
+    connector_key,
+    save_connector_spec,
+    usable_connector_spec,
+)
+
+SETTINGS: dict[str, Any] = {
+    "project": "test-project",
+    "location": "us-central1",
+    "connection": "bq-citibike",
+    "actions": ["ExecuteCustomQuery"],
+    "tool_name_prefix": "bqcitibike",
+    "tool_instructions": "Run SQL against the Citi Bike table.",
+}
+
+
+@pytest.fixture(autouse=True)
+def offline_connector(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Answers the connector metadata calls without the network."""
+    monkeypatch.setattr(
+        ConnectionsClient,
+        "get_connection_details",
+        lambda self: {
+            "name": "projects/test-project/locations/us-central1/connections/bq",
+            "serviceName": "bq-service",
+            "host": "",
+            "authOverrideEnabled": True,
+        },
+    )
+    monkeypatch.setattr(
+        ConnectionsClient,
+        "get_action_schema",
+        lambda self, action: {
+            "inputSchema": {"type": "object", "properties": {}},
+            "outputSchema": {"type": "object", "properties": {}},
+            "displayName": "Execute Custom Query",
+        },
+    )
+
+
+def declarations(toolset: Any) -> list[dict[str, Any]]:
+    tools = asyncio.run(toolset.get_tools())
+    return [tool._get_declaration().model_dump(exclude_none=True) for tool in tools]
+
+
+def test_snapshot_builds_the_same_tools_as_a_live_fetch(tmp_path: Path) -> None:
+    path = str(tmp_path / "connector_spec.json")
+    save_connector_spec(capture_connector_spec(**SETTINGS), path)
+
+    snapshot = usable_connector_spec(path, connector_key(**SETTINGS), 3600)
+
+    assert snapshot is not None
+    live = declarations(ApplicationIntegrationToolset(**SETTINGS))
+    assert declarations(SnapshotConnectorToolset(snapshot)) == live
+    assert live[0]["name"] == "bqcitibike_execute_custom_query"
+
+
+def test_snapshot_is_refused_when_stale_changed_or_tampered(tmp_path: Path) -> None:
+    path = tmp_path / "connector_spec.json"
+    snapshot = capture_connector_spec(**SETTINGS)
+    save_connector_spec(snapshot, str(path))
+    key = connector_key(**SETTINGS)
+
+    assert (
+        usable_connector_spec(str(path), {**key, "connection": "other"}, 3600) is None
+    )
+    snapshot.captured_at = (
+        datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    ).isoformat()
+    save_connector_spec(snapshot, str(path))
+    assert usable_connector_spec(str(path), key, 3600) is None
+    assert usable_connector_spec(str(path), key, 3 * 3600) is not None
+
+    data = json.loads(path.read_text())
+    data["connection_details"]["host"] = "elsewhere"
+    path.write_text(json.dumps(data))
+    assert usable_connector_spec(str(path), key, 3 * 3600) is None
+    assert usable_connector_spec(str(tmp_path / "missing.json"), key, 3600) is None
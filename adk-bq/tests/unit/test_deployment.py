@@ -0,0 +1,151 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from google.genai.errors import ClientError
+
+from app.utils.deployment import (
+    deployment_hashes,
+    hash_paths,
+    plan_deployment,
+    read_deployment_metadata,
+    write_deployment_metadata,
+)
+
+LOCATION = "us-central1"
+ENGINE = f"projects/123/locations/{LOCATION}/reasoningEngines/456"
+
+
+def engine(name: str = ENGINE, display_name: str = "bq-agent") -> Any:
+    return SimpleNamespace(
+        api_resource=SimpleNamespace(name=name, display_name=display_name)
+    )
+
+
+class StubAgentEngines:
+    """The `client.agent_engines` calls a deploy makes, recorded."""
+
+    def __init__(self, engines: list[Any]) -> None:
+        self.engines = {agent.api_resource.name: agent for agent in engines}
+        self.calls: list[str] = []
+
+    def get(self, *, name: str) -> Any:
+        self.calls.append("get")
+        if name not in self.engines:
+            raise ClientError(404, {"error": {"code": 404, "message": "not found"}})
+        return self.engines[name]
+
+    def list(self) -> list[Any]:
+        self.calls.append("list")
+        return list(self.engines.values())
+
+
+def client(*engines: Any) -> Any:
+    return SimpleNamespace(agent_engines=StubAgentEngines(list(engines)))
+
+
+def write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def package(tmp_path: Any) -> str:
+    root = os.path.join(tmp_path, "app")
+    write(os.path.join(root, "agent.py"), "root_agent = None\n")
+    write(os.path.join(root, "prompts.py"), 'instructions = "Be helpful."\n')
+    return root
+
+
+def hashes(package: str, **env_vars: str) -> dict[str, str]:
+    return deployment_hashes([package], ["google-adk==1.0"], env_vars, {"cpu": "4"})
+
+
+def test_package_hash_tracks_content_but_not_bytecode(package: str) -> None:
+    before = hash_paths([package])
+    write(os.path.join(package, "__pycache__", "agent.cpython-311.pyc"), "x")
+    write(os.path.join(package, "data", "stale.pyc"), "x")
+    assert hash_paths([package + "/"]) == before
+
+    write(os.path.join(package, "prompts.py"), 'instructions = "Be brief."\n')
+    assert hash_paths([package]) != before
+
+
+def test_unchanged_deploy_is_skipped_without_listing(package: str) -> None:
+    stub = client(engine())
+    metadata = {"remote_agent_engine_id": ENGINE, "content_hashes": hashes(package)}
+
+    plan = plan_deployment(stub, "bq-agent", LOCATION, hashes(package), metadata)
+
+    assert plan.skip
+    assert plan.existing.api_resource.name == ENGINE
+    assert stub.agent_engines.calls == ["get"]
+
+
+def test_changed_inputs_are_reported(package: str) -> None:
+    metadata = {"remote_agent_engine_id": ENGINE, "content_hashes": hashes(package)}
+    write(os.path.join(package, "prompts.py"), 'instructions = "Be brief."\n')
+
+    plan = plan_deployment(
+        client(engine()), "bq-agent", LOCATION, hashes(package, A="1"), metadata
+    )
+
+    assert not plan.skip
+    assert plan.changed == ["extra_packages", "env_vars"]
+
+
+@pytest.mark.parametrize(
+    "recorded",
+    [
+        # Deleted since the last deploy.
+        "projects/123/locations/us-central1/reasoningEngines/999",
+        # Deployed to another region.
+        "projects/123/locations/europe-west1/reasoningEngines/456",
+        None,
+    ],
+)
+def test_falls_back_to_listing_by_display_name(
+    package: str, recorded: str | None
+) -> None:
+    stub = client(engine(), engine(name=ENGINE + "7", display_name="other"))
+    metadata = {"remote_agent_engine_id": recorded, "content_hashes": hashes(package)}
+
+    plan = plan_deployment(stub, "bq-agent", LOCATION, hashes(package), metadata)
+
+    assert plan.existing.api_resource.name == ENGINE
+    # Hashes recorded for another engine say nothing about this one.
+    assert not plan.skip
+    assert stub.agent_engines.calls[-1] == "list"
+
+
+def test_new_agent_is_created(package: str) -> None:
+    plan = plan_deployment(client(), "bq-agent", LOCATION, hashes(package), {})
+    assert plan.existing is None
+    assert not plan.skip
+
+
+def test_metadata_records_the_hashes(tmp_path: Any, package: str) -> None:
+    path = os.path.join(tmp_path, "deployment_metadata.json")
+    assert read_deployment_metadata(path) == {}
+
+    write_deployment_metadata(engine(), path, content_hashes=hashes(package))
+
+    metadata = read_deployment_metadata(path)
+    assert metadata["remote_agent_engine_id"] == ENGINE
+    assert metadata["content_hashes"] == hashes(package)
@@ -0,0 +1,117 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from typing import Any
+
+from app.utils.feedback import (
+    CloudLoggingFeedbackSink,
+    FeedbackWriter,
+    InMemoryFeedbackSink,
+)
+
+
+def entry(i: int) -> dict[str, Any]:
+    return {"score": i, "invocation_id": f"inv-{i}", "log_type": "feedback"}
+
+
+def test_entries_are_written_in_batches() -> None:
+    sink = InMemoryFeedbackSink()
+    writer = FeedbackWriter(sink, max_batch_size=4, flush_interval_seconds=60)
+    for i in range(10):
+        assert writer.submit(entry(i))
+
+    assert writer.flush(timeout=5)
+    assert sink.entries == [entry(i) for i in range(10)]
+    assert all(len(batch) <= 4 for batch in sink.batches)
+    assert writer.stats.batches == len(sink.batches) < 10
+
+
+def test_entries_are_written_after_the_flush_interval() -> None:
+    written = threading.Event()
+
+    class Sink(InMemoryFeedbackSink):
+        def write(self, entries: list[dict[str, Any]]) -> None:
+            super().write(entries)
+            written.set()
+
+    sink = Sink()
+    writer = FeedbackWriter(sink, flush_interval_seconds=0.05)
+    writer.submit(entry(1))
+
+    assert written.wait(5)
+    assert sink.entries == [entry(1)]
+
+
+def test_full_queue_drops_and_counts() -> None:
+    release = threading.Event()
+
+    class BlockedSink(InMemoryFeedbackSink):
+        def write(self, entries: list[dict[str, Any]]) -> None:
+            release.wait(5)
+            super().write(entries)
+
+    writer = FeedbackWriter(BlockedSink(), max_batch_size=1, max_queue_size=2)
+    results = [writer.submit(entry(i)) for i in range(10)]
+    release.set()
+
+    assert writer.flush(timeout=5)
+    assert results.count(False) == writer.stats.dropped >= 7
+
+
+def test_shutdown_writes_queued_entries() -> None:
+    sink = InMemoryFeedbackSink()
+    writer = FeedbackWriter(sink, flush_interval_seconds=60)
+    writer.submit(entry(1))
+    writer.shutdown()
+
+    assert sink.entries == [entry(1)]
+    assert not writer.submit(entry(2))
+
+
+def test_cloud_logging_sink_writes_one_batch() -> None:
+    class Batch:
+        def __init__(self) -> None:
+            self.entries: list[tuple[dict[str, Any], str]] = []
+            self.commits = 0
+
+        def log_struct(self, info: dict[str, Any], severity: str) -> None:
+            self.entries.append((info, severity))
+
+        def commit(self) -> None:
+            self.commits += 1
+
+    class Logger:
+        def __init__(self) -> None:
+            self.batches: list[Batch] = []
+
+        def batch(self) -> Batch:
+            self.batches.append(Batch())
+            return self.batches[-1]
+
+    logger = Logger()
+    CloudLoggingFeedbackSink(logger).write([entry(1), entry(2)])
+
+    assert len(logger.batches) == 1
+    assert logger.batches[0].entries == [(entry(1), "INFO"), (entry(2), "INFO")]
+    assert logger.batches[0].commits == 1
+
+
+def test_from_env() -> None:
+    writer = FeedbackWriter.from_env(
+        InMemoryFeedbackSink(),
+        {"FEEDBACK_BATCH_SIZE": "3", "FEEDBACK_MAX_QUEUE_SIZE": "1"},
+    )
+    assert writer._worker._max_batch_size == 3
+    assert writer._worker._queue.maxsize == 1
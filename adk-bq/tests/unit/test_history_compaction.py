@@ -0,0 +1,189 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any
+
+from google.genai import types
+
+from app.utils.connector_results import CONNECTOR_ROWS_KEY
+from app.utils.history_compaction import HistoryCompactor, parse_token_budgets
+
+TOOL = "bqcitibike_execute_custom_query"
+
+
+def table(rows: int) -> str:
+    lines = ["| station | trips |", "|---|---:|"]
+    lines += [f"| Station {i} | {1000 - i} |" for i in range(rows)]
+    return "Top stations:\n" + "\n".join(lines) + "\nMost trips start downtown."
+
+
+def turn(question: str, sql: str, rows: int, call_id: str) -> list[types.Content]:
+    return [
+        types.Content(role="user", parts=[types.Part.from_text(text=question)]),
+        types.Content(
+            role="model",
+            parts=[
+                types.Part(
+                    function_call=types.FunctionCall(
+                        id=call_id, name=TOOL, args={"query": sql}
+                    )
+                )
+            ],
+        ),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id=call_id,
+                        name=TOOL,
+                        response={
+                            CONNECTOR_ROWS_KEY: [
+                                {"station": f"Station {i}", "trips": 1000 - i}
+                                for i in range(rows)
+                            ]
+                        },
+                    )
+                )
+            ],
+        ),
+        types.Content(role="model", parts=[types.Part.from_text(text=table(rows))]),
+    ]
+
+
+def first_part(content: types.Content) -> types.Part:
+    assert content.parts
+    return content.parts[0]
+
+
+def response_of(part: types.Part) -> dict[str, Any]:
+    assert part.function_response is not None
+    assert part.function_response.response is not None
+    return part.function_response.response
+
+
+def conversation(turns: int) -> list[types.Content]:
+    contents = []
+    for i in range(turns):
+        contents += turn(f"question {i}", f"SELECT {i}", rows=40, call_id=f"c{i}")
+    return contents
+
+
+def test_history_within_budget_is_unchanged() -> None:
+    contents = conversation(3)
+    compacted, report = HistoryCompactor().compact(contents, token_budget=10**6)
+    assert compacted is contents
+    assert report.tokens_saved == 0
+
+
+def test_old_results_are_summarized_and_recent_turns_kept() -> None:
+    contents = conversation(4)
+    compacted, report = HistoryCompactor(keep_recent_turns=2).compact(
+        contents, token_budget=1
+    )
+
+    response = response_of(first_part(compacted[2]))
+    assert response == {
+        "compacted": True,
+        "row_count": 40,
+        "columns": ["station", "trips"],
+        "sql": "SELECT 0",
+    }
+    answer = first_part(compacted[3]).text
+    assert answer is not None
+    assert "| Station 4 |" in answer and "| Station 5 |" not in answer
+    assert "(35 more rows omitted)" in answer
+    assert answer.endswith("Most trips start downtown.")
+    # The last two turns are sent verbatim.
+    assert compacted[8:] == contents[8:]
+    assert report.compacted_results == 2
+    assert report.compacted_tables == 2
+    assert report.tokens_saved > 0
+    assert report.tokens_after < report.tokens_before
+
+
+def test_compaction_stops_once_within_budget() -> None:
+    contents = conversation(4)
+    compactor = HistoryCompactor(keep_recent_turns=1)
+    full = sum(compactor.count_content_tokens(content) for content in contents)
+
+    compacted, report = compactor.compact(contents, token_budget=full - 1)
+    assert compacted[2] is not contents[2]
+    assert compacted[3:] == contents[3:]
+    assert report.compacted_results == 1
+
+
+def test_calls_without_ids_are_matched_by_position() -> None:
+    rows = [{"station": "Station 0", "trips": 1000}]
+    contents = [
+        types.Content(role="user", parts=[types.Part.from_text(text="q0")]),
+        types.Content(
+            role="model",
+            parts=[
+                types.Part(
+                    function_call=types.FunctionCall(name=TOOL, args={"query": sql})
+                )
+                for sql in ("SELECT 1", "SELECT 2")
+            ],
+        ),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        name=TOOL, response={CONNECTOR_ROWS_KEY: rows}
+                    )
+                )
+                for _ in range(2)
+            ],
+        ),
+        types.Content(role="user", parts=[types.Part.from_text(text="q1")]),
+    ]
+    compacted, _ = HistoryCompactor(keep_recent_turns=1).compact(
+        contents, token_budget=1
+    )
+    assert [response_of(part)["sql"] for part in compacted[2].parts or []] == [
+        "SELECT 1",
+        "SELECT 2",
+    ]
+
+
+def test_sub_agent_answers_have_their_tables_cut() -> None:
+    contents = [
+        types.Content(role="user", parts=[types.Part.from_text(text="q0")]),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        name="cloud_bqoauth_agent", response={"result": table(30)}
+                    )
+                )
+            ],
+        ),
+        types.Content(role="user", parts=[types.Part.from_text(text="q1")]),
+    ]
+    compacted, _ = HistoryCompactor(keep_recent_turns=1).compact(
+        contents, token_budget=1
+    )
+    result = response_of(first_part(compacted[1]))["result"]
+    assert "(25 more rows omitted)" in result
+
+
+def test_parse_token_budgets() -> None:
+    assert parse_token_budgets("") == {}
+    assert parse_token_budgets("RootAgent=6000, cloud_bqoauth_agent=12000") == {
+        "RootAgent": 6000,
+        "cloud_bqoauth_agent": 12000,
+    }
@@ -0,0 +1,89 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any
+
+from app.utils.connector_results import CONNECTOR_ROWS_KEY
+from app.utils.pagination import ResultPager
+
+
+def _response(n: int) -> dict[str, Any]:
+    return {
+        CONNECTOR_ROWS_KEY: [
+            {"ride_id": i, "station": f"Station {i}"} for i in range(n)
+        ]
+    }
+
+
+def test_small_results_pass_through() -> None:
+    pager = ResultPager(max_rows=10)
+    assert pager.paginate(_response(10), "alice") is None
+    assert pager.paginate({"error": "boom"}, "alice") is None
+
+
+def test_row_cap_pages_through_the_full_result() -> None:
+    pager = ResultPager(max_rows=4, max_bytes=10_000)
+    page = pager.paginate(_response(10), "alice")
+    assert page is not None
+
+    seen = [row["ride_id"] for row in page[CONNECTOR_ROWS_KEY]]
+    assert page["pagination"]["total_rows"] == 10
+    token = page["pagination"]["continuation_token"]
+    while token:
+        page = pager.fetch_page(token, "alice")
+        seen += [row["ride_id"] for row in page[CONNECTOR_ROWS_KEY]]
+        token = page["pagination"]["continuation_token"]
+
+    assert seen == list(range(10))
+
+
+def test_byte_cap_bounds_page_size() -> None:
+    pager = ResultPager(max_rows=100, max_bytes=100)
+    page = pager.paginate(_response(10), "alice")
+    assert page is not None
+    assert 0 < page["pagination"]["returned_rows"] < 10
+
+
+def test_continuation_is_scoped_to_the_user() -> None:
+    pager = ResultPager(max_rows=2)
+    page = pager.paginate(_response(5), "alice")
+    assert page is not None
+    token = page["pagination"]["continuation_token"]
+
+    assert "error" in pager.fetch_page(token, "bob")
+    assert "error" in pager.fetch_page("unknown:2", "alice")
+    assert "error" not in pager.fetch_page(token, "alice")
+
+
+def test_results_expire() -> None:
+    now = [0.0]
+    pager = ResultPager(max_rows=2, ttl_seconds=10, clock=lambda: now[0])
+    page = pager.paginate(_response(5), "alice")
+    assert page is not None
+    now[0] = 11
+
+    assert "error" in pager.fetch_page(
+        page["pagination"]["continuation_token"], "alice"
+    )
+
+
+def test_offset_past_the_end_is_an_error() -> None:
+    pager = ResultPager(max_rows=2)
+    page = pager.paginate(_response(5), "alice")
+    assert page is not None
+    result_id = page["pagination"]["continuation_token"].split(":")[0]
+
+    response = pager.fetch_page(f"{result_id}:9", "alice")
+    assert "past the end" in response["error"]
+    assert CONNECTOR_ROWS_KEY not in response
@@ -0,0 +1,121 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+
+from app.utils.payload_offload import LocalBlobStore, PayloadOffloader
+
+
+class CountingStore(LocalBlobStore):
+    def __init__(self, root: str) -> None:
+        super().__init__(root)
+        self.exists_calls = 0
+
+    def exists(self) -> bool:
+        self.exists_calls += 1
+        return super().exists()
+
+
+def test_payloads_are_compressed_and_uploaded_in_background(tmp_path: Path) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    offloader = PayloadOffloader(store)
+    payload = b'{"prompt": "' + b"x" * 10_000 + b'"}'
+
+    assert offloader.offload("spans/abc.json", payload)
+    assert offloader.flush(timeout=5)
+
+    assert store.read("spans/abc.json") == payload
+    assert (tmp_path / "spans" / "abc.json").stat().st_size < len(payload) // 10
+
+
+def test_existence_check_is_memoized(tmp_path: Path) -> None:
+    now = [0.0]
+    store = CountingStore(str(tmp_path))
+    offloader = PayloadOffloader(store, exists_ttl_seconds=60, clock=lambda: now[0])
+
+    for i in range(5):
+        offloader.offload(f"spans/{i}.json", b"{}")
+    offloader.flush(timeout=5)
+    assert offloader.store_exists()
+    assert store.exists_calls == 1
+
+    now[0] = 61
+    assert offloader.store_exists()
+    assert store.exists_calls == 2
+
+
+def test_missing_destination_is_remembered(tmp_path: Path) -> None:
+    offloader = PayloadOffloader(LocalBlobStore(str(tmp_path / "missing")))
+    assert not offloader.known_missing()
+
+    offloader.offload("spans/a.json", b"{}")
+    offloader.flush(timeout=5)
+
+    assert offloader.known_missing()
+    assert not (tmp_path / "missing").exists()
+
+
+def test_content_is_uploaded_once_per_hash(tmp_path: Path) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    offloader = PayloadOffloader(store, max_indexed_hashes=1)
+
+    first = offloader.offload_content(b'"instructions"')
+    assert offloader.offload_content(b'"instructions"') == first
+    offloader.offload_content(b'"other"')
+    # The index is bounded, so an evicted hash is uploaded again.
+    offloader.offload_content(b'"instructions"')
+    assert offloader.flush(timeout=5)
+
+    name, digest = first
+    assert name == f"blobs/{digest}.json"
+    assert store.read(name) == b'"instructions"'
+    assert offloader.content_uploads == 3
+    assert offloader.content_hits == 1
+
+
+def test_failed_content_upload_is_forgotten(tmp_path: Path) -> None:
+    offloader = PayloadOffloader(LocalBlobStore(str(tmp_path / "missing")))
+
+    offloader.offload_content(b"{}")
+    offloader.flush(timeout=5)
+    offloader.offload_content(b"{}")
+
+    assert offloader.content_uploads == 2
+    assert offloader.content_hits == 0
+
+
+class FailingSpanStore(LocalBlobStore):
+    def upload(
+        self, name: str, data: bytes, content_type: str, content_encoding: str | None
+    ) -> None:
+        if name.startswith("spans/"):
+            raise OSError("upload failed")
+        super().upload(name, data, content_type, content_encoding)
+
+
+def test_failed_plain_uploads_leave_the_content_index_untouched(
+    tmp_path: Path,
+) -> None:
+    offloader = PayloadOffloader(FailingSpanStore(str(tmp_path)))
+    stored = offloader.offload_content(b"{}")
+    assert stored is not None
+    _, digest = stored
+
+    # A payload that is not content addressed, named like an indexed hash.
+    offloader.offload(f"spans/{digest}.json", b"{}")
+    assert offloader.flush(timeout=5)
+    offloader.offload_content(b"{}")
+
+    assert offloader.content_uploads == 1
+    assert offloader.content_hits == 1
@@ -0,0 +1,118 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+
+from app.utils.progress import (
+    PROGRESS_METADATA_KEY,
+    progress_enabled,
+    publish_progress,
+    stream_with_progress,
+)
+
+
+def texts(events: list[dict[str, Any]]) -> list[str]:
+    return [event["content"]["parts"][0]["text"] for event in events]
+
+
+async def agent_turn(tool_started: asyncio.Event) -> AsyncIterator[dict[str, Any]]:
+    """A root agent whose tool call runs a sub-agent in a task, as ADK does."""
+    yield {"content": {"parts": [{"text": "call"}]}}
+
+    async def sub_agent() -> None:
+        publish_progress("sub", "SELECT 1", "sql", "inv-1")
+        tool_started.set()
+        await asyncio.sleep(0.05)
+        publish_progress("sub", "1 row", "result")
+
+    await asyncio.create_task(sub_agent())
+    yield {"content": {"parts": [{"text": "answer"}]}}
+
+
+def test_notices_are_streamed_while_the_tool_runs() -> None:
+    async def run() -> None:
+        tool_started = asyncio.Event()
+        received = []
+        async for event in stream_with_progress(agent_turn(tool_started)):
+            # The SQL arrives before the tool call has finished.
+            if event.get("partial"):
+                assert tool_started.is_set()
+            received.append(event)
+
+        assert texts(received) == ["call", "SELECT 1", "1 row", "answer"]
+        notice = received[1]
+        assert notice["author"] == "sub"
+        assert notice["invocation_id"] == "inv-1"
+        assert notice["custom_metadata"] == {PROGRESS_METADATA_KEY: "sql"}
+        assert not progress_enabled()
+
+    asyncio.run(run())
+
+
+def test_publishing_outside_a_stream_does_nothing() -> None:
+    assert not progress_enabled()
+    assert not publish_progress("sub", "SELECT 1", "sql")
+
+
+def test_notices_from_other_threads_are_delivered() -> None:
+    async def events() -> AsyncIterator[dict[str, Any]]:
+        # `asyncio.to_thread` carries the context, and with it the channel.
+        assert await asyncio.to_thread(publish_progress, "sub", "from a thread", "text")
+        await asyncio.sleep(0)
+        yield {"content": {"parts": [{"text": "done"}]}}
+
+    async def run() -> list[dict[str, Any]]:
+        return [event async for event in stream_with_progress(events())]
+
+    assert texts(asyncio.run(run())) == ["from a thread", "done"]
+
+
+def test_errors_are_raised_after_the_events_before_them() -> None:
+    async def events() -> AsyncIterator[dict[str, Any]]:
+        yield {"content": {"parts": [{"text": "first"}]}}
+        raise RuntimeError("boom")
+
+    async def run() -> list[dict[str, Any]]:
+        received = []
+        with pytest.raises(RuntimeError, match="boom"):
+            async for event in stream_with_progress(events()):
+                received.append(event)
+        return received
+
+    assert texts(asyncio.run(run())) == ["first"]
+
+
+def test_closing_the_stream_stops_the_agent() -> None:
+    cancelled = asyncio.Event()
+
+    async def events() -> AsyncIterator[dict[str, Any]]:
+        yield {"content": {"parts": [{"text": "first"}]}}
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        yield {}
+
+    async def run() -> None:
+        stream = stream_with_progress(events())
+        assert texts([await anext(stream)]) == ["first"]
+        await stream.aclose()
+        assert cancelled.is_set()
+
+    asyncio.run(run())
@@ -0,0 +1,116 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any
+
+from app.utils.query_cache import (
+    InMemoryResultBackend,
+    QueryResultCache,
+    RedisResultBackend,
+    normalize_sql,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRedis:
+    """Implements the subset of the redis-py client used by the backend."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    def get(self, name: str) -> str | None:
+        return self.data.get(name)
+
+    def set(self, name: str, value: str, ex: int, nx: bool) -> bool | None:
+        if nx and name in self.data:
+            return None
+        self.data[name] = value
+        return True
+
+
+def test_normalize_sql_collapses_whitespace_outside_literals() -> None:
+    sql = "SELECT  start_station_name,\n  COUNT(*)\nFROM `a.b.c`\nWHERE x = 'two  spaces' ;"
+    assert normalize_sql(sql) == (
+        "SELECT start_station_name, COUNT(*) FROM `a.b.c` WHERE x = 'two  spaces'"
+    )
+
+
+def test_equivalent_sql_shares_a_key_but_users_do_not() -> None:
+    cache = QueryResultCache(InMemoryResultBackend())
+    args: dict[str, Any] = {"query": "SELECT 1", "dynamic_auth_config": "{}"}
+    cache_ignoring_auth = QueryResultCache(
+        InMemoryResultBackend(), ignored_args=("dynamic_auth_config",)
+    )
+
+    assert cache.make_key("SELECT 1", "alice", {}) == cache.make_key(
+        "SELECT   1;", "alice", {}
+    )
+    assert cache.make_key("SELECT 1", "alice", {}) != cache.make_key(
+        "SELECT 1", "bob", {}
+    )
+    assert cache_ignoring_auth.make_key("SELECT 1", "alice", args) == (
+        cache_ignoring_auth.make_key("SELECT 1", "alice", {"query": "SELECT 1"})
+    )
+
+
+def test_hits_misses_and_ttl() -> None:
+    clock = FakeClock()
+    cache = QueryResultCache(InMemoryResultBackend(clock=clock), ttl_seconds=60)
+    key = cache.make_key("SELECT 1", "alice", {})
+
+    assert cache.lookup(key) is None
+    cache.store(key, {"rows": [1]})
+    assert cache.lookup(key) == {"rows": [1]}
+    clock.now += 61
+    assert cache.lookup(key) is None
+
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.stores) == (1, 2, 1)
+    assert cache.stats.hit_rate == 1 / 3
+
+
+def test_in_memory_backend_is_size_bounded() -> None:
+    backend = InMemoryResultBackend(max_entries=2)
+    backend.add("a", {"v": 1}, 60)
+    backend.add("b", {"v": 2}, 60)
+    backend.get("a")
+    backend.add("c", {"v": 3}, 60)
+
+    assert backend.get("b") is None
+    assert backend.get("a") == {"v": 1}
+    assert len(backend) == 2
+
+
+def test_store_does_not_extend_live_entries() -> None:
+    cache = QueryResultCache(InMemoryResultBackend())
+    cache.store("k", {"v": 1})
+    cache.store("k", {"v": 2})
+
+    assert cache.lookup("k") == {"v": 1}
+    assert cache.stats.stores == 1
+
+
+def test_redis_backend_round_trips_json() -> None:
+    client = FakeRedis()
+    cache = QueryResultCache(RedisResultBackend(client))
+    cache.store("k", {"rows": [{"trips": 3}]})
+
+    assert cache.lookup("k") == {"rows": [{"trips": 3}]}
+    assert list(client.data) == ["adk-bq:query:k"]
@@ -0,0 +1,146 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from app.utils.query_guard import QueryCostGuard
+from app.utils.schema_snapshot import load_snapshot
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "..", "fixtures", "citibike_schema.json"
+)
+TABLE = "`emea-pe-agentspace.citibike.citibike`"
+GiB = 1024**3
+
+
+def make_guard(**kwargs: object) -> QueryCostGuard:
+    snapshot = load_snapshot(FIXTURE)
+    assert snapshot is not None
+    return QueryCostGuard(lambda: snapshot, **kwargs)  # type: ignore[arg-type]
+
+
+def test_aggregation_passes_with_a_limit_added() -> None:
+    decision = make_guard().check(
+        f"SELECT start_station_name, COUNT(*) AS trips FROM {TABLE} "
+        "GROUP BY start_station_name ORDER BY trips DESC"
+    )
+
+    assert decision.allowed
+    assert decision.sql.endswith("ORDER BY trips DESC LIMIT 1000")
+    assert decision.rewrites == ["added LIMIT 1000"]
+    # One string column of a 7.7 GB table.
+    assert decision.estimated_bytes is not None
+    assert 0.3 * GiB < decision.estimated_bytes < 1.5 * GiB
+
+
+def test_existing_limit_and_single_row_aggregates_are_kept() -> None:
+    guard = make_guard()
+    for sql in (
+        f"SELECT usertype FROM {TABLE} WHERE starttime >= '2018-05-01' LIMIT 5",
+        f"SELECT COUNT(*) AS trips FROM {TABLE}",
+    ):
+        decision = guard.check(sql)
+        assert decision.allowed
+        assert decision.sql == sql
+        assert decision.rewrites == []
+
+
+def test_full_scan_without_partition_filter_is_rejected() -> None:
+    decision = make_guard().check(f"SELECT * FROM {TABLE};")
+
+    assert not decision.allowed
+    assert decision.rejection is not None
+    assert "starttime" in decision.rejection["error"]
+    hint = decision.rejection["cost_guard"]
+    assert hint["partition_column"] == "starttime"
+    assert hint["partition_range"] == ["2013-07-01 00:00:00", "2018-05-31 23:59:59"]
+    assert hint["estimated_bytes"] > 7 * GiB
+    assert any("SELECT *" in suggestion for suggestion in hint["suggestions"])
+
+
+def test_partition_filter_narrows_the_estimate() -> None:
+    guard = make_guard()
+    unfiltered = guard.check(f"SELECT * FROM {TABLE} LIMIT 10")
+    one_month = guard.check(
+        f"SELECT * FROM {TABLE} WHERE DATE(starttime) BETWEEN '2018-01-01' "
+        "AND DATE '2018-01-31' AND usertype = 'Customer' LIMIT 10"
+    )
+
+    assert not unfiltered.allowed
+    assert one_month.allowed
+    assert one_month.estimated_bytes is not None
+    assert unfiltered.estimated_bytes is not None
+    assert one_month.estimated_bytes < unfiltered.estimated_bytes / 50
+
+
+def test_partition_filter_inside_a_cte_or_subquery_is_used() -> None:
+    guard = make_guard()
+    month = "starttime BETWEEN '2018-01-01' AND '2018-01-31'"
+    for sql in (
+        f"WITH january AS (SELECT * FROM {TABLE} WHERE {month}) "
+        "SELECT usertype, COUNT(*) AS trips FROM january GROUP BY usertype",
+        f"SELECT usertype, COUNT(*) AS trips FROM (SELECT * FROM {TABLE} "
+        f"WHERE {month}) GROUP BY usertype",
+        f"SELECT * FROM (SELECT * FROM {TABLE}) WHERE {month} LIMIT 10",
+    ):
+        decision = guard.check(sql)
+        assert decision.allowed, sql
+        assert decision.estimated_bytes is not None
+        assert decision.estimated_bytes < GiB / 5
+
+
+def test_unfiltered_scan_in_a_subquery_is_still_rejected() -> None:
+    decision = make_guard().check(
+        f"SELECT * FROM {TABLE} WHERE starttime >= '2018-05-01' "
+        f"UNION ALL SELECT * FROM (SELECT * FROM {TABLE})"
+    )
+
+    assert not decision.allowed
+
+
+def test_added_limit_is_reported() -> None:
+    decision = make_guard(default_limit=50).check(
+        f"SELECT start_station_name FROM {TABLE} WHERE starttime >= '2018-05-01'"
+    )
+
+    report = decision.report()
+    assert decision.limit_applied == 50
+    assert report["rewrites"] == ["added LIMIT 50"]
+    assert report["limit_applied"] == 50
+    assert "50 rows" in report["note"]
+    unchanged = make_guard().check(f"SELECT COUNT(*) AS trips FROM {TABLE}")
+    assert unchanged.report() == {"rewrites": [], "limit_applied": None}
+
+
+def test_over_budget_query_is_rejected() -> None:
+    decision = make_guard(max_bytes=GiB).check(
+        f"SELECT a.start_station_name, b.end_station_name FROM {TABLE} AS a "
+        f"JOIN {TABLE} AS b ON a.bikeid = b.bikeid"
+    )
+
+    assert not decision.allowed
+    assert decision.rejection is not None
+    assert "over the 1.0 GB budget" in decision.rejection["error"]
+
+
+def test_other_tables_and_unparseable_sql_pass_through() -> None:
+    guard = make_guard(default_limit=0)
+    assert guard.check("SELECT * FROM `other.dataset.table`").allowed
+    assert guard.check("SELEC oops FROM").allowed
+
+
+def test_non_queries_are_rejected() -> None:
+    guard = make_guard()
+    assert not guard.check(f"DELETE FROM {TABLE} WHERE TRUE").allowed
+    assert not guard.check("SELECT 1; SELECT 2").allowed
@@ -0,0 +1,229 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import random
+import sqlite3
+
+import pytest
+import sqlglot
+from sqlglot import exp
+
+from app.utils.rollups import (
+    DEFAULT_ROLLUPS,
+    MaterializedRollup,
+    RollupManifest,
+    RollupRouter,
+    load_manifest,
+    save_manifest,
+)
+from app.utils.schema_snapshot import load_snapshot
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "..", "fixtures", "citibike_schema.json"
+)
+BASE = "emea-pe-agentspace.citibike.citibike"
+TABLE = f"`{BASE}`"
+DATASET = "emea-pe-agentspace.citibike"
+
+
+def trips(count: int = 600) -> list[dict]:
+    """Deterministic trips over ten days of January 2018."""
+    rng = random.Random(7)
+    stations = [(72, "W 52 St & 11 Ave"), (79, "Franklin St"), (82, "St James Pl")]
+    rows = []
+    for _ in range(count):
+        station_id, station_name = rng.choice(stations)
+        start = datetime.datetime(2018, 1, 1) + datetime.timedelta(
+            minutes=rng.randrange(10 * 24 * 60)
+        )
+        rows.append(
+            {
+                "starttime": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "start_station_id": station_id,
+                "start_station_name": station_name,
+                "usertype": rng.choice(["Subscriber", "Customer"]),
+                "gender": rng.choice(["male", "female", "unknown"]),
+                "bikeid": rng.randrange(100),
+                "tripduration": None
+                if rng.random() < 0.05
+                else rng.randrange(60, 3600),
+            }
+        )
+    return rows
+
+
+def to_sqlite(sql: str) -> str:
+    """Translates BigQuery SQL over the fixture tables for sqlite."""
+
+    def local(node: exp.Expr) -> exp.Expr:
+        if isinstance(node, exp.Table):
+            table = exp.to_table(node.name.split(".")[-1])
+            return table.as_(node.alias) if node.alias else table
+        if isinstance(node, exp.Extract) and node.name.upper() == "HOUR":
+            return sqlglot.parse_one(
+                f"CAST(STRFTIME('%H', {node.expression.sql()}) AS INTEGER)"
+            )
+        return node
+
+    query = sqlglot.parse_one(sql, read="bigquery").transform(local)
+    return query.sql(dialect="sqlite")
+
+
+@pytest.fixture(scope="module")
+def database() -> sqlite3.Connection:
+    """The fixture trips with each rollup built from them."""
+    connection = sqlite3.connect(":memory:")
+    rows = trips()
+    columns = list(rows[0])
+    connection.execute(f"CREATE TABLE citibike ({', '.join(columns)})")
+    connection.executemany(
+        f"INSERT INTO citibike VALUES ({', '.join('?' for _ in columns)})",
+        [tuple(row.values()) for row in rows],
+    )
+    for rollup in DEFAULT_ROLLUPS:
+        connection.execute(
+            f"CREATE TABLE {rollup.name} AS {to_sqlite(rollup.select_sql(BASE))}"
+        )
+    return connection
+
+
+def make_router(**kwargs: object) -> RollupRouter:
+    # Sizes proportional to the rollups' row counts in the real table.
+    sizes = {
+        "citibike_daily_station_trips": 400_000_000,
+        "citibike_hourly_usage": 20_000_000,
+    }
+    manifest = RollupManifest(
+        base_table=BASE,
+        base_version="7687f0c46ab5",
+        rollups={
+            rollup.name: MaterializedRollup(
+                table=f"{DATASET}.{rollup.name}",
+                version=rollup.version,
+                refreshed_at="2025-11-20T09:00:00+00:00",
+                num_rows=sizes[rollup.name] // 64,
+                num_bytes=sizes[rollup.name],
+            )
+            for rollup in DEFAULT_ROLLUPS
+        },
+    )
+    snapshot = load_snapshot(FIXTURE)
+    return RollupRouter(manifest, snapshot_provider=lambda: snapshot, **kwargs)  # type: ignore[arg-type]
+
+
+def rows(connection: sqlite3.Connection, sql: str) -> list[tuple]:
+    result = connection.execute(to_sqlite(sql)).fetchall()
+    return sorted(
+        tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in result
+    )
+
+
+@pytest.mark.parametrize(
+    "sql, rollup",
+    [
+        (
+            f"SELECT DATE(starttime) AS day, COUNT(*) AS trips FROM {TABLE} "
+            "GROUP BY day ORDER BY day",
+            "citibike_hourly_usage",
+        ),
+        (
+            "SELECT start_station_name, COUNT(*) AS trips, AVG(tripduration) AS "
+            f"avg_duration FROM {TABLE} WHERE usertype = 'Subscriber' "
+            "GROUP BY start_station_name ORDER BY trips DESC",
+            "citibike_daily_station_trips",
+        ),
+        (
+            "SELECT EXTRACT(HOUR FROM starttime) AS hour, COUNT(*) AS trips, "
+            "SUM(tripduration) AS total, MIN(tripduration) AS shortest, "
+            f"MAX(tripduration) AS longest FROM {TABLE} "
+            "WHERE starttime >= '2018-01-03' AND starttime < '2018-01-06' "
+            "GROUP BY hour",
+            "citibike_hourly_usage",
+        ),
+        (
+            "SELECT COUNT(DISTINCT start_station_id) AS stations, "
+            f"COUNT(tripduration) AS timed, MAX(DATE(starttime)) AS last_day "
+            f"FROM {TABLE} WHERE gender = 'female'",
+            "citibike_daily_station_trips",
+        ),
+        (
+            f"SELECT t.usertype, COUNT(*) AS n FROM {TABLE} AS t "
+            "WHERE CAST(t.starttime AS DATE) BETWEEN '2018-01-02' AND '2018-01-04' "
+            "GROUP BY 1 HAVING n > 10",
+            "citibike_hourly_usage",
+        ),
+        (
+            f"SELECT COUNT(*) AS trips FROM {TABLE} WHERE DATE(starttime) = '2030-01-01'",
+            "citibike_hourly_usage",
+        ),
+    ],
+)
+def test_routed_queries_give_the_same_result(
+    database: sqlite3.Connection, sql: str, rollup: str
+) -> None:
+    decision = make_router().route(sql)
+
+    assert decision.rollup == rollup, decision.reason
+    assert f"`{DATASET}.{rollup}`" in decision.sql
+    assert rows(database, decision.sql) == rows(database, sql)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"SELECT * FROM {TABLE} LIMIT 5",
+        f"SELECT usertype, COUNT(*) AS n FROM {TABLE} "
+        "WHERE starttime > '2018-01-03 12:00:00' GROUP BY usertype",
+        f"SELECT bikeid, COUNT(*) AS n FROM {TABLE} GROUP BY bikeid",
+        f"SELECT usertype, SUM(DISTINCT tripduration) AS s FROM {TABLE} GROUP BY usertype",
+        f"SELECT DATE(starttime), COUNT(*) AS n FROM {TABLE} GROUP BY 1",
+        f"SELECT a.usertype, COUNT(*) AS n FROM {TABLE} AS a JOIN {TABLE} AS b "
+        "ON a.bikeid = b.bikeid GROUP BY 1",
+        "SELECT usertype, COUNT(*) AS n FROM `other.dataset.table` GROUP BY usertype",
+    ],
+)
+def test_queries_that_cannot_be_answered_exactly_are_not_routed(sql: str) -> None:
+    decision = make_router().route(sql)
+
+    assert decision.rollup is None
+    assert decision.sql == sql
+    assert decision.reason
+
+
+def test_route_reports_the_bytes_saved() -> None:
+    decision = make_router().route(
+        f"SELECT start_station_name, AVG(tripduration) AS avg_duration FROM {TABLE} "
+        "GROUP BY start_station_name"
+    )
+
+    assert decision.report()["rollup"] == "citibike_daily_station_trips"
+    # Two columns of the base table against a small rollup.
+    assert decision.report()["estimated_bytes_saved"] > 1_000_000_000
+
+
+def test_stale_rollups_are_not_used(tmp_path: str) -> None:
+    router = make_router()
+    assert router.manifest is not None
+    path = os.path.join(tmp_path, "rollups.json")
+    save_manifest(router.manifest, path)
+    assert load_manifest(path) == router.manifest
+    sql = f"SELECT usertype, COUNT(*) AS n FROM {TABLE} GROUP BY usertype"
+
+    router.manifest.rollups["citibike_hourly_usage"].version = "old"
+    assert router.route(sql).rollup == "citibike_daily_station_trips"
+    router.manifest.base_version = "old"
+    assert router.route(sql).rollup is None
+    assert RollupRouter(None).route(sql).rollup is None
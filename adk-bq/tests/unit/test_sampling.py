@@ -0,0 +1,171 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter
+from opentelemetry.trace import Status, StatusCode
+
+from app.utils.sampling import (
+    INVOCATION_ID_ATTRIBUTE,
+    SamplingPolicy,
+    TailSamplingSpanProcessor,
+    trace_id_sampled,
+)
+
+
+class CollectingExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: list[ReadableSpan] = []
+
+    def export(self, spans: Any) -> Any:
+        self.spans.extend(spans)
+
+
+def run_trace(
+    provider: TracerProvider,
+    invocation_id: str = "inv-1",
+    error: bool = False,
+    duration_s: float = 1.0,
+) -> None:
+    tracer = provider.get_tracer(__name__)
+    root = tracer.start_span("invocation", start_time=0)
+    root.set_attribute(INVOCATION_ID_ATTRIBUTE, invocation_id)
+    with tracer.start_as_current_span(
+        "call_llm", context=trace.set_span_in_context(root)
+    ) as span:
+        if error:
+            span.set_status(Status(StatusCode.ERROR, "boom"))
+    root.end(end_time=int(duration_s * 1e9))
+
+
+def make_tail_sampler(
+    **policy: Any,
+) -> tuple[TracerProvider, TailSamplingSpanProcessor, CollectingExporter]:
+    exporter = CollectingExporter()
+    tail = TailSamplingSpanProcessor(
+        SimpleSpanProcessor(exporter),
+        SamplingPolicy(default_ratio=0.0, tail_sampling=True, **policy),
+    )
+    provider = TracerProvider(sampler=tail.policy.sampler())
+    provider.add_span_processor(tail)
+    return provider, tail, exporter
+
+
+def test_policy_from_env() -> None:
+    policy = SamplingPolicy.from_env(
+        {
+            "TRACE_SAMPLE_RATIO": "0.1",
+            "TRACE_SAMPLE_RATIOS": "execute_tool=0.5, execute_tool fetch_query_page=0",
+            "TRACE_TAIL_SAMPLING": "true",
+        }
+    )
+
+    assert policy.tail_sampling
+    assert policy.ratio_for("invocation") == 0.1
+    assert policy.ratio_for("execute_tool bqcitibike_query") == 0.5
+    assert policy.ratio_for("execute_tool fetch_query_page") == 0.0
+    with pytest.raises(ValueError):
+        SamplingPolicy.from_env({"TRACE_SAMPLE_RATIO": "2"})
+
+
+def test_lower_ratios_sample_a_subset_of_higher_ones() -> None:
+    trace_ids = range(0, 1 << 64, (1 << 64) // 1000)
+    low = {t for t in trace_ids if trace_id_sampled(t, 0.1)}
+    high = {t for t in trace_ids if trace_id_sampled(t, 0.5)}
+
+    assert low < high
+    assert 80 <= len(low) <= 120
+
+
+def head_sampled_names(**policy: Any) -> list[str]:
+    exporter = CollectingExporter()
+    provider = TracerProvider(sampler=SamplingPolicy(**policy).sampler())
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    run_trace(provider)
+    return sorted(span.name for span in exporter.spans)
+
+
+def test_head_sampler_keeps_the_children_of_a_sampled_parent() -> None:
+    assert head_sampled_names(operation_ratios={"call_llm": 0.0}) == [
+        "call_llm",
+        "invocation",
+    ]
+
+
+def test_head_sampler_drops_operations_per_ratio() -> None:
+    assert head_sampled_names(operation_ratios={"invocation": 0.0}) == ["call_llm"]
+    assert head_sampled_names(default_ratio=0.0) == []
+
+
+def test_tail_sampling_head_policy_keeps_the_children_of_a_sampled_parent() -> None:
+    provider, _, exporter = make_tail_sampler(operation_ratios={"invocation": 1.0})
+
+    run_trace(provider)
+
+    assert sorted(span.name for span in exporter.spans) == ["call_llm", "invocation"]
+
+
+def test_tail_sampling_keeps_errored_and_slow_traces() -> None:
+    provider, tail, exporter = make_tail_sampler(tail_latency_seconds=10)
+
+    run_trace(provider, invocation_id="ok")
+    assert exporter.spans == []
+
+    run_trace(provider, invocation_id="error", error=True)
+    run_trace(provider, invocation_id="slow", duration_s=30)
+
+    assert len(exporter.spans) == 4
+    assert tail.stats.kept_error == 1
+    assert tail.stats.kept_slow == 1
+    assert tail.stats.head_only == 1
+
+
+def test_low_feedback_exports_held_trace() -> None:
+    provider, tail, exporter = make_tail_sampler(tail_feedback_max_score=2)
+    run_trace(provider, invocation_id="liked")
+    run_trace(provider, invocation_id="disliked")
+
+    assert not tail.record_feedback("liked", 5)
+    assert tail.record_feedback("disliked", 1)
+
+    assert sorted(span.name for span in exporter.spans) == ["call_llm", "invocation"]
+    assert {span.context.trace_id for span in exporter.spans} == {
+        exporter.spans[0].context.trace_id
+    }
+    assert not tail.record_feedback("disliked", 1)
+
+
+def test_held_traces_expire_after_feedback_window() -> None:
+    now = [0.0]
+    exporter = CollectingExporter()
+    tail = TailSamplingSpanProcessor(
+        SimpleSpanProcessor(exporter),
+        SamplingPolicy(
+            default_ratio=0.0, tail_sampling=True, tail_feedback_window_seconds=60
+        ),
+        clock=lambda: now[0],
+    )
+    provider = TracerProvider()
+    provider.add_span_processor(tail)
+
+    run_trace(provider, invocation_id="late")
+    now[0] = 61.0
+    run_trace(provider, invocation_id="other")
+
+    assert not tail.record_feedback("late", 0)
+    assert exporter.spans == []
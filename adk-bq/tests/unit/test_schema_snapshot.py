@@ -0,0 +1,125 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from app.utils.schema_snapshot import (
+    SchemaSnapshotProvider,
+    capture_snapshot,
+    load_snapshot,
+    render_snapshot,
+    save_snapshot,
+)
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "..", "fixtures", "citibike_schema.json"
+)
+
+
+class FakeBigQueryClient:
+    """Answers the metadata and statistics queries issued by capture_snapshot."""
+
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    def get_table(self, table: str) -> Any:
+        field = SimpleNamespace
+        return SimpleNamespace(
+            schema=[
+                field(name="starttime", field_type="DATETIME", mode="NULLABLE"),
+                field(name="usertype", field_type="STRING", mode="NULLABLE"),
+            ],
+            num_rows=10,
+            num_bytes=1000,
+            time_partitioning=SimpleNamespace(field="starttime", type_="DAY"),
+            clustering_fields=["usertype"],
+        )
+
+    def query(self, sql: str) -> Any:
+        self.queries.append(sql)
+        row: dict[str, Any]
+        if "APPROX_TOP_COUNT" in sql:
+            row = {"usertype": [{"value": "Subscriber"}, {"value": "Customer"}]}
+        else:
+            row = {
+                "row_count": 10,
+                "d0": 10,
+                "n0": 0,
+                "lo0": "2018-01-01 00:00:00",
+                "hi0": "2018-12-31 23:00:00",
+                "d1": 2,
+                "n1": 1,
+                "len1": 9.5,
+            }
+        return SimpleNamespace(result=lambda: [row])
+
+
+def test_fixture_round_trips_and_renders() -> None:
+    snapshot = load_snapshot(FIXTURE)
+    assert snapshot is not None
+
+    rendered = render_snapshot(snapshot)
+    assert f"schema {snapshot.version}" in rendered
+    assert "Partitioned by DAY on `starttime`" in rendered
+    assert "- usertype STRING: values 'Subscriber'|'Customer'" in rendered
+    assert len(rendered) < 2000
+
+
+def test_version_ignores_statistics() -> None:
+    snapshot = load_snapshot(FIXTURE)
+    assert snapshot is not None
+    version = snapshot.version
+
+    snapshot.num_rows += 1
+    snapshot.columns[0].max_value = "99"
+    assert snapshot.version == version
+
+    snapshot.columns[0].type = "FLOAT64"
+    assert snapshot.version != version
+
+
+def test_capture_snapshot_collects_layout_and_statistics() -> None:
+    client = FakeBigQueryClient()
+    snapshot = capture_snapshot(client, "p.d.t")
+
+    assert snapshot.partitioning == {"field": "starttime", "type": "DAY"}
+    assert snapshot.clustering == ["usertype"]
+    starttime, usertype = snapshot.columns
+    assert (starttime.min_value, starttime.max_value) == (
+        "2018-01-01 00:00:00",
+        "2018-12-31 23:00:00",
+    )
+    assert usertype.values == ["Subscriber", "Customer"]
+    assert usertype.null_fraction == 0.1
+    assert len(client.queries) == 2
+
+
+def test_provider_reloads_changed_files(tmp_path: Path) -> None:
+    path = str(tmp_path / "schema.json")
+    provider = SchemaSnapshotProvider(path, check_interval_seconds=0)
+    assert provider.get() is None
+
+    snapshot = load_snapshot(FIXTURE)
+    assert snapshot is not None
+    save_snapshot(snapshot, path)
+    assert provider.get() is not None
+
+    snapshot.columns = snapshot.columns[:1]
+    save_snapshot(snapshot, path)
+    os.utime(path, (0, 12345))
+    reloaded = provider.get()
+    assert reloaded is not None and len(reloaded.columns) == 1
@@ -0,0 +1,114 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from app.utils.semantic_cache import HashingEmbedder, SemanticSqlCache, SqlCall
+
+TOOL = "bqcitibike_execute_custom_query"
+TOP_STATIONS = [
+    SqlCall(
+        TOOL,
+        {"query": "SELECT start_station_name, COUNT(*) AS trips FROM t GROUP BY 1"},
+    )
+]
+
+
+def _cache() -> SemanticSqlCache:
+    return SemanticSqlCache(HashingEmbedder(), threshold=0.8)
+
+
+def test_hashing_embedder_is_deterministic_and_normalized() -> None:
+    first, second = HashingEmbedder().embed(["Top stations", "Top stations"])
+    assert first == second
+    assert abs(sum(value * value for value in first) - 1.0) < 1e-9
+
+
+def test_rewordings_hit_and_unrelated_questions_miss() -> None:
+    cache = _cache()
+    cache.store("What are the top 10 start stations?", TOP_STATIONS)
+
+    match = cache.lookup("what are the top 10 start stations")
+    assert match is not None
+    assert match.calls == TOP_STATIONS
+    assert cache.lookup("How many trips were taken in March 2019?") is None
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_schema_change_invalidates_entries() -> None:
+    cache = _cache()
+    cache.store("top start stations", TOP_STATIONS, schema_version="v1")
+
+    assert cache.lookup("top start stations", schema_version="v1") is not None
+    assert cache.lookup("top start stations", schema_version="v2") is None
+    assert len(cache) == 0
+
+
+def test_similar_questions_replace_each_other() -> None:
+    cache = _cache()
+    cache.store("top start stations", [SqlCall(TOOL, {"query": "old"})])
+    cache.store("top start stations", [SqlCall(TOOL, {"query": "new"})])
+
+    assert len(cache) == 1
+    match = cache.lookup("top start stations")
+    assert match is not None and match.calls == [SqlCall(TOOL, {"query": "new"})]
+
+
+def test_questions_differing_only_in_a_literal_miss() -> None:
+    # Low enough that the embeddings alone would match every question below.
+    cache = SemanticSqlCache(HashingEmbedder(), threshold=0.7)
+    march = [SqlCall(TOOL, {"query": "SELECT COUNT(*) FROM t WHERE month = 3"})]
+    cache.store("How many trips were taken in March 2018?", march)
+    cache.store("What are the top 10 start stations?", TOP_STATIONS)
+
+    assert cache.lookup("How many trips were taken in April 2018?") is None
+    assert cache.lookup("How many trips were taken in March 2019?") is None
+    assert cache.lookup("What are the top 5 start stations?") is None
+    match = cache.lookup("how many trips were taken in march 2018")
+    assert match is not None and match.calls == march
+
+
+def test_questions_differing_only_in_a_literal_do_not_replace_each_other() -> None:
+    cache = SemanticSqlCache(HashingEmbedder(), threshold=0.7)
+    central = "How many trips started at the Central Park station in 2018?"
+    broadway = "How many trips started at the Broadway station in 2018?"
+    cache.store(central, [SqlCall(TOOL, {"query": "central"})])
+    cache.store(broadway, [SqlCall(TOOL, {"query": "broadway"})])
+
+    assert len(cache) == 2
+    match = cache.lookup(central)
+    assert match is not None and match.calls[0].args["query"] == "central"
+
+
+def test_every_call_of_a_multi_query_answer_is_replayed() -> None:
+    cache = _cache()
+    trips = SqlCall(TOOL, {"query": "SELECT COUNT(*) FROM trips"})
+    stations = SqlCall(TOOL, {"query": "SELECT COUNT(*) FROM stations"})
+    cache.store("trips and stations", [trips])
+    cache.store("trips and stations", [trips, stations])
+
+    match = cache.lookup("trips and stations")
+    assert match is not None and match.calls == [trips, stations]
+    match.calls[0].args["query"] = "changed"
+    again = cache.lookup("trips and stations")
+    assert again is not None and again.calls[0] == trips
+
+
+def test_latency_saved_uses_average_generation_latency() -> None:
+    cache = _cache()
+    cache.record_generation_latency(2.0)
+    cache.record_generation_latency(4.0)
+    cache.store("top start stations", TOP_STATIONS)
+    cache.lookup("top start stations")
+
+    assert cache.stats.avg_generation_latency_s == 3.0
+    assert cache.stats.latency_saved_s == 3.0
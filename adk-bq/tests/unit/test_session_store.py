@@ -0,0 +1,267 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.events import Event
+from google.genai import types
+
+from app.utils.file_artifacts import LocalFileArtifactService
+from app.utils.session_store import (
+    BoundedInMemorySessionService,
+    session_service_builder,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_store(**kwargs: Any) -> BoundedInMemorySessionService:
+    kwargs.setdefault("artifact_service", InMemoryArtifactService())
+    kwargs.setdefault("gauge_interval_seconds", 0)
+    return BoundedInMemorySessionService(**kwargs)
+
+
+def user_event(text: str) -> Event:
+    return Event(
+        author="user",
+        content=types.Content(role="user", parts=[types.Part.from_text(text=text)]),
+    )
+
+
+def tool_event(rows: int) -> Event:
+    response = {"rows": [{"station": f"station {i}", "trips": i} for i in range(rows)]}
+    return Event(
+        author="bq_agent",
+        content=types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id="call-1", name="execute_custom_query", response=response
+                    )
+                )
+            ],
+        ),
+    )
+
+
+def first_part(event: Event) -> types.Part:
+    assert event.content is not None and event.content.parts
+    return event.content.parts[0]
+
+
+def function_response(event: Event) -> dict[str, Any]:
+    response = first_part(event).function_response
+    assert response is not None and response.response is not None
+    return response.response
+
+
+def test_least_recently_used_session_is_evicted() -> None:
+    store = make_store(max_sessions=2)
+
+    async def run() -> None:
+        for session_id in ("a", "b"):
+            await store.create_session(
+                app_name="app", user_id="u", session_id=session_id
+            )
+        # Reading "a" makes "b" the least recently used.
+        assert await store.get_session(app_name="app", user_id="u", session_id="a")
+        await store.create_session(app_name="app", user_id="u", session_id="c")
+
+        assert (
+            await store.get_session(app_name="app", user_id="u", session_id="b") is None
+        )
+        assert await store.get_session(app_name="app", user_id="u", session_id="a")
+        assert store.stats()["evicted_lru"] == 1
+
+    asyncio.run(run())
+
+
+def test_idle_sessions_and_their_user_state_expire() -> None:
+    clock = FakeClock()
+    store = make_store(idle_ttl_seconds=60, clock=clock)
+
+    async def run() -> None:
+        await store.create_session(
+            app_name="app", user_id="u", session_id="s", state={"user:token": "t"}
+        )
+        clock.now = 59
+        assert await store.get_session(app_name="app", user_id="u", session_id="s")
+        clock.now = 110
+        assert await store.get_session(app_name="app", user_id="u", session_id="s")
+        clock.now = 171
+
+        assert (
+            await store.get_session(app_name="app", user_id="u", session_id="s") is None
+        )
+        assert store.user_state["app"] == {}
+        assert store.stats()["evicted_idle"] == 1
+
+    asyncio.run(run())
+
+
+def test_large_tool_output_is_stored_as_an_artifact() -> None:
+    artifacts = InMemoryArtifactService()
+    store = make_store(offload_threshold_bytes=1024, artifact_service=artifacts)
+
+    async def run() -> None:
+        session = await store.create_session(app_name="app", user_id="u")
+        event = tool_event(rows=200)
+        await store.append_event(session, event)
+
+        # The live session keeps the full output for the current turn.
+        assert len(function_response(session.events[-1])["rows"]) == 200
+        stored = await store.get_session(
+            app_name="app", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        reference = function_response(stored.events[-1])
+        assert reference["offloaded_artifact"] == f"tool-output-{event.id}-0.json"
+        assert reference["bytes"] > 1024
+
+        artifact = await artifacts.load_artifact(
+            app_name="app",
+            user_id="u",
+            session_id=session.id,
+            filename=reference["offloaded_artifact"],
+        )
+        assert artifact is not None and artifact.inline_data is not None
+        assert artifact.inline_data.data is not None
+        assert len(json.loads(artifact.inline_data.data)["rows"]) == 200
+
+        await store.delete_session(app_name="app", user_id="u", session_id=session.id)
+        await store.append_event(
+            await store.create_session(app_name="app", user_id="u"), user_event("hi")
+        )
+        assert not await artifacts.list_artifact_keys(
+            app_name="app", user_id="u", session_id=session.id
+        )
+
+    asyncio.run(run())
+
+
+def test_history_is_trimmed_by_whole_turns() -> None:
+    store = make_store(max_session_bytes=4000, offload_threshold_bytes=10**6)
+
+    async def run() -> None:
+        session = await store.create_session(app_name="app", user_id="u")
+        for turn in range(5):
+            await store.append_event(session, user_event(f"question {turn}"))
+            await store.append_event(session, tool_event(rows=20))
+
+        stored = await store.get_session(
+            app_name="app", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        assert len(stored.events) < 10
+        assert stored.events[0].author == "user"
+        assert first_part(stored.events[-2]).text == "question 4"
+        assert store.stats()["session_bytes"] <= 4000
+
+    asyncio.run(run())
+
+
+def test_session_service_builder_selects_the_store() -> None:
+    assert session_service_builder({}) is None
+    builder = session_service_builder(
+        {"SESSION_STORE": "bounded", "SESSION_MAX_SESSIONS": "7"},
+        artifact_service_builder=InMemoryArtifactService,
+    )
+    assert builder is not None
+    store = builder()
+    assert isinstance(store, BoundedInMemorySessionService)
+    assert store.max_sessions == 7
+    with pytest.raises(ValueError):
+        session_service_builder({"SESSION_STORE": "redis"})
+
+
+def test_default_store_offloads_to_local_files(
+    tmp_path: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    assert isinstance(
+        BoundedInMemorySessionService().artifact_service, LocalFileArtifactService
+    )
+    monkeypatch.setenv("SESSION_ARTIFACT_DIR", str(tmp_path))
+    store = BoundedInMemorySessionService.from_env()
+    assert isinstance(store.artifact_service, LocalFileArtifactService)
+    store.offload_threshold_bytes = 1024
+
+    async def run() -> None:
+        session = await store.create_session(app_name="app", user_id="u")
+        await store.append_event(session, tool_event(rows=200))
+        stored = await store.get_session(
+            app_name="app", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        filename = function_response(stored.events[-1])["offloaded_artifact"]
+        artifact = await store.artifact_service.load_artifact(
+            app_name="app", user_id="u", session_id=session.id, filename=filename
+        )
+        assert artifact is not None and artifact.inline_data is not None
+        assert artifact.inline_data.data is not None
+        assert len(json.loads(artifact.inline_data.data)["rows"]) == 200
+        assert await store.artifact_service.list_artifact_keys(
+            app_name="app", user_id="u", session_id=session.id
+        ) == [filename]
+
+        await store.artifact_service.delete_artifact(
+            app_name="app", user_id="u", session_id=session.id, filename=filename
+        )
+        assert not await store.artifact_service.list_artifact_keys(
+            app_name="app", user_id="u", session_id=session.id
+        )
+
+    asyncio.run(run())
+
+
+def test_concurrent_artifact_saves_get_distinct_versions(tmp_path: Any) -> None:
+    artifacts = LocalFileArtifactService(str(tmp_path))
+    keys: dict[str, Any] = {
+        "app_name": "app",
+        "user_id": "u",
+        "session_id": "s",
+        "filename": "f",
+    }
+
+    async def run() -> None:
+        versions = await asyncio.gather(
+            *(
+                artifacts.save_artifact(artifact=types.Part(text=str(i)), **keys)
+                for i in range(20)
+            )
+        )
+        assert sorted(versions) == list(range(20))
+        assert await artifacts.list_versions(**keys) == list(range(20))
+        texts = set()
+        for version, metadata in enumerate(
+            await artifacts.list_artifact_versions(**keys)
+        ):
+            assert metadata.version == version
+            part = await artifacts.load_artifact(version=version, **keys)
+            assert part is not None
+            texts.add(part.text)
+        assert texts == {str(i) for i in range(20)}
+        assert not list(tmp_path.rglob("*.tmp"))
+
+    asyncio.run(run())
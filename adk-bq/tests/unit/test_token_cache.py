@@ -0,0 +1,105 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections.abc import Hashable
+
+from app.utils.token_cache import CachedToken, TokenCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_tokens_are_scoped_per_key() -> None:
+    """Each user gets the token fetched for them, never another user's."""
+    cache = TokenCache(fetcher=lambda key: CachedToken(value=f"token-{key}"))
+
+    assert cache.get_or_fetch("alice") == "token-alice"
+    assert cache.get_or_fetch("bob") == "token-bob"
+    assert cache.get("alice") == "token-alice"
+
+
+def test_expired_tokens_are_not_returned() -> None:
+    clock = FakeClock()
+    cache = TokenCache(fetcher=lambda key: None, clock=clock)
+    cache.put("alice", CachedToken(value="old", expires_at=clock.now + 10))
+
+    assert cache.get("alice") == "old"
+    clock.now += 11
+    assert cache.get("alice") is None
+    assert len(cache) == 0
+
+
+def test_refresh_ahead_of_expiry_happens_in_background() -> None:
+    clock = FakeClock()
+    refreshed = threading.Event()
+
+    def fetcher(key: Hashable) -> CachedToken:
+        refreshed.set()
+        return CachedToken(value="new", expires_at=clock.now + 3600)
+
+    cache = TokenCache(fetcher=fetcher, refresh_margin_seconds=60, clock=clock)
+    cache.put("alice", CachedToken(value="old", expires_at=clock.now + 30))
+
+    # The still-valid token is served immediately while the refresh runs.
+    assert cache.get("alice") == "old"
+    assert refreshed.wait(timeout=5)
+    deadline = time.time() + 5
+    while cache.get("alice") != "new" and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("alice") == "new"
+
+
+def test_concurrent_misses_share_one_fetch() -> None:
+    calls = []
+    release = threading.Event()
+
+    def fetcher(key: Hashable) -> CachedToken:
+        calls.append(key)
+        release.wait(timeout=5)
+        return CachedToken(value="token")
+
+    cache = TokenCache(fetcher=fetcher)
+    results: list[str | None] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_fetch("alice")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert calls == ["alice"]
+    assert results == ["token"] * 8
+
+
+def test_least_recently_used_entries_are_evicted() -> None:
+    cache = TokenCache(fetcher=lambda key: None, max_entries=2)
+    cache.put("a", CachedToken(value="1"))
+    cache.put("b", CachedToken(value="2"))
+    cache.get("a")
+    cache.put("c", CachedToken(value="3"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
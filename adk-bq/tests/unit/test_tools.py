@@ -0,0 +1,195 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from typing import Any
+
+import pytest
+from google.adk.agents import Agent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.sessions import InMemorySessionService, Session
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
+
+from app.tools import LazyToolset, limit_query_concurrency
+from app.utils.concurrency import KeyedConcurrencyLimiter
+
+
+class CountingToolset(BaseToolset):
+    def __init__(self) -> None:
+        super().__init__()
+        self.tool = BaseTool(name="bqcitibike_execute_custom_query", description="")
+        self.closed = 0
+
+    async def get_tools(self, readonly_context: Any = None) -> list[BaseTool]:
+        return [self.tool]
+
+    async def close(self) -> None:
+        self.closed += 1
+
+
+def test_toolset_is_built_once_and_kept_open_across_runs() -> None:
+    built: list[CountingToolset] = []
+
+    def factory() -> CountingToolset:
+        built.append(CountingToolset())
+        return built[-1]
+
+    lazy = LazyToolset(factory)
+    assert built == []
+
+    async def run() -> None:
+        tools = await lazy.get_tools()
+        await lazy.close()
+        assert await lazy.get_tools() == tools
+
+    asyncio.run(run())
+
+    assert len(built) == 1
+    assert built[0].closed == 0
+
+
+def test_failed_build_is_retried() -> None:
+    attempts = []
+
+    def factory() -> CountingToolset:
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("connection spec unavailable")
+        return CountingToolset()
+
+    lazy = LazyToolset(factory)
+    with pytest.raises(RuntimeError):
+        asyncio.run(lazy.get_tools())
+
+    assert len(asyncio.run(lazy.get_tools())) == 1
+    assert len(attempts) == 2
+
+
+class SlowQueryTool(BaseTool):
+    def __init__(self, name: str = "bqcitibike_execute_custom_query") -> None:
+        super().__init__(name=name, description="")
+        self.running = 0
+        self.max_running = 0
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: Any) -> Any:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(args["seconds"])
+        self.running -= 1
+        return {"query": args["query"]}
+
+
+def tool_context(user_id: str) -> ToolContext:
+    session = Session(id=f"session-{user_id}", app_name="app", user_id=user_id)
+    return ToolContext(
+        InvocationContext(
+            session_service=InMemorySessionService(),
+            invocation_id="e-test",
+            agent=Agent(name="agent"),
+            session=session,
+        )
+    )
+
+
+def test_parallel_queries_take_as_long_as_the_slowest() -> None:
+    slow = SlowQueryTool()
+    tool = limit_query_concurrency(slow)
+    durations = [0.2, 0.1, 0.15]
+
+    async def run() -> tuple[list[Any], float]:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                tool.run_async(
+                    args={"query": f"q{i}", "seconds": seconds},
+                    tool_context=tool_context("alice"),
+                )
+                for i, seconds in enumerate(durations)
+            )
+        )
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+
+    assert tool.name == slow.name
+    assert results == [{"query": "q0"}, {"query": "q1"}, {"query": "q2"}]
+    assert slow.max_running == 3
+    assert elapsed < sum(durations) - 0.1
+
+
+def test_queries_are_capped_per_user() -> None:
+    limiter = KeyedConcurrencyLimiter(max_concurrent=2)
+    slow = SlowQueryTool()
+
+    async def query(user_id: str) -> None:
+        async with limiter.slot(user_id):
+            await slow.run_async(
+                args={"query": user_id, "seconds": 0.02}, tool_context=None
+            )
+
+    async def run() -> None:
+        await asyncio.gather(*(query("alice") for _ in range(6)))
+        assert slow.max_running == 2
+        slow.max_running = 0
+        await asyncio.gather(
+            *(query(user_id) for user_id in ("alice", "alice", "bob", "bob"))
+        )
+        assert slow.max_running == 4
+
+    asyncio.run(run())
+    assert limiter.active("alice") == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot() -> None:
+    limiter = KeyedConcurrencyLimiter(max_concurrent=1)
+
+    async def run() -> None:
+        async with limiter.slot("alice"):
+            waiter = asyncio.create_task(limiter.slot("alice").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        async with limiter.slot("alice"):
+            assert limiter.active("alice") == 1
+
+    asyncio.run(run())
+    assert limiter.active("alice") == 0
+
+
+def test_waiter_cancelled_during_hand_over_passes_the_slot_on() -> None:
+    limiter = KeyedConcurrencyLimiter(max_concurrent=1)
+
+    async def run() -> None:
+        async with limiter.slot("alice"):
+            waiter = asyncio.create_task(limiter.slot("alice").__aenter__())
+            await asyncio.sleep(0)
+        # The release scheduled the hand-over; let it give the waiter the slot,
+        # then cancel the waiter before it resumes.
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.active("alice") == 0
+
+    asyncio.run(run())
+
+
+def test_only_query_tools_are_limited() -> None:
+    other = SlowQueryTool(name="fetch_query_page")
+    assert limit_query_concurrency(other) is other
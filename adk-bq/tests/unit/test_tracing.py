@@ -0,0 +1,194 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from pathlib import Path
+from typing import Any, cast
+
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter
+from opentelemetry.trace import Status, StatusCode
+
+from app.utils.payload_offload import LocalBlobStore
+from app.utils.tracing import CloudTraceLoggingSpanExporter, span_to_dict
+
+
+class CollectingExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: list[ReadableSpan] = []
+
+    def export(self, spans: Any) -> Any:
+        self.spans.extend(spans)
+
+
+class FakeBatch:
+    def __init__(self, sink: list[list[dict]]) -> None:
+        self.sink = sink
+        self.entries: list[dict] = []
+
+    def log_struct(self, info: dict, **kwargs: Any) -> None:
+        self.entries.append(info)
+
+    def commit(self) -> None:
+        self.sink.append(self.entries)
+
+
+class FakeLogger:
+    def __init__(self) -> None:
+        self.commits: list[list[dict]] = []
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self.commits)
+
+
+class FakeLoggingClient:
+    def __init__(self) -> None:
+        self.fake_logger = FakeLogger()
+
+    def logger(self, name: str) -> FakeLogger:
+        return self.fake_logger
+
+
+class FakeStorageClient:
+    def bucket(self, name: str) -> Any:
+        return None
+
+
+class FakeTraceClient:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def batch_write_spans(self, **kwargs: Any) -> None:
+        self.calls += 1
+
+
+def make_exporter(**kwargs: Any) -> CloudTraceLoggingSpanExporter:
+    return CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        client=FakeTraceClient(),
+        logging_client=cast(Any, FakeLoggingClient()),
+        storage_client=FakeStorageClient(),
+        **kwargs,
+    )
+
+
+def make_spans(count: int) -> list[ReadableSpan]:
+    collector = CollectingExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(collector))
+    tracer = provider.get_tracer(__name__)
+    with tracer.start_as_current_span("invocation"):
+        for i in range(count - 1):
+            with tracer.start_as_current_span(f"call_llm {i}") as span:
+                span.set_attribute("gcp.vertex.agent.llm_request", "x" * 100)
+                span.set_attribute("tags", ("a", "b"))
+                span.add_event("token", {"index": i})
+                span.set_status(Status(StatusCode.ERROR, "boom"))
+    return collector.spans
+
+
+def test_span_to_dict_matches_to_json() -> None:
+    for span in make_spans(3):
+        assert span_to_dict(span) == json.loads(span.to_json())
+
+
+def test_export_writes_log_entries_in_one_batch() -> None:
+    logging_client = FakeLoggingClient()
+    trace_client = FakeTraceClient()
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        client=trace_client,
+        logging_client=cast(Any, logging_client),
+        storage_client=FakeStorageClient(),
+    )
+
+    exporter.export(make_spans(5))
+    assert exporter.force_flush()
+
+    assert trace_client.calls == 1
+    assert [len(batch) for batch in logging_client.fake_logger.commits] == [5]
+    entry = logging_client.fake_logger.commits[0][0]
+    assert entry["trace"].startswith("projects/test-project/traces/")
+    exporter.shutdown()
+
+
+def test_large_attributes_are_offloaded_without_blocking(tmp_path: Path) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    exporter = make_exporter(blob_store=store, content_addressed_bytes=None)
+    attributes = {"gcp.vertex.agent.llm_request": "x" * 300_000, "small": "kept"}
+
+    span_dict = exporter._process_large_attributes(
+        span_dict={"attributes": attributes}, span_id="abc"
+    )
+    assert exporter.force_flush()
+
+    retained = span_dict["attributes"]
+    assert retained["small"] == "kept"
+    assert "gcp.vertex.agent.llm_request" not in retained
+    assert retained["uri_payload"] == store.uri("spans/abc.json")
+    assert json.loads(store.read("spans/abc.json")) == attributes
+    exporter.shutdown()
+
+
+def test_repeated_attribute_values_are_stored_once(tmp_path: Path) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    exporter = make_exporter(blob_store=store)
+    instructions = "You are a Citi Bike analyst. " * 1_000
+
+    references = []
+    for span_id in ("a", "b", "c"):
+        span_dict = exporter._process_large_attributes(
+            span_dict={"attributes": {"llm_request": instructions, "n": span_id}},
+            span_id=span_id,
+        )
+        references.append(span_dict["attributes"]["llm_request"])
+        assert span_dict["attributes"]["n"] == span_id
+        assert "uri_payload" not in span_dict["attributes"]
+    assert exporter.force_flush()
+
+    assert references[0] == references[1] == references[2]
+    blobs = list((tmp_path / "blobs" / "sha256").iterdir())
+    assert len(blobs) == 1
+    assert json.loads(store.read(f"blobs/sha256/{blobs[0].name}")) == instructions
+    assert references[0]["uri"] == store.uri(f"blobs/sha256/{blobs[0].name}")
+    assert exporter.offloader.content_uploads == 1
+    assert exporter.offloader.content_hits == 2
+    exporter.shutdown()
+
+
+def test_large_attributes_are_sampled_separately(tmp_path: Path) -> None:
+    logging_client = FakeLoggingClient()
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        client=FakeTraceClient(),
+        logging_client=cast(Any, logging_client),
+        storage_client=FakeStorageClient(),
+        blob_store=LocalBlobStore(str(tmp_path)),
+        large_attribute_sample_ratio=0.0,
+    )
+    collector = CollectingExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(collector))
+    with provider.get_tracer(__name__).start_as_current_span("call_llm") as span:
+        span.set_attribute("gcp.vertex.agent.llm_request", "x" * 10_000)
+
+    exporter.export(collector.spans)
+    assert exporter.force_flush()
+
+    entry = logging_client.fake_logger.commits[0][0]
+    assert entry["attributes"]["gcp.vertex.agent.llm_request"] == {
+        "sampled_out": True,
+        "bytes": 10_000,
+    }
+    exporter.shutdown()